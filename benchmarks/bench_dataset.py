@@ -0,0 +1,64 @@
+"""
+Samples per second of CarlaStereoEventsDataset on a synthetic dataset (random access, as a shuffled DataLoader).
+
+python -m benchmarks.bench_dataset [--num_workers 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data_generator.data_loading.dataset import CarlaStereoEventsDataset
+from benchmarks.common import make_synthetic_sequence
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--height', default=480, type=int)
+    arg_parser.add_argument('--width', default=640, type=int)
+    arg_parser.add_argument('--events_per_ms', default=200, type=int)
+    arg_parser.add_argument('--number_of_sequences', default=4, type=int)
+    arg_parser.add_argument('--number_of_frames', default=100, type=int)
+    arg_parser.add_argument('--delta_t_ms', default=50, type=int)
+    arg_parser.add_argument('--number_of_samples', default=400, type=int)
+    arg_parser.add_argument('--num_workers', default=0, type=int, help='DataLoader workers (needs torch)')
+    return arg_parser.parse_args()
+
+
+def make_synthetic_dataset(dataset_path, args):
+    for sequence_id in range(args.number_of_sequences):
+        make_synthetic_sequence(os.path.join(dataset_path, f"{sequence_id:04}"), args.number_of_frames,
+                                args.height, args.width, args.events_per_ms, seed=sequence_id)
+
+
+def samples_per_second(dataset, number_of_samples, num_workers):
+    indices = np.random.default_rng(0).integers(0, len(dataset), number_of_samples)
+    start = time.perf_counter()
+    if num_workers == 0:
+        for index in indices:
+            dataset[int(index)]
+    else:
+        import torch
+        loader = torch.utils.data.DataLoader(torch.utils.data.Subset(dataset, indices.tolist()), batch_size=1,
+                                             num_workers=num_workers, collate_fn=lambda batch: batch)
+        for _ in loader:
+            pass
+    return number_of_samples / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    with tempfile.TemporaryDirectory() as my_dataset_path:
+        make_synthetic_dataset(my_dataset_path, my_args)
+        for my_name, my_configuration in [("raw events", None),
+                                          ("histogram", {"representation_type": "histogram",
+                                                         "height": my_args.height, "width": my_args.width,
+                                                         "normalize": False})]:
+            for my_cache_size in [0, 1024]:
+                my_dataset = CarlaStereoEventsDataset(my_dataset_path, delta_t_ms=my_args.delta_t_ms,
+                                                      representation_configuration=my_configuration,
+                                                      disparity_cache_size=my_cache_size)
+                my_speed = samples_per_second(my_dataset, my_args.number_of_samples, my_args.num_workers)
+                print(f"{my_name} [disparity cache {my_cache_size}]: {my_speed:.1f} samples/s")
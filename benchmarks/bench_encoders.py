@@ -0,0 +1,116 @@
+"""
+Cost (ms per million pixels, events or points) and output size (bytes per pixel, event or point) of the encoders of
+the sensors of sensors.json at their resolution, written in a JSON that plan_capacity.py uses.
+
+python -m benchmarks.bench_encoders [--output_path benchmarks/encoder_costs.json]
+"""
+import argparse
+import io
+import json
+import os
+import pathlib
+import platform
+import tempfile
+from datetime import datetime
+
+import h5py
+import numpy as np
+
+from data_generator.data_creation.call_back import Callbacks
+from data_generator.data_creation.sensors import SENSOR_REGISTRY
+from data_generator.capacity import DEFAULT_ENCODER_COSTS_PATH, EVENTS_H5_ENCODER
+from benchmarks.common import best_time, make_fake_sensor_data
+
+REPO_PATH = pathlib.Path(__file__).parent.parent.resolve()
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sensors_json', default=os.path.join(REPO_PATH, "sensors.json"), type=str)
+    arg_parser.add_argument('--output_path', default=DEFAULT_ENCODER_COSTS_PATH, type=str)
+    arg_parser.add_argument('--events_per_pixel', default=0.05, type=float,
+                            help='DVS events per pixel in a frame of the synthetic data')
+    arg_parser.add_argument('--repeat', default=5, type=int)
+    return arg_parser.parse_args()
+
+
+def measure_file_callback(callback_name, data, repeat):
+    """
+    :return: ms and bytes of a callback that writes a file for each frame
+    """
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        a_time = best_time(lambda: getattr(Callbacks, callback_name)(data, tmp_folder), repeat=repeat)
+        number_of_bytes = sum(os.path.getsize(os.path.join(tmp_folder, file_name))
+                              for file_name in os.listdir(tmp_folder))
+    return a_time * 1000, number_of_bytes
+
+
+def measure_events(callback_name, data, repeat):
+    """
+    :return: ms of the callback (in the Carla's thread) and ms and bytes of the gzip h5 written by
+             EventSensor.finalize
+    """
+    callback_time = best_time(lambda: getattr(Callbacks, callback_name)(data, {"x": {}, "y": {}, "t": {}, "p": {}},
+                                                                         []), repeat=repeat)
+
+    # The same dtypes of the arrays made by the callback
+    arrays = {"x": np.array(data.to_array_x()), "y": np.array(data.to_array_y()), "t": np.array(data.to_array_t()),
+              "p": np.array(data.to_array_pol())}
+
+    def write_h5():
+        a_buffer = io.BytesIO()
+        with h5py.File(a_buffer, "w") as f:
+            for array_name in arrays:
+                f.create_dataset(array_name, data=arrays[array_name], compression="gzip")
+        return a_buffer.getbuffer().nbytes
+
+    h5_time = best_time(write_h5, repeat=repeat)
+    return callback_time * 1000, h5_time * 1000, write_h5()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    with open(my_args.sensors_json, "r") as file:
+        my_sensors_json = json.load(file)
+
+    # The sensors of sensors.json at their resolution, then all the other registered ones at a default one
+    my_sensor_cfgs = list(my_sensors_json["sensors"])
+    for my_blue_print_name in SENSOR_REGISTRY:
+        my_sensor_cfgs.append({"blue_print_name": my_blue_print_name,
+                               "attributes": {"image_size_x": 640, "image_size_y": 480, "sensor_tick": 0.1}})
+
+    my_encoders = {}
+    for my_sensor_cfg in my_sensor_cfgs:
+        my_callback_name = my_sensor_cfg.get("callback",
+                                             SENSOR_REGISTRY.get(my_sensor_cfg["blue_print_name"], (None, None))[1])
+        if my_callback_name is None or my_callback_name in my_encoders:
+            continue
+        my_data = make_fake_sensor_data(my_sensor_cfg, events_per_pixel=my_args.events_per_pixel)
+        if my_data.events is not None:
+            my_number_of_events = my_data.events["t"].size
+            my_callback_ms, my_h5_ms, my_h5_bytes = measure_events(my_callback_name, my_data, my_args.repeat)
+            my_encoders[my_callback_name] = {"unit": "event", "bytes_per_unit": 0.,
+                                             "ms_per_million_units": my_callback_ms / my_number_of_events * 1e6}
+            my_encoders[EVENTS_H5_ENCODER] = {"unit": "event", "bytes_per_unit": my_h5_bytes / my_number_of_events,
+                                              "ms_per_million_units": my_h5_ms / my_number_of_events * 1e6}
+        elif my_data.width is None:
+            my_number_of_points = len(my_data.raw_data) // 16
+            with tempfile.TemporaryFile() as my_points_file:
+                my_ms = best_time(lambda: getattr(Callbacks, my_callback_name)(my_data, my_points_file),
+                                  repeat=my_args.repeat) * 1000
+            my_encoders[my_callback_name] = {"unit": "point", "bytes_per_unit": 16.,
+                                             "ms_per_million_units": my_ms / my_number_of_points * 1e6}
+        else:
+            my_number_of_pixels = my_data.width * my_data.height
+            my_ms, my_bytes = measure_file_callback(my_callback_name, my_data, my_args.repeat)
+            my_encoders[my_callback_name] = {"unit": "pixel", "bytes_per_unit": my_bytes / my_number_of_pixels,
+                                             "ms_per_million_units": my_ms / my_number_of_pixels * 1e6}
+
+    for my_name in my_encoders:
+        print(f"{my_name}: {my_encoders[my_name]['ms_per_million_units']:.1f} ms per million "
+              f"{my_encoders[my_name]['unit']}s, {my_encoders[my_name]['bytes_per_unit']:.2f} bytes per "
+              f"{my_encoders[my_name]['unit']}")
+    with open(my_args.output_path, "w", encoding="utf-8") as file:
+        json.dump({"machine": platform.node(), "cpu_count": os.cpu_count(),
+                   "date": datetime.now().isoformat(timespec="seconds"), "encoders": my_encoders}, file, indent=4)
+    print(f"Saved in {my_args.output_path}")
@@ -0,0 +1,70 @@
+"""
+Sweeps per second of the LiDAR BEV splat (np.bincount, one sweep and batched) against the np.histogramdd one.
+
+python -m benchmarks.bench_lidar_bev [--points_per_sweep 100000]
+"""
+import argparse
+
+import numpy as np
+
+import data_generator.config as config
+from data_generator.utils import lidar_to_histogram_features, lidar_batch_to_histogram_features
+from benchmarks.common import best_time
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--points_per_sweep', default=100000, type=int)
+    arg_parser.add_argument('--batch_size', default=16, type=int)
+    return arg_parser.parse_args()
+
+
+def histogramdd_lidar_to_histogram_features(lidar):
+    """
+    The previous implementation (np.histogramdd), used as reference.
+    """
+    MAX_HIST_POINTS = 5
+
+    def splat_points(point_cloud):
+        xbins = np.linspace(-config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_IMAGE_W + 1)
+        ybins = np.linspace(-config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_IMAGE_H + 1)
+        hist = np.histogramdd(point_cloud[:, :2], bins=(xbins, ybins))[0]
+        hist[hist > MAX_HIST_POINTS] = MAX_HIST_POINTS
+        overhead_splat = hist / MAX_HIST_POINTS
+        return overhead_splat.T
+
+    lidar = lidar[lidar[..., 2] < -2.5 + config.MAXIMUM_LIDAR_HEIGHT]
+    lidar = lidar[lidar[..., 2] > -2.5 + config.MINIMUM_LIDAR_HEIGHT]
+    features = splat_points(lidar)
+    features = np.stack([features], axis=-1)
+    features = np.transpose(features, (2, 0, 1))
+    features *= 255
+    features = features.astype(np.uint8)
+    return features
+
+
+def make_synthetic_sweep(number_of_points: int, rng):
+    """
+    Points of a 64 channels LiDAR like sweep (float32 x, y, z), many of them out of the BEV square.
+    """
+    distance = rng.exponential(15, number_of_points)
+    angle = rng.uniform(-np.pi, np.pi, number_of_points)
+    z = rng.uniform(-3, 2, number_of_points)
+    return np.stack([distance * np.cos(angle), distance * np.sin(angle), z], axis=1).astype(np.float32)
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    rng = np.random.default_rng(0)
+    my_sweeps = [make_synthetic_sweep(my_args.points_per_sweep, rng) for _ in range(my_args.batch_size)]
+    for a_sweep in my_sweeps:
+        assert np.array_equal(lidar_to_histogram_features(a_sweep), histogramdd_lidar_to_histogram_features(a_sweep))
+    assert np.array_equal(lidar_batch_to_histogram_features(my_sweeps)[:, 0],
+                          np.stack([histogramdd_lidar_to_histogram_features(a_sweep)[0] for a_sweep in my_sweeps]))
+
+    my_reference_time = best_time(lambda: [histogramdd_lidar_to_histogram_features(s) for s in my_sweeps])
+    my_time = best_time(lambda: [lidar_to_histogram_features(s) for s in my_sweeps])
+    my_batch_time = best_time(lambda: lidar_batch_to_histogram_features(my_sweeps))
+    for my_name, my_a_time in [("np.histogramdd", my_reference_time), ("np.bincount", my_time),
+                               ("np.bincount batched", my_batch_time)]:
+        print(f"{my_name}: {my_args.batch_size / my_a_time:.1f} sweeps/s [x{my_reference_time / my_a_time:.1f}]")
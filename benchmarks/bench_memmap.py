@@ -0,0 +1,46 @@
+"""
+Samples per second of CarlaStereoEventsDataset on the same synthetic dataset read from the gzip h5 sequence folders
+and from their uncompressed memmap export.
+
+python -m benchmarks.bench_memmap [--num_workers 4]
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from data_generator.data_loading.dataset import CarlaStereoEventsDataset
+from data_generator.data_loading.sequence_readers import get_sequence_locations, open_sequence, \
+    export_sequence_to_memmap, MEMMAP_INDEX_FILE_NAME
+from benchmarks.bench_dataset import make_synthetic_dataset, samples_per_second
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--height', default=480, type=int)
+    arg_parser.add_argument('--width', default=640, type=int)
+    arg_parser.add_argument('--events_per_ms', default=200, type=int)
+    arg_parser.add_argument('--number_of_sequences', default=4, type=int)
+    arg_parser.add_argument('--number_of_frames', default=100, type=int)
+    arg_parser.add_argument('--delta_t_ms', default=50, type=int)
+    arg_parser.add_argument('--number_of_samples', default=400, type=int)
+    arg_parser.add_argument('--num_workers', default=0, type=int, help='DataLoader workers (needs torch)')
+    return arg_parser.parse_args()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    with tempfile.TemporaryDirectory() as my_dataset_path, tempfile.TemporaryDirectory() as my_memmap_path:
+        make_synthetic_dataset(my_dataset_path, my_args)
+        for a_location in get_sequence_locations(my_dataset_path):
+            a_sequence = open_sequence(a_location)
+            export_sequence_to_memmap(a_sequence, os.path.join(my_memmap_path, a_location.name))
+            a_sequence.close()
+        my_index = {"sequences": sorted(os.listdir(my_memmap_path))}
+        with open(os.path.join(my_memmap_path, MEMMAP_INDEX_FILE_NAME), "w") as index_file:
+            json.dump(my_index, index_file)
+        for my_name, my_path in [("gzip h5", my_dataset_path), ("memmap", my_memmap_path)]:
+            # No disparity cache: every sample reads its events and its disparity frame
+            my_dataset = CarlaStereoEventsDataset(my_path, delta_t_ms=my_args.delta_t_ms, disparity_cache_size=0)
+            my_speed = samples_per_second(my_dataset, my_args.number_of_samples, my_args.num_workers)
+            print(f"{my_name}: {my_speed:.1f} samples/s")
@@ -0,0 +1,69 @@
+"""
+Windows per second of the events representations: the batched numpy/torch scatter against one convert per window.
+
+python -m benchmarks.bench_representations [--batch_size 32] [--delta_t_ms 50]
+"""
+import argparse
+
+import numpy as np
+
+from data_generator.data_creation.events_representations import Histogram, VoxelGrid
+from benchmarks.common import best_time, make_synthetic_events
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--height', default=480, type=int)
+    arg_parser.add_argument('--width', default=640, type=int)
+    arg_parser.add_argument('--events_per_ms', default=200, type=int)
+    arg_parser.add_argument('--delta_t_ms', default=50, type=int)
+    arg_parser.add_argument('--batch_size', default=32, type=int)
+    arg_parser.add_argument('--voxel_grid_channels', default=5, type=int)
+    return arg_parser.parse_args()
+
+
+def get_windows(ms_to_idx, delta_t_ms, batch_size):
+    # One window every 10 ms (as the depth frames), each one delta_t_ms long
+    ends_ms = np.arange(delta_t_ms, delta_t_ms + 10 * batch_size, 10)
+    return ms_to_idx[ends_ms - delta_t_ms], ms_to_idx[ends_ms]
+
+
+def benchmark_representation(name, representation, events, window_starts, window_ends):
+    results = {}
+    batch_size = len(window_starts)
+    for backend in ["numpy", "torch"]:
+        try:
+            seconds = best_time(lambda: representation.convert_batch(events["x"], events["y"], events["p"],
+                                                                     events["t"], window_starts, window_ends,
+                                                                     backend=backend))
+        except ImportError:
+            print(f"{name} [{backend}]: skipped (not installed)")
+            continue
+        results[f"{name}_batch_{backend}"] = batch_size / seconds
+    try:
+        import torch
+        tensors = {key: torch.from_numpy(events[key].astype(np.float32)) for key in events}
+
+        def one_window_at_a_time():
+            for start, end in zip(window_starts, window_ends):
+                representation.convert(tensors["x"][start:end], tensors["y"][start:end],
+                                       tensors["p"][start:end], tensors["t"][start:end])
+        results[f"{name}_loop_torch"] = batch_size / best_time(one_window_at_a_time, repeat=3)
+    except ImportError:
+        print(f"{name} [loop torch]: skipped (not installed)")
+    return results
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    my_events, my_ms_to_idx = make_synthetic_events(my_args.events_per_ms, my_args.delta_t_ms + 10 * my_args.batch_size,
+                                                    my_args.height, my_args.width)
+    my_window_starts, my_window_ends = get_windows(my_ms_to_idx, my_args.delta_t_ms, my_args.batch_size)
+    my_results = benchmark_representation("histogram", Histogram(my_args.height, my_args.width, normalize=False),
+                                          my_events, my_window_starts, my_window_ends)
+    my_results.update(benchmark_representation("voxel_grid",
+                                               VoxelGrid(my_args.voxel_grid_channels, my_args.height, my_args.width,
+                                                         normalize=True),
+                                               my_events, my_window_starts, my_window_ends))
+    for my_name, windows_per_second in my_results.items():
+        print(f"{my_name}: {windows_per_second:.1f} windows/s")
@@ -0,0 +1,44 @@
+"""
+Frames per second of the disparity and events colorizations, in a preallocated buffer and in a new array each frame.
+
+python -m benchmarks.bench_visualizations [--height 480 --width 640]
+"""
+import argparse
+
+import numpy as np
+
+from data_generator.data_creation.disparity_visualization import disp_to_rgb
+from data_generator.data_creation.events_visualizations import histogram_stereo_to_rgb, voxel_grid_stereo_to_rgb
+from benchmarks.common import best_time
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--height', default=480, type=int)
+    arg_parser.add_argument('--width', default=640, type=int)
+    arg_parser.add_argument('--channels', default=5, type=int, help='Voxel grid channels')
+    arg_parser.add_argument('--number_of_frames', default=16, type=int)
+    return arg_parser.parse_args()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    rng = np.random.default_rng(0)
+    n, h, w = my_args.number_of_frames, my_args.height, my_args.width
+    my_disparities = rng.integers(0, 80, (n, h, w)).astype(np.uint8)
+    my_histograms = rng.poisson(0.3, (2, n, 2, h, w)).astype(np.float32)
+    my_voxel_grids = rng.normal(0, 0.3, (2, n, my_args.channels, h, w)).astype(np.float32)
+    my_mono_out = np.empty((h, w, 3), dtype=np.uint8)
+    my_stereo_out = np.empty((h, 2 * w, 3), dtype=np.uint8)
+
+    my_cases = [
+        ("disparity", lambda: [disp_to_rgb(d, my_mono_out) for d in my_disparities],
+         lambda: [disp_to_rgb(d) for d in my_disparities]),
+        ("histogram stereo", lambda: [histogram_stereo_to_rgb(l, r, my_stereo_out) for l, r in zip(*my_histograms)],
+         lambda: [histogram_stereo_to_rgb(l, r) for l, r in zip(*my_histograms)]),
+        ("voxel grid stereo", lambda: [voxel_grid_stereo_to_rgb(l, r, my_stereo_out) for l, r in zip(*my_voxel_grids)],
+         lambda: [voxel_grid_stereo_to_rgb(l, r) for l, r in zip(*my_voxel_grids)]),
+    ]
+    for my_name, my_in_a_buffer, my_in_a_new_array in my_cases:
+        print(f"{my_name}: {n / best_time(my_in_a_buffer):.1f} frames/s (preallocated buffer),"
+              f" {n / best_time(my_in_a_new_array):.1f} frames/s (new array)")
@@ -0,0 +1,195 @@
+import time
+
+import numpy as np
+
+
+def best_time(function, repeat: int = 5, warm_up: int = 1, setup=None):
+    """
+    :param setup: called (not measured) before each call of function, for the functions that consume their input
+    :return: the best wall clock time (s) of repeat calls of function (after warm_up not measured calls)
+    """
+    for _ in range(warm_up):
+        if setup is not None:
+            setup()
+        function()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def make_synthetic_events(events_per_ms: int, duration_ms: int, height: int, width: int, seed: int = 0):
+    """
+    A synthetic events stream with the same dtypes of the Carla's DVS (t in ns, sorted) and its ms_to_idx.
+    """
+    rng = np.random.default_rng(seed)
+    number_of_events = events_per_ms * duration_ms
+    events = {
+        "x": rng.integers(0, width, number_of_events).astype(np.uint16),
+        "y": rng.integers(0, height, number_of_events).astype(np.uint16),
+        "t": np.sort(rng.integers(0, duration_ms * 1000000, number_of_events)).astype(np.int64),
+        "p": rng.integers(0, 2, number_of_events).astype(bool),
+    }
+    ms_to_idx = np.searchsorted(events["t"], np.arange(duration_ms + 1, dtype=np.int64) * 1000000)
+    return events, ms_to_idx
+
+
+def make_synthetic_sequence(sequence_folder_path: str, number_of_frames: int, height: int, width: int,
+                            events_per_ms: int, frame_period_ms: int = 10, seed: int = 0):
+    """
+    Writes a sequence folder with the same layout of take_data (disparity/NNNN.png, left.h5, right.h5,
+    timestamps.json) filled with random data.
+    """
+    import os
+    import json
+    import cv2
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    duration_ms = (number_of_frames + 1) * frame_period_ms
+    os.makedirs(os.path.join(sequence_folder_path, "disparity"), exist_ok=True)
+    for side_seed, side in enumerate(["left", "right"]):
+        events, ms_to_idx = make_synthetic_events(events_per_ms, duration_ms, height, width, seed=seed + side_seed)
+        with h5py.File(os.path.join(sequence_folder_path, f"{side}.h5"), "w") as f:
+            for array_name in events:
+                f.create_dataset(array_name, data=events[array_name], compression="gzip")
+            f.create_dataset("ms_to_idx", data=ms_to_idx)
+    for frame in range(number_of_frames):
+        disparity = rng.integers(0, 80, (height, width)).astype(np.uint8)
+        cv2.imwrite(os.path.join(sequence_folder_path, "disparity", f"{frame:04d}.png"), disparity)
+    timestamps = [(frame + 1) * frame_period_ms * 1000000 for frame in range(number_of_frames)]
+    with open(os.path.join(sequence_folder_path, "timestamps.json"), "w") as timestamps_file:
+        json.dump(timestamps, timestamps_file)
+
+
+class FakeSensorData:
+    """
+    The fields of a Carla's sensor data that the callbacks use, raw_data is an uint8 array as in SensorDataCopy (the
+    DVS ones return python lists, as Carla does).
+    """
+
+    def __init__(self, frame: int, raw_data: bytes = b"", width: int = None, height: int = None, fov: float = 90.,
+                 events: dict = None):
+        self.frame = frame
+        self.timestamp = frame * 0.01
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.raw_data = np.frombuffer(raw_data, dtype=np.uint8).copy()
+        self.events = events
+
+    def to_array_x(self):
+        return self.events["x"].tolist()
+
+    def to_array_y(self):
+        return self.events["y"].tolist()
+
+    def to_array_t(self):
+        return self.events["t"].tolist()
+
+    def to_array_pol(self):
+        return self.events["p"].tolist()
+
+
+def make_synthetic_image(height: int, width: int, channels: int, seed: int = 0):
+    """
+    Smooth gradients plus a little noise, so that it compresses like a rendered image (random bytes would not).
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = (np.sin(xx / 37.) + np.cos(yy / 23.)) * 60 + 128
+    image = base[..., None] + rng.normal(0, 4, (height, width, channels))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def make_fake_sensor_data(sensor_cfg: dict, frame: int = 0, events_per_pixel: float = 0.05, seed: int = 0):
+    """
+    :return: a FakeSensorData like the one that the sensor of a sensors.json entry receives
+    """
+    rng = np.random.default_rng(seed)
+    attributes = sensor_cfg["attributes"]
+    blue_print_name = sensor_cfg["blue_print_name"]
+    if blue_print_name == "sensor.lidar.ray_cast":
+        number_of_points = int(attributes.get("points_per_second", 56000) * attributes["sensor_tick"])
+        points = rng.normal(0, 10, (number_of_points, 4)).astype(np.float32)
+        return FakeSensorData(frame, raw_data=points.tobytes())
+    width, height = int(attributes["image_size_x"]), int(attributes["image_size_y"])
+    fov = float(attributes.get("fov", 90.))
+    if blue_print_name == "sensor.camera.dvs":
+        number_of_events = int(events_per_pixel * width * height)
+        period_ns = int(attributes["sensor_tick"] * 1e9)
+        events = {
+            "x": rng.integers(0, width, number_of_events).astype(np.uint16),
+            "y": rng.integers(0, height, number_of_events).astype(np.uint16),
+            "t": np.sort(rng.integers(frame * period_ns, (frame + 1) * period_ns, number_of_events)).astype(np.int64),
+            "p": rng.integers(0, 2, number_of_events).astype(bool),
+        }
+        return FakeSensorData(frame, width=width, height=height, fov=fov, events=events)
+    if blue_print_name == "sensor.camera.optical_flow":
+        flow = make_synthetic_image(height, width, 2, seed).astype(np.float32) / 64 - 2
+        return FakeSensorData(frame, raw_data=flow.tobytes(), width=width, height=height, fov=fov)
+    if blue_print_name == "sensor.camera.depth":
+        # Carla encodes the depth (m / 1000 * (256 ** 3 - 1)) in the R, G and B bytes
+        depth = make_synthetic_image(height, width, 1, seed)[:, :, 0].astype(np.float64) / 2 + 1
+        value = (depth / 1000 * (256 ** 3 - 1)).astype(np.uint32)
+        bgra = np.stack([value >> 16, (value >> 8) & 255, value & 255, np.full_like(value, 255)], axis=-1)
+        return FakeSensorData(frame, raw_data=bgra.astype(np.uint8).tobytes(), width=width, height=height, fov=fov)
+    return FakeSensorData(frame, raw_data=make_synthetic_image(height, width, 4, seed).tobytes(), width=width,
+                          height=height, fov=fov)
+
+
+class _FakeBluePrint:
+    def set_attribute(self, name, value):
+        pass
+
+
+class _FakeBluePrintLibrary:
+    def find(self, blue_print_name):
+        return _FakeBluePrint()
+
+
+class _FakeActor:
+    def listen(self, callback):
+        self.callback = callback
+
+    def stop(self):
+        pass
+
+    def destroy(self):
+        pass
+
+
+class _FakeWorld:
+    def get_blueprint_library(self):
+        return _FakeBluePrintLibrary()
+
+    def spawn_actor(self, blue_print, transformation, attach_to=None):
+        return _FakeActor()
+
+
+class _FakeCarla:
+    @staticmethod
+    def Transform(location, rotation):
+        return None
+
+    @staticmethod
+    def Location(x, y, z):
+        return None
+
+    @staticmethod
+    def Rotation(pitch, roll, yaw):
+        return None
+
+
+def make_fake_capture_context(sensors_json: dict, where_to_save: str, frames_to_take: int = None):
+    """
+    A CaptureContext without Carla, so that the real sensors classes can be created (their actors do nothing).
+    """
+    from data_generator.data_creation.sensors import CaptureContext
+
+    frames_to_take = sensors_json["number_of_frames_to_take"] if frames_to_take is None else frames_to_take
+    return CaptureContext(_FakeCarla, _FakeWorld(), None, sensors_json, where_to_save, frames_to_take, 1)
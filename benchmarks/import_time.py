@@ -0,0 +1,64 @@
+"""
+Measures the cold start of the capture process (a fresh interpreter that imports take_data) and fails if it is over
+the budget or if a heavy module that the capture doesn't need gets imported.
+
+python -m benchmarks.import_time [--budget 1.5] [--repeat 5]
+"""
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+CAPTURE_MODULE = "data_generator.data_creation.take_data"
+FORBIDDEN_MODULES = ["torch", "matplotlib", "hdf5plugin"]
+
+IMPORT_SCRIPT = f"""
+import sys
+import {CAPTURE_MODULE}
+print(",".join(module for module in {FORBIDDEN_MODULES} if module in sys.modules))
+"""
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        '--budget',
+        default=1.5,
+        help='Maximum cold start time in seconds (default: 1.5)',
+        type=float
+    )
+    arg_parser.add_argument(
+        '--repeat',
+        default=5,
+        help='How many fresh interpreters to start, the best time is taken (default: 5)',
+        type=int
+    )
+    return arg_parser.parse_args()
+
+
+def measure_cold_start(repeat: int):
+    repo_path = pathlib.Path(__file__).parent.parent.resolve()
+    times = []
+    imported_forbidden_modules = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=repo_path, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        times.append(time.perf_counter() - start)
+        imported_forbidden_modules = output.strip()
+    return min(times), imported_forbidden_modules
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    cold_start, forbidden = measure_cold_start(my_args.repeat)
+    print(f"Capture process cold start: {cold_start:.3f} s (budget {my_args.budget:.3f} s)")
+    if len(forbidden) > 0:
+        print(f"FAILED: the capture process imports {forbidden}!")
+        sys.exit(1)
+    if cold_start > my_args.budget:
+        print(f"FAILED: over budget by {cold_start - my_args.budget:.3f} s!")
+        sys.exit(1)
+    print("OK")
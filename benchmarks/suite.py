@@ -0,0 +1,277 @@
+"""
+Benchmarks of the capture and post-processing hot paths on synthetic data (no Carla), sized from sensors.json.
+"run" writes the results in a JSON, "compare" flags the regressions between two of them (e.g. of two commits).
+
+python -m benchmarks.suite run [--output_path bench_results.json] [--only callbacks]
+python -m benchmarks.suite compare old_results.json new_results.json [--threshold 0.1]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+import cv2
+import numpy as np
+from tabulate import tabulate
+
+from data_generator import config
+from data_generator.utils import lidar_to_histogram_features, color_error_string, color_info_string, \
+    color_info_success
+from data_generator.data_creation.call_back import Callbacks
+from data_generator.data_creation.sensors import create_sensor
+from data_generator.data_creation.disparity_visualization import disp_to_rgb
+from data_generator.data_creation.events_representations import Histogram
+from benchmarks.common import best_time, make_fake_sensor_data, make_fake_capture_context, make_synthetic_image
+
+REPO_PATH = pathlib.Path(__file__).parent.parent.resolve()
+# Carla's frame of the first frame of the synthetic sequences
+START_FRAME = 100
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub_parsers = arg_parser.add_subparsers(dest="command", required=True)
+    run_parser = sub_parsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument('--sensors_json', default=os.path.join(REPO_PATH, "sensors.json"), type=str)
+    run_parser.add_argument('--output_path', default="bench_results.json", type=str)
+    run_parser.add_argument('--events_per_pixel', default=config.CAPACITY_DVS_EVENTS_PER_PIXEL_PER_FRAME, type=float,
+                            help='DVS events per pixel in a frame of the synthetic data')
+    run_parser.add_argument('--frames_to_take', default=None, type=int,
+                            help='Frames of the synthetic sequences (default: number_of_frames_to_take)')
+    run_parser.add_argument('--delta_t_ms', default=50, type=int, help='Window of Histogram.convert')
+    run_parser.add_argument('--repeat', default=5, type=int)
+    run_parser.add_argument('--only', default=None, type=str, help='Run only the benchmarks whose name starts so')
+    compare_parser = sub_parsers.add_parser("compare", help="Compare two results")
+    compare_parser.add_argument('old_results_path', type=str)
+    compare_parser.add_argument('new_results_path', type=str)
+    compare_parser.add_argument('--threshold', default=0.1, type=float,
+                                help='Relative slow down that is a regression (default: 0.1 -> 10%%)')
+    return arg_parser.parse_args()
+
+
+def quiet(function):
+    """
+    The sensors print a lot, we do not want it in the measures (nor in the output).
+    """
+    def quiet_function():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return quiet_function
+
+
+def get_sensor_cfg(sensors_json, blue_print_name):
+    for sensor_cfg in sensors_json["sensors"]:
+        if sensor_cfg["blue_print_name"] == blue_print_name:
+            return sensor_cfg
+    return None
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_callbacks(sensors_json, args, tmp_folder):
+    """
+    :return: name -> (seconds of a call, items of a call, unit)
+    """
+    results = {}
+    for name, blue_print_name in [("depth", "sensor.camera.depth"), ("rgb", "sensor.camera.rgb")]:
+        sensor_cfg = get_sensor_cfg(sensors_json, blue_print_name)
+        if sensor_cfg is None:
+            continue
+        data = make_fake_sensor_data(sensor_cfg)
+        callback = getattr(Callbacks, f"{name}_callback")
+        results[f"callbacks.{name}_callback"] = (best_time(lambda: callback(data, tmp_folder), repeat=args.repeat), 1,
+                                                 "frames")
+    sensor_cfg = get_sensor_cfg(sensors_json, "sensor.camera.dvs")
+    if sensor_cfg is not None:
+        data = make_fake_sensor_data(sensor_cfg, events_per_pixel=args.events_per_pixel)
+        results["callbacks.event_callback"] = (
+            best_time(lambda: Callbacks.event_callback(data, {"x": {}, "y": {}, "t": {}, "p": {}}, []),
+                      repeat=args.repeat), 1, "frames")
+    return results
+
+
+def benchmark_event_sensor(sensors_json, args, tmp_folder):
+    sensor_cfg = get_sensor_cfg(sensors_json, "sensor.camera.dvs")
+    if sensor_cfg is None:
+        return {}
+    sensor_cfg = dict(sensor_cfg)
+    sensor_cfg.pop("online_representation", None)
+    context = make_fake_capture_context(sensors_json, tmp_folder, args.frames_to_take)
+    sensor = quiet(lambda: create_sensor(sensor_cfg, context))()
+    sensor.start_frame = START_FRAME
+    # The frames that check_data wants (5 more before and after the sequence)
+    for frame in range(START_FRAME - 5, START_FRAME + sensor.frames_to_take + 5):
+        sensor.callback(make_fake_sensor_data(sensor_cfg, frame=frame, events_per_pixel=args.events_per_pixel,
+                                              seed=frame))
+    check_data = quiet(sensor.check_data)
+    number_of_frames = sensor.frames_to_take + 10
+    results = {"event_sensor.check_data": (best_time(check_data, repeat=args.repeat), number_of_frames, "frames")}
+
+    starting_time = check_data()
+    t = sensor.data_to_save["t"] - starting_time
+    total_num_of_ms = int(sensor.frames_to_take / (1 / context.carla_tick) * 1000) + 70
+    results["event_sensor.create_ms_to_index"] = (
+        best_time(quiet(lambda: sensor.create_ms_to_index(t, total_num_of_ms)), repeat=args.repeat), t.size, "events")
+    # finalize normalizes the timestamps in place, so each call needs a new check_data
+    results["event_sensor.finalize"] = (best_time(quiet(lambda: sensor.finalize(starting_time)), repeat=args.repeat,
+                                                  setup=check_data), t.size, "events")
+    sensor.shutdown()
+    return results
+
+
+def benchmark_png_sensor(sensors_json, args, tmp_folder):
+    sensor_cfg = get_sensor_cfg(sensors_json, "sensor.camera.depth")
+    if sensor_cfg is None:
+        return {}
+    context = make_fake_capture_context(sensors_json, tmp_folder, args.frames_to_take)
+    sensor = quiet(lambda: create_sensor(sensor_cfg, context))()
+    sensor.start_frame = START_FRAME
+    sensor.consecutive_frames = sensor.frames_to_take
+    saved_frames = list(sensor.get_saved_frames())
+    for frame in saved_frames:
+        sensor.timestamp_dict[frame] = int(frame * context.carla_tick * 10 ** 9)
+    png_bytes = cv2.imencode(".png", make_synthetic_image(int(sensor_cfg["attributes"]["image_size_y"]),
+                                                         int(sensor_cfg["attributes"]["image_size_x"]), 1))[1].tobytes()
+
+    def setup():
+        # check_data moves the frames out of the raw_ folder and removes it
+        shutil.rmtree(sensor.data_folder_path)
+        os.mkdir(sensor.data_folder_path)
+        os.makedirs(sensor.raw_data_folder_path, exist_ok=True)
+        for a_frame in saved_frames:
+            with open(os.path.join(sensor.raw_data_folder_path, f"{a_frame:05d}.png"), "wb") as png_file:
+                png_file.write(png_bytes)
+        sensor.timestamps_to_save = []
+
+    results = {"png_sensor.check_data": (best_time(quiet(sensor.check_data), repeat=args.repeat, setup=setup),
+                                         len(saved_frames), "frames")}
+    sensor.shutdown()
+    return results
+
+
+def benchmark_post_processing(sensors_json, args, tmp_folder):
+    results = {}
+    sensor_cfg = get_sensor_cfg(sensors_json, "sensor.camera.dvs")
+    if sensor_cfg is not None:
+        height, width = int(sensor_cfg["attributes"]["image_size_y"]), int(sensor_cfg["attributes"]["image_size_x"])
+        frames_in_window = int(args.delta_t_ms / 1000 / sensor_cfg["attributes"]["sensor_tick"])
+        events = [make_fake_sensor_data(sensor_cfg, frame=frame, events_per_pixel=args.events_per_pixel,
+                                        seed=frame).events for frame in range(frames_in_window)]
+        events = {key: np.concatenate([a_frame_events[key] for a_frame_events in events]) for key in events[0]}
+        histogram = Histogram(height=height, width=width, normalize=False)
+        try:
+            import torch
+            tensors = {key: torch.from_numpy(events[key].astype(np.float32)) for key in events}
+            results["histogram.convert"] = (
+                best_time(lambda: histogram.convert(tensors["x"], tensors["y"], tensors["p"], tensors["t"]),
+                          repeat=args.repeat), 1, "windows")
+        except ImportError:
+            print(color_error_string("histogram.convert: skipped (torch is not installed)"))
+        results["histogram.convert_batch_numpy"] = (
+            best_time(lambda: histogram.convert_batch(events["x"], events["y"], events["p"], events["t"],
+                                                      np.array([0]), np.array([events["t"].size])),
+                      repeat=args.repeat), 1, "windows")
+
+    lidar_cfg = get_sensor_cfg(sensors_json, "sensor.lidar.ray_cast")
+    if lidar_cfg is None:
+        lidar_cfg = {"blue_print_name": "sensor.lidar.ray_cast", "attributes": {"sensor_tick": 0.1}}
+    points = np.frombuffer(make_fake_sensor_data(lidar_cfg).raw_data, dtype=np.float32).reshape(-1, 4)
+    results["lidar_to_histogram_features"] = (best_time(lambda: lidar_to_histogram_features(points),
+                                                        repeat=args.repeat), 1, "sweeps")
+
+    depth_cfg = get_sensor_cfg(sensors_json, "sensor.camera.depth")
+    if depth_cfg is not None:
+        height, width = int(depth_cfg["attributes"]["image_size_y"]), int(depth_cfg["attributes"]["image_size_x"])
+        disparity = np.random.default_rng(0).integers(0, 80, (height, width)).astype(np.uint8)
+        out = np.empty((height, width, 3), dtype=np.uint8)
+        results["disp_to_rgb"] = (best_time(lambda: disp_to_rgb(disparity, out), repeat=args.repeat), 1, "frames")
+    return results
+
+
+# The benchmarks and the prefixes of the names of their results (to skip them with --only)
+BENCHMARKS = [
+    (benchmark_callbacks, ["callbacks."]),
+    (benchmark_event_sensor, ["event_sensor."]),
+    (benchmark_png_sensor, ["png_sensor."]),
+    (benchmark_post_processing, ["histogram.", "lidar_to_histogram_features", "disp_to_rgb"]),
+]
+
+
+def run(args):
+    with open(args.sensors_json, "r") as file:
+        sensors_json = json.load(file)
+    results = {}
+    for benchmark, prefixes in BENCHMARKS:
+        if args.only is not None and not any(prefix.startswith(args.only) or args.only.startswith(prefix)
+                                             for prefix in prefixes):
+            continue
+        with tempfile.TemporaryDirectory() as tmp_folder:
+            for name, (seconds, items, unit) in benchmark(sensors_json, args, tmp_folder).items():
+                if args.only is not None and not name.startswith(args.only):
+                    continue
+                results[name] = {"seconds": seconds, "items": items, "unit": unit, "items_per_second": items / seconds}
+                print(f"{name}: {seconds * 1000:.2f} ms [{items / seconds:.1f} {unit}/s]")
+    with open(args.output_path, "w", encoding="utf-8") as file:
+        json.dump({"commit": get_git_commit(), "machine": platform.node(), "cpu_count": os.cpu_count(),
+                   "date": datetime.now().isoformat(timespec="seconds"), "sensors_json": sensors_json,
+                   "events_per_pixel": args.events_per_pixel, "results": results}, file, indent=4)
+    print(color_info_success(f"Saved in {args.output_path}"))
+
+
+def compare(args):
+    """
+    :return: the number of regressions
+    """
+    with open(args.old_results_path, "r") as file:
+        old = json.load(file)
+    with open(args.new_results_path, "r") as file:
+        new = json.load(file)
+    print(color_info_string(f"{old.get('commit')} [{old.get('date')}] -> {new.get('commit')} [{new.get('date')}]"))
+    if old.get("machine") != new.get("machine"):
+        print(color_error_string(f"The results come from two machines ({old.get('machine')} and "
+                                 f"{new.get('machine')}), the comparison is not reliable!"))
+    if old.get("sensors_json") != new.get("sensors_json") or old.get("events_per_pixel") != new.get("events_per_pixel"):
+        print(color_error_string("The results were sized from two different sensors.json/events rates!"))
+
+    a_table_head = ["Benchmark", "Old [ms]", "New [ms]", "New/Old", ""]
+    a_table = []
+    number_of_regressions = 0
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        if name not in old["results"] or name not in new["results"]:
+            a_table.append([name, "-" if name not in old["results"] else f"{old['results'][name]['seconds'] * 1000:.2f}",
+                            "-" if name not in new["results"] else f"{new['results'][name]['seconds'] * 1000:.2f}",
+                            "", "missing"])
+            continue
+        ratio = new["results"][name]["seconds"] / old["results"][name]["seconds"]
+        verdict = ""
+        if ratio > 1 + args.threshold:
+            verdict = color_error_string("REGRESSION")
+            number_of_regressions += 1
+        elif ratio < 1 - args.threshold:
+            verdict = color_info_success("faster")
+        a_table.append([name, f"{old['results'][name]['seconds'] * 1000:.2f}",
+                        f"{new['results'][name]['seconds'] * 1000:.2f}", f"{ratio:.2f}", verdict])
+    print(tabulate(a_table, headers=a_table_head, tablefmt="grid"))
+    return number_of_regressions
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    if my_args.command == "run":
+        run(my_args)
+    else:
+        sys.exit(1 if compare(my_args) > 0 else 0)
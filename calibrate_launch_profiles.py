@@ -0,0 +1,146 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+import signal
+from ctypes import c_int, c_double
+from datetime import datetime
+
+import psutil
+from tabulate import tabulate
+
+from data_generator import utils
+from data_generator import config
+from data_generator.ports import PortLease
+from data_generator.launch_profiles import measure_ticks_per_second, choose_launch_profile, update_dataset_metadata
+from data_generator.carla_interface import add_carla_to_python_path, \
+    launch_carla_server_and_wait_till_its_up, \
+    set_up_world_and_wait_till_its_set_up
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description="Measures the ticks per second that every Carla launch profile "
+                                                     "achieves with the sensors rig of sensors.json and records the "
+                                                     "fastest good enough one in the dataset metadata.")
+    arg_parser.add_argument(
+        '--carla_path',
+        help='Path to the Carla Installation!',
+        required=True,
+        type=str
+    )
+    arg_parser.add_argument(
+        '--end_of_egg_file',
+        help='How the egg file should end to be valid! (default: py3.7-linux-x86_64.egg)',
+        default="py3.7-linux-x86_64.egg",
+        type=str
+    )
+    arg_parser.add_argument(
+        '--dataset_path',
+        help='Dataset in witch the chosen profile is recorded!',
+        required=True,
+        type=str
+    )
+    arg_parser.add_argument(
+        '--town',
+        default=10,
+        help='Witch town to select (default: 10)',
+        type=int
+    )
+    arg_parser.add_argument(
+        '--profiles',
+        nargs="+",
+        default=list(config.CARLA_LAUNCH_PROFILES.keys()),
+        help=f'Profiles to measure (default: {list(config.CARLA_LAUNCH_PROFILES.keys())})'
+    )
+    arg_parser.add_argument(
+        '--minimum_fidelity',
+        default=2,
+        help='Minimum fidelity that the chosen profile must have (default: 2)',
+        type=int
+    )
+    arg_parser.add_argument(
+        '--number_of_ticks',
+        default=300,
+        help='Number of measured ticks for each profile (default: 300)',
+        type=int
+    )
+    arg_parser.add_argument(
+        '--number_of_warm_up_ticks',
+        default=100,
+        help='Number of not measured ticks before the measure (default: 100)',
+        type=int
+    )
+    args = arg_parser.parse_args()
+    for profile in args.profiles:
+        if profile not in config.CARLA_LAUNCH_PROFILES:
+            raise Exception(utils.color_error_string(f"Unknown launch profile [{profile}]!"))
+    return args
+
+
+def calibrate_a_profile(args, profile_name, egg_file_path, carla_ue4_path, logs_folder_path, sensors_json):
+    port_lease = PortLease.acquire()
+    carla_server_pid = multiprocessing.Value(c_int)
+    try:
+        if not launch_carla_server_and_wait_till_its_up(
+                rpc_port=port_lease.rpc_port,
+                streaming_port=port_lease.streaming_port,
+                carla_server_pid=carla_server_pid,
+                carla_ue4_path=carla_ue4_path,
+                logs_path=os.path.join(logs_folder_path, f"carla_server_logs_{port_lease.rpc_port}.log"),
+                how_many_seconds_to_wait=100,
+                launch_profile=config.CARLA_LAUNCH_PROFILES[profile_name]):
+            raise utils.NutException(utils.color_error_string(f"Carla crashed while starting!"))
+        if not set_up_world_and_wait_till_its_set_up(carla_ip="127.0.0.1", rpc_port=port_lease.rpc_port,
+                                                     town_number=args.town, carla_server_pid=carla_server_pid):
+            raise utils.NutException(utils.color_error_string(f"Failed to set up world!"))
+        ticks_per_second = multiprocessing.Value(c_double, 0.)
+        measure_process = multiprocessing.Process(target=measure_ticks_per_second,
+                                                  args=(egg_file_path, port_lease.rpc_port, sensors_json,
+                                                        args.number_of_warm_up_ticks, args.number_of_ticks,
+                                                        ticks_per_second))
+        measure_process.start()
+        measure_process.join()
+        if measure_process.exitcode != 0:
+            raise utils.NutException(utils.color_error_string(f"The measure crashed!"))
+        return ticks_per_second.value
+    finally:
+        if carla_server_pid.value != 0 and psutil.pid_exists(carla_server_pid.value):
+            os.kill(carla_server_pid.value, signal.SIGKILL)
+        port_lease.release()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    my_egg_file_path, my_carla_ue4_path = add_carla_to_python_path(my_args.carla_path, my_args.end_of_egg_file)
+    repo_path = pathlib.Path(__file__).parent.resolve()
+    with open(os.path.join(repo_path, "sensors.json"), "r") as file:
+        my_sensors_json = json.load(file)
+    os.makedirs(my_args.dataset_path, exist_ok=True)
+
+    measures = {}
+    for a_profile_name in my_args.profiles:
+        print(utils.get_a_title(f"CALIBRATING [{a_profile_name}]", color="blue"))
+        try:
+            measures[a_profile_name] = calibrate_a_profile(my_args, a_profile_name, my_egg_file_path,
+                                                           my_carla_ue4_path, os.path.join(repo_path, "logs"),
+                                                           my_sensors_json)
+        except utils.NutException as e:
+            print(e.message)
+
+    a_table_head = ["Profile", "Fidelity", "Ticks/s"]
+    a_table = [[name, config.CARLA_LAUNCH_PROFILES[name]["fidelity"], f"{measures[name]:.2f}"] for name in measures]
+    print(tabulate(a_table, headers=a_table_head, tablefmt="grid"))
+
+    chosen_profile = choose_launch_profile(measures, my_args.minimum_fidelity)
+    if chosen_profile is None:
+        raise Exception(utils.color_error_string(f"No measured profile has a fidelity >= {my_args.minimum_fidelity}!"))
+    update_dataset_metadata(my_args.dataset_path, {
+        "launch_profile": chosen_profile,
+        "launch_profile_calibration": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "minimum_fidelity": my_args.minimum_fidelity,
+            "ticks_per_second": measures,
+        },
+    })
+    print(utils.color_info_success(f"Chosen launch profile: {chosen_profile} [{measures[chosen_profile]:.2f} ticks/s]"))
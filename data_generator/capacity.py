@@ -0,0 +1,226 @@
+import os
+import json
+import shutil
+
+import psutil
+from tabulate import tabulate
+
+from . import config
+from .manifest import DatasetManifest
+from .data_creation.sensors import SENSOR_REGISTRY
+
+DEFAULT_ENCODER_COSTS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks",
+                                          "encoder_costs.json")
+# The gzip h5 of the events written by EventSensor.finalize (the event callback only keeps the events in RAM)
+EVENTS_H5_ENCODER = "events_h5"
+# Measured with "python -m benchmarks.bench_encoders" (used when there is no encoder_costs.json)
+DEFAULT_ENCODER_COSTS = {
+    "depth_callback":        {"unit": "pixel", "ms_per_million_units": 65.2, "bytes_per_unit": 0.14},
+    "rgb_callback":          {"unit": "pixel", "ms_per_million_units": 135.9, "bytes_per_unit": 2.32},
+    "event_callback":        {"unit": "event", "ms_per_million_units": 589.5, "bytes_per_unit": 0.00},
+    EVENTS_H5_ENCODER:       {"unit": "event", "ms_per_million_units": 1452.0, "bytes_per_unit": 7.58},
+    "semantic_callback":     {"unit": "pixel", "ms_per_million_units": 22.1, "bytes_per_unit": 0.58},
+    "optical_flow_callback": {"unit": "pixel", "ms_per_million_units": 12.5, "bytes_per_unit": 4.00},
+    "lidar_points_callback": {"unit": "point", "ms_per_million_units": 4.4, "bytes_per_unit": 16.00},
+}
+# RAM of an event kept by the event callback (x, y, t as int64 and p as bool)
+EVENT_RAM_BYTES = 25
+# Bytes of a pixel of the raw data that a sensor copies for its AsyncWriter
+RAW_PIXEL_BYTES = {"sensor.camera.optical_flow": 8}
+DEFAULT_RAW_PIXEL_BYTES = 4
+
+
+def load_encoder_costs(encoder_costs_path: str = None):
+    """
+    :return: the encoders costs of benchmarks/bench_encoders.py (the default ones if it was never run) and where they
+             come from
+    """
+    encoder_costs_path = DEFAULT_ENCODER_COSTS_PATH if encoder_costs_path is None else encoder_costs_path
+    if not os.path.isfile(encoder_costs_path):
+        return dict(DEFAULT_ENCODER_COSTS), "default"
+    with open(encoder_costs_path, "r", encoding="utf-8") as encoder_costs_file:
+        encoder_costs = dict(DEFAULT_ENCODER_COSTS)
+        encoder_costs.update(json.load(encoder_costs_file)["encoders"])
+    return encoder_costs, encoder_costs_path
+
+
+def get_events_per_pixel_per_frame(dataset_path: str, sensors_json: dict):
+    """
+    :return: the mean DVS events per pixel in a Carla's frame of the complete sequences of a dataset (None if it has
+             none)
+    """
+    if dataset_path is None or not os.path.isdir(dataset_path):
+        return None
+    values = []
+    for record in DatasetManifest(dataset_path).get_records().values():
+        if record.get("status") != "complete":
+            continue
+        for sensor_cfg in sensors_json["sensors"]:
+            number_of_events = record.get("frame_counts", {}).get(f"{sensor_cfg['friendly_name']}_events")
+            if number_of_events is None:
+                continue
+            attributes = sensor_cfg["attributes"]
+            # EventSensor keeps 5 more frames before and after the sequence
+            number_of_frames = sensors_json["number_of_frames_to_take"] + 10
+            values.append(number_of_events / number_of_frames
+                          / (int(attributes["image_size_x"]) * int(attributes["image_size_y"])))
+    if len(values) == 0:
+        return None
+    return sum(values) / len(values)
+
+
+def estimate_sensor(sensor_cfg: dict, sensors_json: dict, encoder_costs: dict, events_per_pixel_per_frame: float,
+                    ticks_per_second: float):
+    """
+    :return: RAM, disk, write and CPU estimate of a sensor for a sequence (see estimate_capacity)
+    """
+    carla_tick = sensors_json["carla_tick"]
+    capture_ticks = sensors_json["number_of_warm_up_frames"] + sensors_json["number_of_frames_to_take"] + 50
+    attributes = sensor_cfg["attributes"]
+    frames_step = max(1, int(round(attributes["sensor_tick"] / carla_tick)))
+    number_of_callbacks = capture_ticks // frames_step
+    number_of_saved_frames = sensors_json["number_of_frames_to_take"] // frames_step
+    # Wall clock ms between two frames of this sensor
+    period_ms = frames_step / ticks_per_second * 1000
+
+    sensor_class_name, callback_name = SENSOR_REGISTRY.get(sensor_cfg["blue_print_name"], (None, None))
+    sensor_class_name = sensor_cfg.get("sensor_class", sensor_class_name)
+    callback_name = sensor_cfg.get("callback", callback_name)
+    estimate = {"name": sensor_cfg["friendly_name"], "callback": callback_name, "callbacks": number_of_callbacks,
+                "ram_bytes": 0, "disk_peak_bytes": 0, "disk_final_bytes": 0, "written_while_capturing_bytes": 0,
+                "load": 0., "post_capture_s": 0., "measured": callback_name in encoder_costs}
+    if not estimate["measured"]:
+        return estimate
+    cost = encoder_costs[callback_name]
+
+    if sensor_class_name == "EventSensor":
+        events_per_frame = events_per_pixel_per_frame * int(attributes["image_size_x"]) \
+                           * int(attributes["image_size_y"])
+        saved_events = (number_of_saved_frames + 10) * events_per_frame
+        h5_cost = encoder_costs[EVENTS_H5_ENCODER]
+        # The events of all the capture, plus their concatenation in check_data
+        estimate["ram_bytes"] = (number_of_callbacks * events_per_frame + saved_events) * EVENT_RAM_BYTES
+        estimate["disk_peak_bytes"] = estimate["disk_final_bytes"] = saved_events * h5_cost["bytes_per_unit"]
+        # The callback runs in the Carla's thread of the sensor
+        estimate["load"] = cost["ms_per_million_units"] * events_per_frame / 1e6 / period_ms
+        estimate["post_capture_s"] = h5_cost["ms_per_million_units"] * saved_events / 1e6 / 1000
+        return estimate
+
+    if sensor_class_name == "LidarSensor":
+        units = attributes.get("points_per_second", 56000) * attributes["sensor_tick"]
+        raw_frame_bytes = units * 16
+    else:
+        units = int(attributes["image_size_x"]) * int(attributes["image_size_y"])
+        raw_frame_bytes = units * RAW_PIXEL_BYTES.get(sensor_cfg["blue_print_name"], DEFAULT_RAW_PIXEL_BYTES)
+    frame_bytes = cost["bytes_per_unit"] * units
+    # Worst case: the AsyncWriter queue is full of copies of the raw data
+    estimate["ram_bytes"] = min(config.ASYNC_WRITER_MAXIMUM_QUEUE_SIZE, number_of_callbacks) * raw_frame_bytes
+    estimate["written_while_capturing_bytes"] = number_of_callbacks * frame_bytes
+    if sensor_class_name == "LidarSensor":
+        # The sweeps of the sequence are copied out of the raw file before that it is removed
+        estimate["disk_final_bytes"] = number_of_saved_frames * frame_bytes
+        estimate["disk_peak_bytes"] = estimate["written_while_capturing_bytes"] + estimate["disk_final_bytes"]
+    else:
+        # The frames are moved from the raw_ folder (removed only when the result is checked)
+        estimate["disk_final_bytes"] = number_of_saved_frames * frame_bytes if sensor_cfg["check_result"] \
+            else estimate["written_while_capturing_bytes"]
+        estimate["disk_peak_bytes"] = estimate["written_while_capturing_bytes"]
+    # The encoding runs in the single AsyncWriter thread of the sensor
+    estimate["load"] = cost["ms_per_million_units"] * units / 1e6 / period_ms
+    return estimate
+
+
+def estimate_capacity(sensors_json: dict, encoder_costs: dict, events_per_pixel_per_frame: float = None,
+                      ticks_per_second: float = None):
+    """
+    Per sequence estimate of the data creation process (the Carla server is not included).
+    :param events_per_pixel_per_frame: DVS events per pixel in a Carla's frame (see get_events_per_pixel_per_frame)
+    :param ticks_per_second: wall clock Carla's ticks per second (the carla_generator_ticks_per_second metric)
+    :return: dict with the estimate of each sensor, the RAM peak, the disk peak and final footprint, the write
+             bandwidth while capturing (bytes/s), the CPU cores needed by the callbacks/writers and the seconds
+             needed after the capture
+    """
+    events_per_pixel_per_frame = config.CAPACITY_DVS_EVENTS_PER_PIXEL_PER_FRAME \
+        if events_per_pixel_per_frame is None else events_per_pixel_per_frame
+    ticks_per_second = config.CAPACITY_TICKS_PER_SECOND if ticks_per_second is None else ticks_per_second
+    sensors = [estimate_sensor(sensor_cfg, sensors_json, encoder_costs, events_per_pixel_per_frame, ticks_per_second)
+               for sensor_cfg in sensors_json["sensors"]]
+    capture_s = (sensors_json["number_of_warm_up_frames"] + sensors_json["number_of_frames_to_take"] + 50) \
+        / ticks_per_second
+    return {
+        "sensors": sensors,
+        "events_per_pixel_per_frame": events_per_pixel_per_frame,
+        "ticks_per_second": ticks_per_second,
+        "capture_s": capture_s,
+        "ram_bytes": sum(sensor["ram_bytes"] for sensor in sensors),
+        "disk_peak_bytes": sum(sensor["disk_peak_bytes"] for sensor in sensors),
+        "disk_final_bytes": sum(sensor["disk_final_bytes"] for sensor in sensors),
+        "write_bandwidth": sum(sensor["written_while_capturing_bytes"] for sensor in sensors) / capture_s,
+        "cpu_cores": sum(sensor["load"] for sensor in sensors),
+        # The sensors are checked and finalized at the same time, one thread each
+        "post_capture_s": max([sensor["post_capture_s"] for sensor in sensors] +
+                              [sum(sensor["post_capture_s"] for sensor in sensors) / (os.cpu_count() or 1)]),
+    }
+
+
+def check_capacity(estimate: dict, dataset_path: str):
+    """
+    :return: list of ("error" or "warning", message), with an error the sequence should not be started
+    """
+    problems = []
+    for sensor in estimate["sensors"]:
+        if not sensor["measured"]:
+            problems.append(("warning", f"[{sensor['name']}] {sensor['callback']} has no measured cost, it is not "
+                                        f"in the estimate (run python -m benchmarks.bench_encoders)"))
+        elif sensor["load"] > 1:
+            problems.append(("error", f"[{sensor['name']}] needs {sensor['load'] * 100:.0f}% of a thread at "
+                                      f"{estimate['ticks_per_second']:.0f} ticks/s, it will lose frames"))
+        elif sensor["load"] > config.CAPACITY_WARNING_FRACTION:
+            problems.append(("warning", f"[{sensor['name']}] needs {sensor['load'] * 100:.0f}% of a thread at "
+                                        f"{estimate['ticks_per_second']:.0f} ticks/s"))
+
+    ram_needed = estimate["ram_bytes"] + config.CAPACITY_CARLA_SERVER_RAM_BYTES
+    ram_available = psutil.virtual_memory().available
+    disk_free = shutil.disk_usage(dataset_path).free if dataset_path is not None and os.path.isdir(dataset_path) \
+        else None
+    for what, needed, available in [("RAM", ram_needed, ram_available), ("disk", estimate["disk_peak_bytes"], disk_free)]:
+        if available is None:
+            continue
+        if needed > available:
+            problems.append(("error", f"A sequence needs {needed / 1e9:.1f} GB of {what} but only "
+                                      f"{available / 1e9:.1f} GB are available"))
+        elif needed > config.CAPACITY_WARNING_FRACTION * available:
+            problems.append(("warning", f"A sequence needs {needed / 1e9:.1f} GB of {what}, "
+                                        f"{available / 1e9:.1f} GB are available"))
+    if estimate["cpu_cores"] > os.cpu_count():
+        problems.append(("warning", f"The callbacks need {estimate['cpu_cores']:.1f} cores but there are "
+                                    f"{os.cpu_count()} (and Carla needs some too)"))
+    return problems
+
+
+def get_capacity_table(estimate: dict):
+    a_table_head = ["Sensor", "Callbacks", "RAM [MB]", "Disk peak [MB]", "Disk final [MB]", "Thread load [%]",
+                    "After capture [s]"]
+    a_table = []
+    for sensor in estimate["sensors"]:
+        a_table.append([sensor["name"], sensor["callbacks"], f"{sensor['ram_bytes'] / 1e6:.0f}",
+                        f"{sensor['disk_peak_bytes'] / 1e6:.0f}", f"{sensor['disk_final_bytes'] / 1e6:.0f}",
+                        f"{sensor['load'] * 100:.0f}" if sensor["measured"] else "?",
+                        f"{sensor['post_capture_s']:.1f}"])
+    a_table.append(["TOTAL", "", f"{estimate['ram_bytes'] / 1e6:.0f}", f"{estimate['disk_peak_bytes'] / 1e6:.0f}",
+                    f"{estimate['disk_final_bytes'] / 1e6:.0f}", f"{estimate['cpu_cores'] * 100:.0f}",
+                    f"{estimate['post_capture_s']:.1f}"])
+    return tabulate(a_table, headers=a_table_head, tablefmt="grid")
+
+
+def plan_capacity(sensors_json: dict, dataset_path: str, encoder_costs_path: str = None,
+                  ticks_per_second: float = None):
+    """
+    :return: the estimate of estimate_capacity (with the events rate measured on the dataset when possible), the
+             problems of check_capacity and where the encoders costs come from
+    """
+    encoder_costs, encoder_costs_source = load_encoder_costs(encoder_costs_path)
+    estimate = estimate_capacity(sensors_json, encoder_costs,
+                                 events_per_pixel_per_frame=get_events_per_pixel_per_frame(dataset_path, sensors_json),
+                                 ticks_per_second=ticks_per_second)
+    return estimate, check_capacity(estimate, dataset_path), encoder_costs_source
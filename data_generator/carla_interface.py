@@ -2,7 +2,6 @@ import os
 import sys
 import subprocess
 import time
-from datetime import datetime
 import multiprocessing
 import  multiprocessing.sharedctypes as shared_ctype
 import signal
@@ -11,6 +10,8 @@ import psutil
 from data_generator.data_creation.generate_traffic import generate_traffic
 from .utils import color_error_string, color_info_string
 from .config import TOWN_DICT
+from . import config
+from .launch_profiles import get_carla_launch_command
 
 def add_carla_to_python_path(carla_path:str, end_of_egg_file:str):
     """
@@ -45,18 +46,49 @@ def add_carla_to_python_path(carla_path:str, end_of_egg_file:str):
     carla_ue4_path = os.path.join(carla_ue4_folder, "CarlaUE4-Linux-Shipping")
     return egg_file_path, carla_ue4_path
 
-def launch_carla_server_and_wait_till_its_up(rpc_port:int, carla_server_pid:shared_ctype,
+class CarlaLogWatcher:
+    """
+    Follows the Carla's log reading only what was appended since the last update (offset based, no re-read of the
+    whole file) and looks for the fatal patterns of config.CARLA_FATAL_LOG_PATTERNS (when Carla is ready is decided
+    by an RPC probe, the Carla's versions do not print a reliable ready line).
+    """
+
+    def __init__(self, logs_path: str):
+        self.logs_path = logs_path
+        self.offset = 0
+        self._partial_line = ""
+
+    def update(self):
+        """
+        :return: the first fatal line found in the new part of the log (None if there is no fatal line)
+        """
+        with open(self.logs_path, "r", errors="replace") as logs_file:
+            logs_file.seek(self.offset)
+            new_text = logs_file.read()
+            self.offset = logs_file.tell()
+        if len(new_text) == 0:
+            return None
+        lines = (self._partial_line + new_text).split("\n")
+        # The last element is an incomplete line (or an empty string), we keep it for the next update
+        self._partial_line = lines.pop()
+        for line in lines:
+            for pattern in config.CARLA_FATAL_LOG_PATTERNS:
+                if pattern in line:
+                    return line.strip()
+        return None
+
+
+def launch_carla_server_and_wait_till_its_up(rpc_port:int, streaming_port:int, carla_server_pid:shared_ctype,
                                              carla_ue4_path:str, logs_path:str,
-                                             how_many_seconds_to_wait:int, show_carla_window:bool=False):
+                                             how_many_seconds_to_wait:int, show_carla_window:bool=False,
+                                             launch_profile:dict=None):
+    if launch_profile is None:
+        launch_profile = config.CARLA_LAUNCH_PROFILES[config.DEFAULT_CARLA_LAUNCH_PROFILE]
+
     def start_up_carla_server():
         with open(logs_path, 'r+') as logs_file:
-            command_as_list = ["/usr/bin/stdbuf",
-                               "-o0",
-                               carla_ue4_path,
-                               "-nosound",
-                               f"-carla-rpc-port={rpc_port}"]
-            if not show_carla_window:
-                command_as_list.append("-RenderOffScreen")
+            command_as_list = get_carla_launch_command(carla_ue4_path, rpc_port, streaming_port, launch_profile,
+                                                       show_carla_window)
             carla_process = subprocess.Popen(
                 command_as_list,
                 stdout=logs_file,
@@ -64,44 +96,67 @@ def launch_carla_server_and_wait_till_its_up(rpc_port:int, carla_server_pid:shar
                 universal_newlines=True
             )
         carla_server_pid.value = carla_process.pid
-        # We will wait Carla to start up!
-        while True:
-            with open(logs_path, 'r') as logs_file:
-                time.sleep(0.2)
-                lines = len(logs_file.readlines())
-                if lines >= 2:
-                    break
-            return_code = carla_process.poll()
-            if return_code is not None:
-                # The Carla process died before starting up!
-                exit()
+        start_time = time.time()
+        log_watcher = CarlaLogWatcher(logs_path)
+
+        def give_up(reason):
+            print()
+            print(color_error_string(f"Carla will not start: {reason}"))
+            if carla_process.poll() is None:
+                carla_process.kill()
+            # Reaped, so its PID is not left behind as a zombie
+            carla_process.wait()
+            exit()
+
+        def check_carla_health():
+            fatal_line = log_watcher.update()
+            if fatal_line is not None:
+                give_up(f"fatal line in the logs [{fatal_line}]")
+            if carla_process.poll() is not None:
+                give_up("the process died")
+            if time.time() - start_time > how_many_seconds_to_wait:
+                give_up(f"not ready after {how_many_seconds_to_wait} s")
 
         print("Waiting Carla to Start...", end="", flush=True)
         try:
             import carla
         except:
-            print(color_error_string("Was not possible to import carla from launch_carla_server_and_wait_till_its_up!"))
-            exit()
-        start_time = datetime.now()
+            give_up("was not possible to import carla from launch_carla_server_and_wait_till_its_up!")
+        client = carla.Client('localhost', rpc_port)
+        backoff = config.CARLA_RPC_PROBE_FIRST_BACKOFF
+        # Carla is ready when it answers on its RPC port, meanwhile the logs (only their new part) and the process are
+        # checked to give up as soon as it is not going to start
         while True:
+            check_carla_health()
             try:
-                client = carla.Client('localhost', rpc_port)
-                client.set_timeout(1.0)
+                client.set_timeout(config.CARLA_RPC_PROBE_TIMEOUT)
+                _ = client.get_server_version()
                 _ = client.get_world()
                 break
             except RuntimeError:
                 pass
             print("*", end="", flush=True)
-            if (datetime.now() - start_time).total_seconds() > how_many_seconds_to_wait:
-                break
+            time.sleep(backoff)
+            backoff = min(2 * backoff, config.CARLA_RPC_PROBE_MAX_BACKOFF)
         print()
+        print(color_info_string(f"Carla is ready after {time.time() - start_time:.1f} s!"))
+        carla_is_ready.set()
     # END start_up_carla_server
 
-    # FIRST OF ALL KILL ALL CARLA SERVER RUNNING
+    # FIRST OF ALL KILL ALL CARLA SERVER RUNNING ON OUR PORTS
+    # (the ports are leased to us, so a server using them is a leftover of a previous attempt, while the servers on
+    # other ports belong to other pipelines running on this machine)
+    our_ports_arguments = [f"-carla-rpc-port={rpc_port}", f"-carla-streaming-port={streaming_port}"]
     for proc in psutil.process_iter():
         if "CarlaUE4-Linux-Shipping" in proc.name():
-            print(color_info_string(f"Another carla server was running, I will kill it! [{proc.name()}]"))
-            os.kill(proc.pid, signal.SIGKILL)
+            try:
+                proc_cmdline = proc.cmdline()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if any(argument in proc_cmdline for argument in our_ports_arguments):
+                print(color_info_string(f"Another carla server was running on our ports, I will kill it!"
+                                        f" [{proc.name()}]"))
+                os.kill(proc.pid, signal.SIGKILL)
     if not os.path.isdir(os.path.dirname(logs_path)):
         try:
             os.mkdir(os.path.dirname(logs_path))
@@ -112,16 +167,13 @@ def launch_carla_server_and_wait_till_its_up(rpc_port:int, carla_server_pid:shar
     with open(logs_path, 'w') as _:
         pass
     
+    # Set by start_up_carla_server only when Carla answers on its RPC port
+    carla_is_ready = multiprocessing.Event()
     check_carla_process = multiprocessing.Process(target=start_up_carla_server)
     check_carla_process.start()
     # Let's wait till Carla Server is Up!
-    while True:
-        if not check_carla_process.is_alive():
-            check_carla_process.join()
-            if not psutil.pid_exists(carla_server_pid.value):
-                return False
-            else:
-                return True
+    check_carla_process.join()
+    return carla_is_ready.is_set()
 
 def set_up_world_and_wait_till_its_set_up(carla_ip:str, rpc_port:int, town_number:int,
                                           carla_server_pid:shared_ctype):
@@ -158,7 +210,8 @@ def set_up_traffic_manager_and_wait_till_its_up(carla_ip:str, rpc_port:int, tm_p
                                                 logs_path:str, tm_ready_to_warm_up, tm_ready_to_take_data,
                                                 dt_ready_to_warm_up, dt_ready_to_take_data, dt_want_to_stop_taking_data,
                                                 wait_a_little_bit_before_starting:int,
-                                                warm_up_frames:int, hero:bool=True):
+                                                warm_up_frames:int, hero:bool=True, traffic_seed:int=None,
+                                                hero_spawn_index:int=None):
     traffic_manager_is_up = multiprocessing.Event()
     set_up_traffic_manager_process = multiprocessing.Process(target=generate_traffic,
                                                              args=(carla_ip, rpc_port, tm_port, number_of_vehicles,
@@ -168,7 +221,7 @@ def set_up_traffic_manager_and_wait_till_its_up(carla_ip:str, rpc_port:int, tm_p
                                                                    dt_ready_to_take_data, dt_want_to_stop_taking_data,
                                                                    wait_a_little_bit_before_starting,
                                                                    warm_up_frames,
-                                                                   hero))
+                                                                   hero, traffic_seed, hero_spawn_index))
     set_up_traffic_manager_process.start()
 
     traffic_manager_pid.value = set_up_traffic_manager_process.pid
@@ -7,6 +7,42 @@ import datetime
 
 # TAKE DATA
 MAX_NUM_OF_ATTEMPTS = 100  # maximum number of attempts to start up all the carla's chain!
+# Each Carla's chain leases 4 consecutive ports (rpc, streaming, secondary, tm) in this range
+PORT_RANGE_START = 2000
+PORT_RANGE_END = 3000
+PORT_LEASE_DIR = "/tmp/carla_port_leases"
+CARLA_FATAL_LOG_PATTERNS = ["Signal 11 caught", "Segmentation fault", "Aborted (core dumped)",
+                            "terminating with uncaught exception", "Address already in use",
+                            "VK_ERROR_", "Out of memory"]
+CARLA_RPC_PROBE_TIMEOUT = 2.0  # s, timeout of a single RPC probe
+CARLA_RPC_PROBE_FIRST_BACKOFF = 0.1  # s, it doubles after each failed probe
+CARLA_RPC_PROBE_MAX_BACKOFF = 2.0  # s
+# Named set of CarlaUE4 flags, "fidelity" says how good the rendering is (higher is better) and it is used by
+# calibrate_launch_profiles.py to pick the fastest profile that is good enough
+CARLA_LAUNCH_PROFILES = {
+    "epic":               {"quality_level": "Epic", "off_screen": True, "extra_arguments": [], "fidelity": 2},
+    "epic_prefer_nvidia": {"quality_level": "Epic", "off_screen": True, "extra_arguments": ["-prefernvidia"],
+                           "fidelity": 2},
+    "low":                {"quality_level": "Low", "off_screen": True, "extra_arguments": [], "fidelity": 1},
+}
+DEFAULT_CARLA_LAUNCH_PROFILE = "epic"
+DATASET_METADATA_FILE_NAME = "dataset_metadata.json"
+METRICS_TEXTFILE_DIR = "/tmp/carla_data_generator_metrics"  # read by the node_exporter textfile collector
+METRICS_UPDATE_PERIOD = 5  # s, how often the metrics files are rewritten
+# Assumptions of the capacity planner (see data_generator/capacity.py)
+CAPACITY_TICKS_PER_SECOND = 20  # wall clock Carla's ticks per second while capturing
+CAPACITY_DVS_EVENTS_PER_PIXEL_PER_FRAME = 0.05  # used until the dataset has complete sequences to measure it
+CAPACITY_CARLA_SERVER_RAM_BYTES = 6e9  # RAM that the Carla server and the Traffic Manager need
+CAPACITY_WARNING_FRACTION = 0.8  # warn when the estimate is above this fraction of what is available
+# A sequence is rejected (recorded in the manifest and not made again) when a threshold is not met, None disables it
+REJECTION_MINIMUM_HERO_MEAN_SPEED = 0.5  # m/s over the capture (a hero that waits at a red light)
+REJECTION_MINIMUM_EVENTS_PER_FRAME = 1000  # DVS events per frame of the busiest DVS camera over the capture
+# The capture is stopped earlier only when, after REJECTION_EARLY_CHECK_FRAMES, nothing is happening at all (all the
+# early thresholds are met), a hero that only pauses for a moment is checked at the end of the capture
+REJECTION_EARLY_CHECK_FRAMES = 100
+REJECTION_EARLY_MAXIMUM_HERO_DISTANCE = 0.05  # m, the hero has not moved
+REJECTION_EARLY_MAXIMUM_EVENTS_PER_FRAME = 100  # DVS events per frame of the busiest DVS camera, almost black
+ASYNC_WRITER_MAXIMUM_QUEUE_SIZE = 256  # frames waiting to be encoded/written for each sensor (then the callback waits)
 CARLA_FPS = 100
 IMAGE_W = 1024
 IMAGE_H = 256
@@ -0,0 +1,59 @@
+import queue
+import threading
+
+from .. import config
+from ..utils import NutException, color_error_string
+
+
+class AsyncWriter:
+    """
+    Runs the encode/write jobs of a sensor in a background thread, so the Carla's callback thread only copies the
+    data. The jobs of a writer are executed in order (a sensor can append to a single file).
+    """
+
+    def __init__(self, name: str, maximum_queue_size: int = config.ASYNC_WRITER_MAXIMUM_QUEUE_SIZE):
+        self.name = name
+        self._queue = queue.Queue(maxsize=maximum_queue_size)
+        self._error = None
+        self.jobs_done = 0
+        self._thread = threading.Thread(target=self._run, name=f"{name}_writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, function, *args):
+        """
+        Enqueues function(*args), it blocks only if maximum_queue_size jobs are already waiting.
+        """
+        self._queue.put((function, args))
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                function, args = item
+                if self._error is None:
+                    function(*args)
+                    self.jobs_done += 1
+            except Exception as e:
+                # The first error is kept and raised by flush(), the next jobs are skipped
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Waits that all the submitted jobs are done.
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise NutException(color_error_string(f"[{self.name}] Writer failed: {self._error}"))
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
@@ -3,38 +3,11 @@ import math
 import numpy as np
 import cv2
 import os
-import torch
-import h5py
-import hdf5plugin
-import matplotlib.pyplot as plt
 
-from ..utils import lidar_to_histogram_features
-from .events_representations import Histogram
-from .disparity_visualization import disp_to_rgb
+# This module runs in the capture process, so it must not import the representation/visualization modules or their
+# heavy dependencies (torch, matplotlib, ...)!
 
 class Callbacks:
-    """
-    # LIDAR callback
-    @staticmethod
-    def lidar_callback(data, disable_all_sensors, data_list):
-        if not disable_all_sensors:
-            lidar_data_raw = np.copy(np.frombuffer(data.raw_data, dtype=np.dtype('f4')))
-            lidar_data_raw = np.reshape(lidar_data_raw, (int(lidar_data_raw.shape[0] / 4), 4))
-
-            # MY LIDAR
-            lidar_data = lidar_to_histogram_features(lidar_data_raw[:, :3])[0]
-            lidar_data = np.rot90(lidar_data)
-            saved_frame = (data.frame - STARTING_FRAME)
-            # cv2.imwrite(os.path.join(where_to_save, f"{saved_frame}.png"), lidar_data)
-    # CAMERAS callback
-    @staticmethod
-    def rgb_callback(data, disable_all_sensors, data_list):
-        if not disable_all_sensors:
-            bgr = np.reshape(np.copy(data.raw_data), (data.height, data.width, 4))
-            saved_frame = (data.frame - STARTING_FRAME)
-            # cv2.imwrite(os.path.join(where_to_save, f"{saved_frame}.jpg"), bgr)
-    """
-
     # DEPTH callback
     @staticmethod
     def depth_callback(data, where_to_save):
@@ -56,6 +29,31 @@ class Callbacks:
         raw_rgb = np.reshape(np.copy(data.raw_data), (data.height, data.width, 4))
         cv2.imwrite(os.path.join(where_to_save, f"{data.frame:05d}.png"), raw_rgb)
 
+    # SEMANTIC callback
+    @staticmethod
+    def semantic_callback(data, where_to_save):
+        # The semantic tag is in the red channel of the BGRA image
+        raw_semantic = np.frombuffer(data.raw_data, dtype=np.uint8).reshape((data.height, data.width, 4))
+        cv2.imwrite(os.path.join(where_to_save, f"{data.frame:05d}.png"), np.ascontiguousarray(raw_semantic[:, :, 2]))
+
+    # OPTICAL FLOW callback
+    @staticmethod
+    def optical_flow_callback(data, where_to_save):
+        # Two float32 (x and y flow) for every pixel, saved as float16
+        flow = np.frombuffer(data.raw_data, dtype=np.float32).reshape((data.height, data.width, 2))
+        np.save(os.path.join(where_to_save, f"{data.frame:05d}.npy"), flow.astype(np.float16))
+
+    # LIDAR POINTS callback
+    @staticmethod
+    def lidar_points_callback(data, points_file):
+        """
+        Appends the (x, y, z, intensity) float32 points of a sweep to an open binary file.
+        :return: the number of appended points
+        """
+        points = np.frombuffer(data.raw_data, dtype=np.float32)
+        points_file.write(points.tobytes())
+        return points.shape[0] // 4
+
 
     @staticmethod
     def event_callback(data, data_list, starting_times):
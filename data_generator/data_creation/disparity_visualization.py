@@ -1,24 +1,55 @@
+from functools import lru_cache
+
 import numpy as np
-import cv2
-import matplotlib as mpl
-import matplotlib.cm as cm
-import torch
-
-def disp_to_rgb(disp_array: np.ndarray):
-    if isinstance(disp_array, torch.Tensor):
-        disp_array = disp_array.numpy()
-    disp_pixels = np.argwhere(disp_array > 0)
-    u_indices = disp_pixels[:, 1]
-    v_indices = disp_pixels[:, 0]
-    disp = disp_array[v_indices, u_indices]
-    max_disp = 80
-
-    norm = mpl.colors.Normalize(vmin=0, vmax=max_disp, clip=True)
-    mapper = cm.ScalarMappable(norm=norm, cmap='inferno')
-
-    disp_color = mapper.to_rgba(disp)[..., :3]
-    output_image = np.zeros((disp_array.shape[0], disp_array.shape[1], 3))
-    output_image[v_indices, u_indices, :] = disp_color
-    output_image = (255 * output_image).astype("uint8")
-    output_image = cv2.cvtColor(output_image, cv2.COLOR_RGB2BGR)
-    return output_image
\ No newline at end of file
+
+MAX_DISPARITY = 80
+COLOR_MAP_NAME = "inferno"
+
+
+@lru_cache(maxsize=None)
+def get_color_map_lut():
+    """
+    :return: [256, 3] uint8 BGR colors of the color map (matplotlib is imported only the first time)
+    """
+    import matplotlib
+    import matplotlib.cm as cm
+    # matplotlib.colormaps is missing in the older versions (python 3.7), cm.get_cmap in the newer ones
+    color_map = matplotlib.colormaps[COLOR_MAP_NAME] if hasattr(matplotlib, "colormaps") \
+        else cm.get_cmap(COLOR_MAP_NAME)
+    # The integers are indices of the 256 colors of the map
+    rgb = (255 * color_map(np.arange(256))[:, :3]).astype(np.uint8)
+    return np.ascontiguousarray(rgb[:, ::-1])
+
+
+def _get_color_map_index(disparity: np.ndarray):
+    # The same quantization of matplotlib (Normalize(0, MAX_DISPARITY, clip=True) and a 256 colors map)
+    index = disparity.astype(np.float32 if disparity.dtype.itemsize <= 2 else np.float64) / MAX_DISPARITY * 256
+    return np.clip(index, 0, 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=None)
+def get_disparity_lut(dtype: str):
+    """
+    :return: [2 ** bits, 3] uint8 BGR color of every value of an unsigned integer disparity (0 is black)
+    """
+    lut = get_color_map_lut()[_get_color_map_index(np.arange(np.iinfo(dtype).max + 1, dtype=dtype))]
+    lut[0] = 0
+    return lut
+
+
+def disp_to_rgb(disp_array: np.ndarray, out: np.ndarray = None):
+    """
+    :param disp_array: [..., H, W] disparity (numpy array or cpu torch.Tensor), the pixels <= 0 are black
+    :return: [..., H, W, 3] uint8 BGR image(s)
+    """
+    disp_array = np.asarray(disp_array)
+    if out is None:
+        out = np.empty(disp_array.shape + (3, ), dtype=np.uint8)
+    if disp_array.dtype in (np.uint8, np.uint16):
+        # A single gather from a LUT with a color for every possible value
+        np.take(get_disparity_lut(disp_array.dtype.name), disp_array, axis=0, out=out)
+    else:
+        np.take(get_color_map_lut(), _get_color_map_index(disp_array), axis=0, out=out)
+        out[~(disp_array > 0)] = 0
+    return out
+
@@ -1,7 +1,88 @@
-import torch
 from abc import ABC, abstractmethod
-from .events_visualizations import voxel_grid_stereo_to_rgb, voxel_grid_mono_to_rgb, \
-                                   histogram_mono_to_rgb,histogram_stereo_to_rgb
+
+import numpy as np
+
+# torch and the visualization helpers are imported only when needed, so that importing a representation is cheap
+# (and so that the "numpy" backend works also where torch is not installed, e.g. in the data loader workers)
+BACKENDS = ["numpy", "torch"]
+
+
+def get_windows_events(window_starts, window_ends):
+    """
+    Flattens B windows of the same event stream, the window i is made of the events [window_starts[i], window_ends[i])
+    (e.g. window_starts = ms_to_idx[t0_ms], window_ends = ms_to_idx[t1_ms]). Windows can overlap.
+    :return: (events indices, window index of each one of them), both of shape (sum of the windows lengths, )
+    """
+    window_starts = np.asarray(window_starts, dtype=np.int64)
+    window_ends = np.asarray(window_ends, dtype=np.int64)
+    assert window_starts.shape == window_ends.shape and window_starts.ndim == 1
+    lengths = np.maximum(window_ends - window_starts, 0)
+    window_ids = np.repeat(np.arange(lengths.size, dtype=np.int64), lengths)
+    # Position of each event in the flat array minus the position where its window starts, plus the window start
+    first_positions = np.cumsum(lengths) - lengths
+    events_indices = np.arange(window_ids.size, dtype=np.int64) + np.repeat(window_starts - first_positions, lengths)
+    return events_indices, window_ids
+
+
+def scatter_add(indices: np.ndarray, weights, size: int, backend: str):
+    """
+    A single scatter add of weights in a zero vector of the given size (weights None means all ones).
+    """
+    if backend == "numpy":
+        return np.bincount(indices, weights=weights, minlength=size).astype(np.float32)
+    elif backend == "torch":
+        import torch
+        indices = torch.from_numpy(indices)
+        weights = torch.ones(indices.shape, dtype=torch.float) if weights is None \
+            else torch.from_numpy(np.asarray(weights, dtype=np.float32))
+        return torch.zeros(size, dtype=torch.float).index_add_(0, indices, weights)
+    raise ValueError(f"Unknown backend [{backend}], possible backends: {BACKENDS}")
+
+
+def get_spatial_corners(x: np.ndarray, y: np.ndarray):
+    """
+    Bilinear splatting of the events coordinates on the pixels grid.
+    :return: (x of the corners, y of the corners, weights of the corners, how many corners per event); the corners
+    arrays are made of the concatenation of the corners (so the events arrays must be tiled that many times), the
+    weights are None if they are all ones.
+    """
+    if np.issubdtype(x.dtype, np.integer) and np.issubdtype(y.dtype, np.integer):
+        # Integer coordinates (as the Carla's DVS ones): the only corner with a not zero weight is (x, y)
+        return x.astype(np.int64), y.astype(np.int64), None, 1
+    x0 = x.astype(np.int64)
+    y0 = y.astype(np.int64)
+    xlim = np.concatenate([x0, x0 + 1, x0, x0 + 1])
+    ylim = np.concatenate([y0, y0, y0 + 1, y0 + 1])
+    interp_weights = (1 - np.abs(xlim - np.tile(x, 4))) * (1 - np.abs(ylim - np.tile(y, 4)))
+    return xlim, ylim, interp_weights, 4
+
+
+def normalize_batch(batch, backend: str):
+    """
+    Same normalization of Histogram.convert (mean and std of the not zero values) done independently on each element
+    of the batch (B, ...) without a Python loop.
+    """
+    if backend == "torch":
+        # The numpy array shares the memory with the tensor
+        normalize_batch(batch.numpy(), "numpy")
+        return batch
+    if batch.shape[0] == 0:
+        return batch
+    if not batch.flags.c_contiguous:
+        batch = np.ascontiguousarray(batch)
+    # Only the not zero values are touched (the representations are very sparse)
+    flat = batch.reshape(-1)
+    not_zero = np.flatnonzero(flat)
+    values = flat[not_zero].astype(np.float64)
+    batch_ids = not_zero // batch[0].size
+    counts = np.bincount(batch_ids, minlength=batch.shape[0])
+    mean = np.bincount(batch_ids, weights=values, minlength=batch.shape[0]) / np.maximum(counts, 1)
+    centered = values - mean[batch_ids]
+    # Unbiased std like torch.std
+    std = np.sqrt(np.bincount(batch_ids, weights=centered ** 2, minlength=batch.shape[0]) / np.maximum(counts - 1, 1))
+    std[(counts < 2) | ~(std > 0)] = 1
+    flat[not_zero] = centered / std[batch_ids]
+    return batch
 
 
 class EventRepresentation(ABC):
@@ -10,7 +91,15 @@ class EventRepresentation(ABC):
         self.channels = channels
 
     @abstractmethod
-    def convert(self, x: torch.Tensor, y: torch.Tensor, pol: torch.Tensor, time: torch.Tensor):
+    def convert(self, x: "torch.Tensor", y: "torch.Tensor", pol: "torch.Tensor", time: "torch.Tensor"):
+        pass
+
+    @abstractmethod
+    def convert_batch(self, x, y, pol, time, window_starts, window_ends, backend: str = "numpy"):
+        """
+        Converts B windows of the same events stream at once.
+        :return: (B, channels, H, W) numpy array (backend="numpy") or torch tensor (backend="torch")
+        """
         pass
 
     @abstractmethod
@@ -40,7 +129,8 @@ class Histogram(EventRepresentation):
                    width=int(configuration["width"]),
                    normalize=bool(configuration["normalize"]))
 
-    def convert(self, x: torch.Tensor, y: torch.Tensor, pol: torch.Tensor, time: torch.Tensor):
+    def convert(self, x: "torch.Tensor", y: "torch.Tensor", pol: "torch.Tensor", time: "torch.Tensor"):
+        import torch
         assert x.shape == y.shape == pol.shape == time.shape
         assert x.ndim == 1
 
@@ -92,6 +182,30 @@ class Histogram(EventRepresentation):
 
         return histo
 
+    def convert_batch(self, x, y, pol, time, window_starts, window_ends, backend: str = "numpy"):
+        events_indices, window_ids = get_windows_events(window_starts, window_ends)
+        pol = (np.asarray(pol)[events_indices].astype(np.float32) / 2 + 0.5).astype(np.int64)
+        valid_pol = (pol >= 0) & (pol < 2)
+        events_indices = events_indices[valid_pol]
+        x = np.asarray(x)[events_indices]
+        y = np.asarray(y)[events_indices]
+        # The first index of the flat (B, 2, H, W) histogram is window * 2 + polarity
+        channels = window_ids[valid_pol] * 2 + pol[valid_pol]
+        number_of_windows = len(window_starts)
+        size = number_of_windows * 2 * self.height * self.width
+
+        # All the corners in a single scatter
+        xlim, ylim, interp_weights, corners_per_event = get_spatial_corners(x, y)
+        channels = np.tile(channels, corners_per_event)
+        mask = (xlim >= 0) & (xlim < self.width) & (ylim >= 0) & (ylim < self.height)
+        index = (channels * self.height + ylim) * self.width + xlim
+        histo = scatter_add(index[mask], None if interp_weights is None else interp_weights[mask], size, backend)
+
+        histo = histo.reshape(number_of_windows, 2, self.height, self.width)
+        if self.normalize:
+            histo = normalize_batch(histo, backend)
+        return histo
+
     def get_dataset_file_name(self, delta_t_ms, train_validation):
         if train_validation == "train":
             dataset_name = f"TRAIN_histogram_{delta_t_ms}_hdf5"
@@ -100,7 +214,108 @@ class Histogram(EventRepresentation):
         return dataset_name
 
     def to_rgb_stereo(self, representation_left, representation_right):
+        from .events_visualizations import histogram_stereo_to_rgb
         return histogram_stereo_to_rgb(representation_left, representation_right)
 
     def to_rgb_mono(self, representation):
+        from .events_visualizations import histogram_mono_to_rgb
         return histogram_mono_to_rgb(representation)
+
+
+class VoxelGrid(EventRepresentation):
+
+    def __init__(self, channels: int, height: int, width: int, normalize: bool):
+        super().__init__(channels)
+        self.height = height
+        self.width = width
+        self.normalize = normalize
+
+    @classmethod
+    def from_configuration(cls, configuration):
+        assert configuration["representation_type"] == "voxel_grid"
+        return cls(channels=int(configuration["channels"]),
+                   height=int(configuration["height"]),
+                   width=int(configuration["width"]),
+                   normalize=bool(configuration["normalize"]))
+
+    def convert(self, x: "torch.Tensor", y: "torch.Tensor", pol: "torch.Tensor", time: "torch.Tensor"):
+        assert x.shape == y.shape == pol.shape == time.shape
+        assert x.ndim == 1
+        return self.convert_batch(x, y, pol, time, [0], [x.shape[0]], backend="torch")[0]
+
+    def convert_batch(self, x, y, pol, time, window_starts, window_ends, backend: str = "numpy"):
+        events_indices, window_ids = get_windows_events(window_starts, window_ends)
+        number_of_windows = len(window_starts)
+        size = number_of_windows * self.channels * self.height * self.width
+        x = np.asarray(x)[events_indices]
+        y = np.asarray(y)[events_indices]
+        # Polarity as -1/+1 (0/1 and -1/+1 polarities are both accepted)
+        value = np.where(np.asarray(pol)[events_indices].astype(np.float32) > 0, 1., -1.).astype(np.float32)
+
+        # Time normalized in [0, channels - 1] inside each window (first and last event of the window are the limits)
+        time = np.asarray(time)
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+        window_ends = np.asarray(window_ends, dtype=np.int64)
+        not_empty = window_ends > window_starts
+        t_first = np.zeros(number_of_windows, dtype=np.float64)
+        t_last = np.zeros(number_of_windows, dtype=np.float64)
+        t_first[not_empty] = time[window_starts[not_empty]]
+        t_last[not_empty] = time[window_ends[not_empty] - 1]
+        window_duration = np.maximum(t_last - t_first, 1)
+        t_norm = (self.channels - 1) * (time[events_indices] - t_first[window_ids]) / window_duration[window_ids]
+
+        # Temporal bilinear binning: each event goes in its lower and upper bin, all in a single scatter
+        lower_bin = np.floor(t_norm).astype(np.int64)
+        upper_weight = (t_norm - lower_bin).astype(np.float32)
+        bins = np.concatenate([lower_bin, lower_bin + 1])
+        weights = np.concatenate([value * (1 - upper_weight), value * upper_weight])
+        channels = np.tile(window_ids, 2) * self.channels + bins
+        x = np.tile(x, 2)
+        y = np.tile(y, 2)
+        bins_mask = bins < self.channels
+
+        xlim, ylim, interp_weights, corners_per_event = get_spatial_corners(x[bins_mask], y[bins_mask])
+        channels = np.tile(channels[bins_mask], corners_per_event)
+        weights = np.tile(weights[bins_mask], corners_per_event)
+        if interp_weights is not None:
+            weights = weights * interp_weights
+        mask = (xlim >= 0) & (xlim < self.width) & (ylim >= 0) & (ylim < self.height)
+        index = (channels * self.height + ylim) * self.width + xlim
+        voxel_grid = scatter_add(index[mask], weights[mask], size, backend)
+
+        voxel_grid = voxel_grid.reshape(number_of_windows, self.channels, self.height, self.width)
+        if self.normalize:
+            voxel_grid = normalize_batch(voxel_grid, backend)
+        return voxel_grid
+
+    def get_dataset_file_name(self, delta_t_ms, train_validation):
+        if train_validation == "train":
+            dataset_name = f"TRAIN_voxel_grid_{self.channels}_{delta_t_ms}_hdf5"
+        else:
+            dataset_name = f"VALIDATION_voxel_grid_{self.channels}_{delta_t_ms}_hdf5"
+        return dataset_name
+
+    def to_rgb_stereo(self, representation_left, representation_right):
+        from .events_visualizations import voxel_grid_stereo_to_rgb
+        return voxel_grid_stereo_to_rgb(representation_left, representation_right)
+
+    def to_rgb_mono(self, representation):
+        from .events_visualizations import voxel_grid_mono_to_rgb
+        return voxel_grid_mono_to_rgb(representation)
+
+
+REPRESENTATIONS = {
+    "histogram": Histogram,
+    "voxel_grid": VoxelGrid,
+}
+
+
+def get_representation(configuration):
+    """
+    :param configuration: dict with the "representation_type" key plus the ones needed by the from_configuration
+                          method of that representation
+    """
+    if configuration["representation_type"] not in REPRESENTATIONS:
+        raise ValueError(f"Unknown representation type [{configuration['representation_type']}], possible types: "
+                         f"{list(REPRESENTATIONS.keys())}")
+    return REPRESENTATIONS[configuration["representation_type"]].from_configuration(configuration)
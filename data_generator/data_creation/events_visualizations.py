@@ -1,64 +1,91 @@
 import numpy as np
-import torch
-
-def voxel_grid_stereo_to_rgb(left: torch.Tensor, right: torch.Tensor):
-    rgb_left = voxel_grid_mono_to_rgb(left)
-    rgb_right = voxel_grid_mono_to_rgb(right)
-
-    big_image = np.ones((left.shape[0],
-                         left.shape[1]+right.shape[1], 3))
-    big_image[:left.shape[0], :left.shape[1]] = rgb_left
-    big_image[  :left.shape[0],
-                left.shape[1]:left.shape[1]+right.shape[1]] = rgb_right
-
-    return big_image
-
-def voxel_grid_mono_to_rgb(left: torch.Tensor):
-    if left.dim() == 4 and left.shape[0] == 1:
-        left = left[0, :, :, :]
-    elif left.dim() != 3:
-        raise Exception(f"Unexpected shape: {left.shape} (expecting [1, W, H, C] or [W, H, C])!")
-    # Now for sure a_voxel_grid have shape [C, W, H]
-    # 1) Let's sum along channels
-    left = torch.mean(left, 0)
-    # Now for sure a_voxel_grid have shape [W, H]
-
-    # 2) Go to Numpy
-    left = left.numpy()
-    rgb_left = np.ones((left.shape[0], left.shape[1], 3)) * [255, 255, 255]
-    rgb_left[left > 0.1] = [0, 0, 255]
-    rgb_left[left < - 0.1] = [255, 0, 0]
-
-    return rgb_left
-
-def histogram_stereo_to_rgb(left: torch.Tensor, right: torch.Tensor):
-    rgb_left = histogram_mono_to_rgb(left)
-    rgb_right = histogram_mono_to_rgb(right)
-
-    big_image = np.ones((left.shape[0],
-                         left.shape[1] + right.shape[1], 3))
-    big_image[:left.shape[0], :left.shape[1]] = rgb_left
-    big_image[:left.shape[0],
-    left.shape[1]:left.shape[1] + right.shape[1]] = rgb_right
-
-    return big_image
-
-def histogram_mono_to_rgb(representation: torch.Tensor):
-    if representation.dim() == 4 and representation.shape[0] == 1:
+
+# The helpers accept both torch tensors (on cpu) and numpy arrays, so torch is not needed to visualize the numpy
+# representations.
+# Every pixel is classified in a small uint8 index and colored with a single gather from a color LUT, the output is
+# uint8 and can be written in a preallocated out buffer (also a view, e.g. half of a stereo canvas).
+
+WHITE = [255, 255, 255]
+# Background, positive polarity, negative polarity
+HISTOGRAM_LUT = np.array([WHITE, [255, 0, 0], [0, 0, 255]], dtype=np.uint8)
+# Background, mean > 0.1, mean < -0.1
+VOXEL_GRID_LUT = np.array([WHITE, [0, 0, 255], [255, 0, 0]], dtype=np.uint8)
+VOXEL_GRID_THRESHOLD = 0.1
+
+
+def _colorize(index: np.ndarray, lut: np.ndarray, out: np.ndarray = None):
+    if out is None:
+        out = np.empty(index.shape + (3, ), dtype=np.uint8)
+    np.take(lut, index, axis=0, out=out)
+    return out
+
+
+def _stereo_canvas(left_shape, right_shape, out: np.ndarray = None):
+    """
+    :return: a canvas with the left and right images side by side and its two halves
+    """
+    if out is None:
+        out = np.empty(left_shape[:-2] + (max(left_shape[-2], right_shape[-2]), left_shape[-1] + right_shape[-1], 3),
+                       dtype=np.uint8)
+    if left_shape[-2] != right_shape[-2]:
+        out[...] = WHITE
+    return out, out[..., :left_shape[-2], :left_shape[-1], :], out[..., :right_shape[-2], left_shape[-1]:, :]
+
+
+def _voxel_grid_index(voxel_grid):
+    # Mean along the channels axis ([..., C, H, W] -> [..., H, W])
+    mean = np.asarray(voxel_grid).mean(axis=-3)
+    index = (mean > VOXEL_GRID_THRESHOLD).view(np.uint8)
+    np.putmask(index, mean < -VOXEL_GRID_THRESHOLD, 2)
+    return index
+
+
+def _histogram_index(histogram):
+    histogram = np.asarray(histogram)
+    positive_polarity = histogram[..., 0, :, :]
+    negative_polarity = histogram[..., 1, :, :]
+    index = np.left_shift((negative_polarity > 0).view(np.uint8), 1)
+    np.putmask(index, positive_polarity > negative_polarity, 1)
+    return index
+
+
+def _squeeze_batch_of_one(representation):
+    representation = np.asarray(representation)
+    if representation.ndim == 4 and representation.shape[0] == 1:
         representation = representation[0, :, :, :]
-    elif representation.dim() != 3:
-        raise Exception(f"Unexpected shape: {representation.shape} (expecting [1, W, H, C] or [W, H, C])!")
-    # Now for sure representation have shape [2, W, H]
-    positive_polarity = representation[0, :, :]
-    negative_polarity = representation[1, :, :]
-    # Now for sure representations have shape [W, H]
-
-    # 2) Go to Numpy
-    positive_polarity = positive_polarity.numpy()
-    negative_polarity = negative_polarity.numpy()
-    rgb_representation = np.ones((positive_polarity.shape[0], positive_polarity.shape[1], 3)) * [255, 255, 255]
-    rgb_representation[positive_polarity > 0] = [255, 0, 0]
-    rgb_representation[negative_polarity > 0] = [0, 0, 255]
-    rgb_representation[positive_polarity > negative_polarity] = [255, 0, 0]
-
-    return rgb_representation
\ No newline at end of file
+    elif representation.ndim != 3:
+        raise Exception(f"Unexpected shape: {representation.shape} (expecting [1, C, H, W] or [C, H, W])!")
+    return representation
+
+
+def voxel_grid_stereo_to_rgb(left: "torch.Tensor", right: "torch.Tensor", out: np.ndarray = None):
+    left = _squeeze_batch_of_one(left)
+    right = _squeeze_batch_of_one(right)
+    out, out_left, out_right = _stereo_canvas(left.shape[-2:], right.shape[-2:], out)
+    voxel_grid_mono_to_rgb(left, out_left)
+    voxel_grid_mono_to_rgb(right, out_right)
+    return out
+
+
+def voxel_grid_mono_to_rgb(left: "torch.Tensor", out: np.ndarray = None):
+    """
+    :return: [H, W, 3] uint8 image
+    """
+    return _colorize(_voxel_grid_index(_squeeze_batch_of_one(left)), VOXEL_GRID_LUT, out)
+
+
+def histogram_stereo_to_rgb(left: "torch.Tensor", right: "torch.Tensor", out: np.ndarray = None):
+    left = _squeeze_batch_of_one(left)
+    right = _squeeze_batch_of_one(right)
+    out, out_left, out_right = _stereo_canvas(left.shape[-2:], right.shape[-2:], out)
+    histogram_mono_to_rgb(left, out_left)
+    histogram_mono_to_rgb(right, out_right)
+    return out
+
+
+def histogram_mono_to_rgb(representation: "torch.Tensor", out: np.ndarray = None):
+    """
+    :return: [H, W, 3] uint8 image
+    """
+    return _colorize(_histogram_index(_squeeze_batch_of_one(representation)), HISTOGRAM_LUT, out)
+
@@ -34,7 +34,12 @@ def get_actor_blueprints(world, filter, generation):
 def generate_traffic(carla_ip, rpc_port, tm_port, number_of_vehicles, number_of_walkers, traffic_manager_is_up, logs_path,
                      tm_ready_to_warm_up, tm_ready_to_take_data, dt_ready_to_warm_up, dt_ready_to_take_data,
                      dt_want_to_stop_taking_data, wait_a_little_bit_before_starting, warm_up_frames,
-                     hero=True):
+                     hero=True, traffic_seed=None, hero_spawn_index=None):
+    """
+    :param traffic_seed: seed of the vehicles, walkers and Traffic Manager choices (None for a new one every time)
+    :param hero_spawn_index: index (modulo the number of spawn points of the town) of the hero spawn point (None for
+                             a random one)
+    """
     try:
         import carla
     except:
@@ -61,7 +66,7 @@ def generate_traffic(carla_ip, rpc_port, tm_port, number_of_vehicles, number_of_
     client = carla.Client(carla_ip, rpc_port)
     client.set_timeout(1000.0)
     synchronous_master = False
-    random.seed(int(time.time()))
+    random.seed(int(time.time()) if traffic_seed is None else traffic_seed)
 
     try:
         world = client.get_world()
@@ -71,6 +76,10 @@ def generate_traffic(carla_ip, rpc_port, tm_port, number_of_vehicles, number_of_
         traffic_manager.set_respawn_dormant_vehicles(True)
         traffic_manager.set_hybrid_physics_mode(True)
         traffic_manager.set_hybrid_physics_radius(70.0)
+        if traffic_seed is not None:
+            # Also the Carla's own random choices (Traffic Manager and walkers navigation)
+            traffic_manager.set_random_device_seed(traffic_seed)
+            world.set_pedestrians_seed(traffic_seed)
 
 
         settings = world.get_settings()
@@ -95,6 +104,8 @@ def generate_traffic(carla_ip, rpc_port, tm_port, number_of_vehicles, number_of_
 
         spawn_points = world.get_map().get_spawn_points()
         number_of_spawn_points = len(spawn_points)
+        # The hero spawn index refers to the (not shuffled) spawn points of the map
+        map_spawn_points = list(spawn_points)
 
         if number_of_vehicles < number_of_spawn_points:
             random.shuffle(spawn_points)
@@ -116,7 +127,9 @@ def generate_traffic(carla_ip, rpc_port, tm_port, number_of_vehicles, number_of_
             blueprint = world.get_blueprint_library().find('vehicle.ford.mustang')
             blueprint.set_attribute('color', blueprint.get_attribute('color').recommended_values[0])
             blueprint.set_attribute('role_name', 'hero')
-            batch.append(SpawnActor(blueprint, spawn_points[random.randint(0, len(spawn_points) - 1)])
+            hero_spawn_point = spawn_points[random.randint(0, len(spawn_points) - 1)] if hero_spawn_index is None \
+                else map_spawn_points[hero_spawn_index % len(map_spawn_points)]
+            batch.append(SpawnActor(blueprint, hero_spawn_point)
                 .then(SetAutopilot(FutureActor, True, traffic_manager.get_port())))
         for n, transform in enumerate(spawn_points[:]):
             if n >= number_of_vehicles:
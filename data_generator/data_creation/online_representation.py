@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+from collections import deque
+
+import h5py
+import numpy as np
+
+from .. import config
+from .events_representations import Histogram, normalize_batch
+from ..utils import NutException, color_error_string
+
+
+class OnlineHistogram:
+    """
+    Builds, while the events stream in, the histogram of the delta_t_ms window that ends at each disparity frame.
+    The sensor callback only enqueues the frame's arrays, a worker thread splats each events batch once (while it is
+    still cache-hot) in a per-frame partial histogram and keeps the running sum of the last delta_t_ms of partials.
+    Only the windows of the disparity frames (from context.start_frame, every context.disparity_frames_step frames)
+    are written, in a dataset allocated once with a row for each of them.
+    """
+
+    def __init__(self, configuration: dict, height: int, width: int, context, left_right: str, metrics,
+                 maximum_queue_size: int = config.ASYNC_WRITER_MAXIMUM_QUEUE_SIZE):
+        if configuration["representation_type"] != "histogram":
+            raise NutException(color_error_string(f"Only the histogram can be computed online, not "
+                                                  f"[{configuration['representation_type']}]!"))
+        self.context = context
+        self.metrics = metrics
+        self.delta_t_ms = int(configuration["delta_t_ms"])
+        self.normalize = bool(configuration.get("normalize", False))
+        self.representation = Histogram(height=height, width=width, normalize=False)
+        self.frames_per_window = max(1, int(round(self.delta_t_ms / 1000 / context.carla_tick)))
+        self.number_of_windows = len(range(0, context.frames_to_take, context.disparity_frames_step))
+        self.file_path = os.path.join(context.where_to_save, f"{left_right}_histogram_{self.delta_t_ms}.h5")
+        self.temporary_file_path = os.path.join(context.where_to_save,
+                                                f".{left_right}_histogram_{self.delta_t_ms}.tmp.h5")
+
+        self.start_frame = None
+        self.timestamps = np.zeros(self.number_of_windows, dtype=np.int64)
+        self.written = np.zeros(self.number_of_windows, dtype=bool)
+        self._partials = deque()
+        self._running_sum = np.zeros((2, height, width), dtype=np.float32)
+        self._queue = queue.Queue(maxsize=maximum_queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, frame: int, timestamp: int, x: np.ndarray, y: np.ndarray, t: np.ndarray, p: np.ndarray):
+        """
+        Called by the sensor callback, it waits only if the worker is maximum_queue_size frames behind.
+        """
+        try:
+            self._queue.put_nowait((frame, timestamp, x, y, t, p))
+        except queue.Full:
+            self.metrics.queue_full += 1
+            self._queue.put((frame, timestamp, x, y, t, p))
+
+    def _get_position(self, frame: int):
+        """
+        :return: the row of the window that ends at frame, None if it is not kept
+        """
+        # The start frame is given by take_data at the first frame of the capture (the warm up is never kept)
+        if self.start_frame is None:
+            self.start_frame = self.context.start_frame
+            if self.start_frame is None:
+                return None
+        position, phase = divmod(frame - self.start_frame, self.context.disparity_frames_step)
+        if phase != 0 or not 0 <= position < self.number_of_windows:
+            return None
+        return position
+
+    def _run(self):
+        try:
+            with h5py.File(self.temporary_file_path, "w") as temporary_file:
+                windows = temporary_file.create_dataset("histogram",
+                                                        shape=(self.number_of_windows, ) + self._running_sum.shape,
+                                                        chunks=(1, ) + self._running_sum.shape, dtype=np.float32,
+                                                        compression="gzip")
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    frame, timestamp, x, y, t, p = item
+                    partial = self.representation.convert_batch(x, y, p, t, [0], [t.shape[0]])[0]
+                    # The partials of the frames that are out of the window are removed from the running sum (with
+                    # the frames that were never received the window is shorter, but never wrong)
+                    while len(self._partials) > 0 and self._partials[0][0] <= frame - self.frames_per_window:
+                        self._running_sum -= self._partials.popleft()[1]
+                    self._partials.append((frame, partial))
+                    self._running_sum += partial
+                    position = self._get_position(frame)
+                    if position is None:
+                        continue
+                    window = self._running_sum[None].copy()
+                    if self.normalize:
+                        window = normalize_batch(window, "numpy")
+                    windows[position] = window[0]
+                    self.timestamps[position] = timestamp
+                    self.written[position] = True
+        except Exception as e:
+            self._error = e
+            # The queue is bounded, so it is emptied anyway or the callback would wait forever
+            while self._queue.get() is not None:
+                pass
+
+    def finalize(self, starting_time: int):
+        """
+        Waits for the worker, checks that all the windows were written and adds their timestamps.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise NutException(color_error_string(f"Online histogram failed: {self._error}"))
+        if not self.written.all():
+            missing_frame = self.context.start_frame + int(np.argmin(self.written)) * self.context.disparity_frames_step
+            raise NutException(color_error_string(f"Online histogram of frame {missing_frame} is missing!"))
+        with h5py.File(self.temporary_file_path, "a") as f:
+            f.create_dataset("timestamps", data=self.timestamps - int(starting_time))
+        os.replace(self.temporary_file_path, self.file_path)
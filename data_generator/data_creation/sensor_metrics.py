@@ -0,0 +1,128 @@
+import json
+import time
+from bisect import bisect_left
+
+from tabulate import tabulate
+
+# Upper edges of the buckets (the last bucket has no upper edge)
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000]
+FRAME_DELTA_BUCKETS = [0, 1, 2, 3, 5, 10, 25, 100]
+
+
+class FixedBucketHistogram:
+    """
+    Constant memory and O(log(buckets)) add, so it can be updated in the Carla's callbacks.
+    """
+
+    def __init__(self, bucket_edges):
+        self.bucket_edges = list(bucket_edges)
+        self.counts = [0] * (len(self.bucket_edges) + 1)
+        self.count = 0
+        self.total = 0.
+        self.maximum = None
+
+    def add(self, value):
+        # The bucket i has the values in (edge_i-1, edge_i]
+        self.counts[bisect_left(self.bucket_edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def get_percentile(self, q: float):
+        """
+        :return: the upper edge of the bucket of the q-th percentile (never more than the maximum)
+        """
+        if self.count == 0:
+            return None
+        target = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count > 0:
+                return min(self.bucket_edges[i], self.maximum) if i < len(self.bucket_edges) else self.maximum
+        return self.maximum
+
+    def to_dict(self):
+        return {
+            "bucket_edges": self.bucket_edges,
+            "counts": self.counts,
+            "count": self.count,
+            "mean": self.total / self.count if self.count > 0 else None,
+            "maximum": self.maximum,
+        }
+
+
+class SensorMetrics:
+    """
+    What a sensor did during a capture: callback latency, distance in frames between two callbacks, number of gaps
+    (consecutive frames reset), encode/write time, bytes written, how many times its callback found the queue of its
+    background thread full and the time of its check and finalize.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.callback_latency_ms = FixedBucketHistogram(LATENCY_BUCKETS_MS)
+        self.frame_deltas = FixedBucketHistogram(FRAME_DELTA_BUCKETS)
+        self.encode_time_ms = FixedBucketHistogram(LATENCY_BUCKETS_MS)
+        self.frames = 0
+        self.gaps = 0
+        self.bytes_written = 0
+        self.queue_full = 0
+        self.check_seconds = None
+        self.finalize_seconds = None
+
+    def add_callback(self, start: float, frame_delta):
+        """
+        :param start: time.perf_counter() at the beginning of the callback
+        :param frame_delta: frames since the previous callback (None for the first one)
+        """
+        self.callback_latency_ms.add((time.perf_counter() - start) * 1000)
+        self.frames += 1
+        if frame_delta is not None:
+            self.frame_deltas.add(frame_delta)
+
+    def add_encode(self, start: float, bytes_written: int):
+        self.encode_time_ms.add((time.perf_counter() - start) * 1000)
+        self.bytes_written += int(bytes_written)
+
+    def to_dict(self):
+        return {
+            "frames": self.frames,
+            "gaps": self.gaps,
+            "bytes_written": self.bytes_written,
+            "queue_full": self.queue_full,
+            "callback_latency_ms": self.callback_latency_ms.to_dict(),
+            "frame_deltas": self.frame_deltas.to_dict(),
+            "encode_time_ms": self.encode_time_ms.to_dict(),
+            "check_seconds": self.check_seconds,
+            "finalize_seconds": self.finalize_seconds,
+        }
+
+
+def write_sensors_metrics(sensors_metrics, metrics_file_path: str):
+    with open(metrics_file_path, "w", encoding="utf-8") as metrics_file:
+        json.dump({metrics.name: metrics.to_dict() for metrics in sensors_metrics}, metrics_file, indent=4)
+
+
+def get_sensors_metrics_table(sensors_metrics):
+    def format_ms(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    a_table_head = ["Sensor", "Frames", "Gaps", "Max frame delta", "Callback p50/p99/max [ms]",
+                    "Encode p50/p99/max [ms]", "Written [MB]", "Check/finalize [s]"]
+    a_table = []
+    for metrics in sensors_metrics:
+        a_table.append([
+            metrics.name, metrics.frames, metrics.gaps,
+            "-" if metrics.frame_deltas.maximum is None else metrics.frame_deltas.maximum,
+            "/".join(format_ms(v) for v in [metrics.callback_latency_ms.get_percentile(50),
+                                            metrics.callback_latency_ms.get_percentile(99),
+                                            metrics.callback_latency_ms.maximum]),
+            "/".join(format_ms(v) for v in [metrics.encode_time_ms.get_percentile(50),
+                                            metrics.encode_time_ms.get_percentile(99),
+                                            metrics.encode_time_ms.maximum]),
+            f"{metrics.bytes_written / 1e6:.1f}",
+            "/".join("-" if v is None else f"{v:.2f}" for v in [metrics.check_seconds, metrics.finalize_seconds]),
+        ])
+    return tabulate(a_table, headers=a_table_head, tablefmt="grid")
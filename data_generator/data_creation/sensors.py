@@ -0,0 +1,485 @@
+import os
+import time
+from abc import ABC, abstractmethod
+import json
+import shutil
+import zlib
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+
+from ..utils import color_info_string
+from .call_back import Callbacks
+from .events import Events
+from .async_writer import AsyncWriter
+from .sensor_metrics import SensorMetrics
+from .online_representation import OnlineHistogram
+from ..utils import NutException, color_error_string
+
+
+# Elements of a chunk of the gzip datasets of the events h5 files, and their gzip level (the default of h5py)
+EVENTS_H5_CHUNK_SIZE = 1 << 14
+EVENTS_H5_GZIP_LEVEL = 4
+
+
+def create_gzip_dataset(h5_file, name: str, data: np.ndarray, chunk_size: int = EVENTS_H5_CHUNK_SIZE,
+                        level: int = EVENTS_H5_GZIP_LEVEL):
+    """
+    As h5_file.create_dataset(name, data=data, compression="gzip"), but the chunks are compressed here with zlib, that
+    (unlike h5py, that holds a global lock) lets the other threads run, so many sensors can write at the same time.
+    """
+    data = np.ascontiguousarray(data)
+    if data.size == 0:
+        return h5_file.create_dataset(name, data=data, compression="gzip", compression_opts=level)
+    chunk_size = min(chunk_size, data.size)
+    dataset = h5_file.create_dataset(name, shape=data.shape, dtype=data.dtype, chunks=(chunk_size, ),
+                                     compression="gzip", compression_opts=level)
+    for offset in range(0, data.size, chunk_size):
+        chunk = data[offset:offset + chunk_size]
+        if chunk.size < chunk_size:
+            # The last chunk is stored at full size as HDF5 does
+            chunk = np.concatenate([chunk, np.zeros(chunk_size - chunk.size, dtype=data.dtype)])
+        dataset.id.write_direct_chunk((offset, ), zlib.compress(chunk.tobytes(), level))
+    return dataset
+
+
+class CaptureContext:
+    """
+    Everything of the capture that the sensors need.
+    """
+
+    def __init__(self, carla, world, hero, sensors_json, where_to_save, frames_to_take, disparity_frames_step):
+        self.carla = carla
+        self.world = world
+        self.bp_lib = world.get_blueprint_library()
+        self.hero = hero
+        self.sensors_json = sensors_json
+        self.carla_tick = sensors_json["carla_tick"]
+        self.where_to_save = where_to_save
+        self.frames_to_take = frames_to_take
+        self.disparity_frames_step = disparity_frames_step
+        # Set by take_data at the first frame of the capture
+        self.start_frame = None
+
+
+class SensorDataCopy:
+    """
+    Copy of the fields of a Carla's sensor data that the callbacks use, so it can be encoded in another thread after
+    that Carla has released the original.
+    """
+
+    def __init__(self, data):
+        self.frame = data.frame
+        self.timestamp = data.timestamp
+        self.width = getattr(data, "width", None)
+        self.height = getattr(data, "height", None)
+        self.fov = getattr(data, "fov", None)
+        self.raw_data = np.frombuffer(data.raw_data, dtype=np.uint8).copy()
+
+
+# Sensor class name -> sensor class
+SENSOR_CLASSES = {}
+# Blue print name -> (default sensor class name, default callback name), sensors.json can override both with the
+# "sensor_class" and "callback" keys
+SENSOR_REGISTRY = {}
+
+
+def register_sensor_class(sensor_class):
+    SENSOR_CLASSES[sensor_class.__name__] = sensor_class
+    return sensor_class
+
+
+def register_blue_print(blue_print_name: str, sensor_class_name: str, callback_name: str):
+    SENSOR_REGISTRY[blue_print_name] = (sensor_class_name, callback_name)
+
+
+def create_sensor(sensor_cfg, context: CaptureContext):
+    """
+    :return: the sensor of a sensors.json entry, None if its blue print has no registered sensor
+    """
+    if "sensor_class" not in sensor_cfg and sensor_cfg["blue_print_name"] not in SENSOR_REGISTRY:
+        print(color_error_string(f"No sensor is registered for {sensor_cfg['blue_print_name']}, "
+                                 f"[{sensor_cfg['friendly_name']}] is skipped!"))
+        return None
+    sensor_class_name, callback_name = SENSOR_REGISTRY.get(sensor_cfg["blue_print_name"], (None, None))
+    sensor_class_name = sensor_cfg.get("sensor_class", sensor_class_name)
+    if sensor_class_name not in SENSOR_CLASSES:
+        raise NutException(color_error_string(f"Unknown sensor class [{sensor_class_name}]!"))
+    sensor_cfg = dict(sensor_cfg)
+    sensor_cfg.setdefault("callback", callback_name)
+    return SENSOR_CLASSES[sensor_class_name](sensor_cfg, context)
+
+
+class MyCarlaSensors(ABC):
+    def __init__(self, sensor_cfg, context: CaptureContext):
+        carla = context.carla
+        self.context = context
+        self.friendly_name = sensor_cfg["friendly_name"]
+        self.callback_function_name = sensor_cfg["callback"]
+
+        self.amount_of_frame_after_we_save = int(sensor_cfg["attributes"]["sensor_tick"] / context.carla_tick)
+        print(f"{self.friendly_name} we save after {self.amount_of_frame_after_we_save:.2f} frames!"
+              f" [{1 / sensor_cfg['attributes']['sensor_tick']:.2f} fps]")
+
+        blue_print = context.bp_lib.find(sensor_cfg["blue_print_name"])
+        attributes = sensor_cfg["attributes"]
+        for attribute_name in attributes:
+            blue_print.set_attribute(attribute_name, str(attributes[attribute_name]))
+        location = sensor_cfg["location"]
+        transformation = carla.Transform(
+            carla.Location(x=location["x"], y=location["y"], z=location["z"]),
+            carla.Rotation(pitch=location["pitch"], roll=location["roll"], yaw=location["yaw"]))
+
+        self.start_frame = None
+        self.last_frame = None
+        self.consecutive_frames = None
+        self.frames_to_take = int(context.frames_to_take /
+                                  (sensor_cfg["attributes"]["sensor_tick"] / context.carla_tick))
+        self.check_result = sensor_cfg["check_result"]
+        self.metrics = SensorMetrics(self.friendly_name)
+        self.actor = context.world.spawn_actor(blue_print, transformation, attach_to=context.hero)
+        self.actor.listen(lambda data: self.measured_callback(data))
+
+    def measured_callback(self, data):
+        start = time.perf_counter()
+        frame_delta = None if self.last_frame is None else data.frame - self.last_frame
+        self.callback(data)
+        self.metrics.add_callback(start, frame_delta)
+
+    @abstractmethod
+    def callback(self, data):
+        if self.last_frame is None:
+            self.last_frame = data.frame
+            self.consecutive_frames = 1
+        elif data.frame - self.last_frame == self.amount_of_frame_after_we_save:
+            self.last_frame = data.frame
+            self.consecutive_frames += 1
+        else:
+            self.last_frame = data.frame
+            self.consecutive_frames = 1
+            self.metrics.gaps += 1
+
+    def check_consecutive_frames(self):
+        if self.consecutive_frames < self.frames_to_take:
+            raise NutException(f"The sensor {self.friendly_name} has received {self.consecutive_frames} consecutive"
+                               f" frames but we were asking {self.frames_to_take}!")
+
+    def get_saved_frames(self):
+        """
+        :return: the Carla's frames of the sequence that this sensor saves
+        """
+        return range(self.start_frame, self.start_frame + self.context.frames_to_take,
+                     self.amount_of_frame_after_we_save)
+
+    def get_frame_counts(self):
+        return {}
+
+    def shutdown(self):
+        self.actor.stop()
+        self.actor.destroy()
+
+
+@register_sensor_class
+class PngSensor(MyCarlaSensors):
+    """
+    A file for each frame, encoded and written by the callback (in the sensor's AsyncWriter thread).
+    """
+    file_extension = ".png"
+
+    def __init__(self, sensor_cfg, context: CaptureContext):
+        self.timestamp_dict = {}
+
+        if sensor_cfg["check_result"]:
+            self.data_folder_path = os.path.join(context.where_to_save, sensor_cfg["data_folder_name"])
+            os.mkdir(self.data_folder_path)
+        self.raw_data_folder_path = os.path.join(context.where_to_save, "raw_" + sensor_cfg["data_folder_name"])
+        os.mkdir(self.raw_data_folder_path)
+        self.timestamps_path = os.path.join(context.where_to_save, f"{sensor_cfg['friendly_name']}_timestamps.json")
+
+        self.timestamps_to_save = []
+        self.save_timestamps = sensor_cfg.get("save_timestamps", False)
+        self.writer = AsyncWriter(sensor_cfg["friendly_name"])
+        super().__init__(sensor_cfg, context)
+
+    def callback(self, data):
+        self.writer.submit(self.encode, SensorDataCopy(data))
+        # Let's save the timestamp in nanoseconds
+        self.timestamp_dict[int(data.frame)] = int(data.timestamp * 10 ** 9)
+        super().callback(data)
+
+    def encode(self, data):
+        start = time.perf_counter()
+        getattr(Callbacks, self.callback_function_name)(data, self.raw_data_folder_path)
+        file_path = os.path.join(self.raw_data_folder_path, f"{data.frame:05d}{self.file_extension}")
+        self.metrics.add_encode(start, os.path.getsize(file_path) if os.path.isfile(file_path) else 0)
+
+    def check_data(self):
+        # Let's wait that all the files get saved!
+        self.writer.flush()
+        if self.check_result:
+            print(f"[{self.friendly_name}] Checking that I have enough consecutive frames!")
+            self.check_consecutive_frames()
+            # Let's get all the files names in the directory
+            extension_length = len(self.file_extension)
+            all_frames_file_name = {int(file_name[:-extension_length]): file_name
+                                    for file_name in os.listdir(str(self.raw_data_folder_path))
+                                    if file_name[-extension_length:] == self.file_extension}
+            for i in self.get_saved_frames():
+                # Let's check that the file is really there
+                try:
+                    file_name = all_frames_file_name[i]
+                except KeyError:
+                    error_str = f"Frame {i} is missing in {self.raw_data_folder_path}\n"
+                    for ii in range(max(i-10*self.amount_of_frame_after_we_save, self.start_frame),
+                                    min(i+10*self.amount_of_frame_after_we_save,
+                                        self.start_frame+self.context.frames_to_take),
+                                    self.amount_of_frame_after_we_save):
+                        if ii in all_frames_file_name.keys():
+                            error_str += f"{ii} : {all_frames_file_name[ii]}\n"
+                        else:
+                            error_str += f"{ii} : MISSING\n"
+                    raise NutException(color_error_string(error_str))
+                # Now we are sure that the file is there so we can move in the final official folder with a proper
+                # normalized name
+                os.rename(os.path.join(str(self.raw_data_folder_path), file_name),
+                          os.path.join(str(self.data_folder_path), f"{i - self.start_frame:04d}{self.file_extension}"))
+                # We save also the timestamp of the frame
+                self.timestamps_to_save.append(self.timestamp_dict[i])
+            # Now we can remove the raw_ folder
+            shutil.rmtree(self.raw_data_folder_path)
+            return self.timestamps_to_save[0]
+        else:
+            return None
+
+    def finalize(self, starting_time):
+        if self.save_timestamps:
+            # There we normalized the timestamps subtracting the starting time
+            print(f"[{self.friendly_name}]  Saving Data Timestamps...")
+            for i in range(len(self.timestamps_to_save)):
+                self.timestamps_to_save[i] -= int(starting_time)
+            # Finally we save the timestamps file
+            with open(os.path.join(self.context.where_to_save, "timestamps.json"), "w",
+                      encoding="utf-8") as json_timestamps_file:
+                json.dump(self.timestamps_to_save, json_timestamps_file, indent=4)
+
+    def get_frame_counts(self):
+        if self.check_result:
+            return {self.friendly_name: len(self.timestamps_to_save)}
+        return {}
+
+    def shutdown(self):
+        super().shutdown()
+        self.writer.close()
+
+
+@register_sensor_class
+class NpySensor(PngSensor):
+    """
+    As PngSensor, but the callback writes a .npy file for each frame (e.g. the float16 optical flow).
+    """
+    file_extension = ".npy"
+
+
+@register_sensor_class
+class LidarSensor(MyCarlaSensors):
+    """
+    All the sweeps are appended (by the AsyncWriter thread) to a single binary file of float32 (x, y, z, intensity)
+    points. At the end points.bin keeps only the sweeps of the sequence and index.json has their offset (in points),
+    number of points and timestamp.
+    """
+
+    def __init__(self, sensor_cfg, context: CaptureContext):
+        self.data_folder_path = os.path.join(context.where_to_save, sensor_cfg.get("data_folder_name", "lidar"))
+        os.mkdir(self.data_folder_path)
+        self.raw_points_path = os.path.join(self.data_folder_path, "raw_points.bin")
+        self.raw_points_file = open(self.raw_points_path, "wb")
+        # Carla's frame -> (offset in bytes in raw_points.bin, number of points)
+        self.sweeps = {}
+        self.timestamp_dict = {}
+        self.index = []
+        self.writer = AsyncWriter(sensor_cfg["friendly_name"])
+        super().__init__(sensor_cfg, context)
+
+    def callback(self, data):
+        self.writer.submit(self.append_a_sweep, SensorDataCopy(data))
+        self.timestamp_dict[int(data.frame)] = int(data.timestamp * 10 ** 9)
+        super().callback(data)
+
+    def append_a_sweep(self, data):
+        start = time.perf_counter()
+        offset = self.raw_points_file.tell()
+        number_of_points = getattr(Callbacks, self.callback_function_name)(data, self.raw_points_file)
+        self.sweeps[int(data.frame)] = (offset, number_of_points)
+        self.metrics.add_encode(start, number_of_points * 16)
+
+    def check_data(self):
+        self.writer.flush()
+        self.raw_points_file.close()
+        if self.check_result:
+            print(f"[{self.friendly_name}] Checking that I have enough consecutive frames!")
+            self.check_consecutive_frames()
+        saved_frames = [i for i in self.get_saved_frames() if i in self.sweeps]
+        if self.check_result and len(saved_frames) < len(self.get_saved_frames()):
+            missing = sorted(set(self.get_saved_frames()) - set(saved_frames))
+            raise NutException(color_error_string(f"[{self.friendly_name}] {len(missing)} sweeps are missing"
+                                                  f" (first: {missing[0]})!"))
+        self.index = [{"frame": i - self.start_frame, "carla_frame": i} for i in saved_frames]
+        if len(saved_frames) == 0 or not self.check_result:
+            return None
+        return self.timestamp_dict[saved_frames[0]]
+
+    def finalize(self, starting_time):
+        start = time.time()
+        points_path = os.path.join(self.data_folder_path, "points.bin")
+        if len(self.index) > 0:
+            # The sweeps are appended in order, so the ones of the sequence are a single range of the raw file
+            first_byte = min(self.sweeps[sweep["carla_frame"]][0] for sweep in self.index)
+            last_byte = max(self.sweeps[sweep["carla_frame"]][0] + self.sweeps[sweep["carla_frame"]][1] * 16
+                            for sweep in self.index)
+            with open(self.raw_points_path, "rb") as raw_points_file, open(points_path, "wb") as points_file:
+                raw_points_file.seek(first_byte)
+                remaining = last_byte - first_byte
+                while remaining > 0:
+                    chunk = raw_points_file.read(min(remaining, 1 << 24))
+                    points_file.write(chunk)
+                    remaining -= len(chunk)
+            for sweep in self.index:
+                offset, number_of_points = self.sweeps[sweep["carla_frame"]]
+                sweep["offset"] = (offset - first_byte) // 16
+                sweep["number_of_points"] = number_of_points
+                sweep["timestamp"] = self.timestamp_dict[sweep["carla_frame"]] - int(starting_time)
+        else:
+            open(points_path, "wb").close()
+        os.remove(self.raw_points_path)
+        with open(os.path.join(self.data_folder_path, "index.json"), "w", encoding="utf-8") as index_file:
+            json.dump({"fields": ["x", "y", "z", "intensity"], "dtype": "float32", "sweeps": self.index},
+                      index_file, indent=4)
+        print(f"[{self.friendly_name}]  Saved {len(self.index)} sweeps in {time.time() - start:.2f} s!")
+
+    def get_frame_counts(self):
+        return {f"{self.friendly_name}_sweeps": len(self.index)}
+
+    def shutdown(self):
+        super().shutdown()
+        self.writer.close()
+
+
+@register_sensor_class
+class EventSensor(MyCarlaSensors):
+    def __init__(self, sensor_cfg, context: CaptureContext):
+        self.events = Events()
+        # "side" can be missing in the old sensors.json, then it is guessed from the name
+        left_right = sensor_cfg.get("side", "left" if "Left" in sensor_cfg["friendly_name"] else "right")
+        assert left_right in ["left", "right"]
+        self.h5_file_path = os.path.join(context.where_to_save, f"{left_right}.h5")
+        self.data = {
+            "x": {}, "y": {}, "t": {}, "p": {}
+        }
+        self.starting_times = []
+        # A test to see if create_ms_to_index is correct!
+        # example_t = np.array([0, 500, 2100, 5000, 5000, 5200, 7100, 7200, 7200, 8100, 8500, 9300])
+        # self.create_ms_to_index(example_t, 10)
+        self.data_to_save = None
+        self.number_of_events = 0
+        # Optionally a representation is accumulated (off this thread) while the events arrive, it needs the metrics
+        # so it is created after the actor (its first frames are warm up, they are never kept)
+        self.online_representation = None
+        super().__init__(sensor_cfg, context)
+        if "online_representation" in sensor_cfg:
+            self.online_representation = OnlineHistogram(sensor_cfg["online_representation"],
+                                                         height=int(sensor_cfg["attributes"]["image_size_y"]),
+                                                         width=int(sensor_cfg["attributes"]["image_size_x"]),
+                                                         context=context, left_right=left_right,
+                                                         metrics=self.metrics)
+
+    def callback(self, data):
+        getattr(Callbacks, self.callback_function_name)(    data,
+                                                            self.data,
+                                                            self.starting_times
+                                                        )
+        self.number_of_events += len(self.data["t"][int(data.frame)])
+        if self.online_representation is not None:
+            frame = int(data.frame)
+            self.online_representation.add(frame, int(data.timestamp * 10 ** 9),
+                                           self.data["x"][frame], self.data["y"][frame],
+                                           self.data["t"][frame], self.data["p"][frame])
+        super().callback(data)
+
+    @staticmethod
+    def create_ms_to_index(t, total_num_of_ms):
+        """
+        :return: for each ms, the index of the first event with t >= ms (in ns)
+        """
+        # The first index with t >= ms is also the first one where the running maximum of t is >= ms, and the running
+        # maximum is sorted (so it is the same also if the events are not perfectly sorted)
+        ms_to_idx = np.searchsorted(np.maximum.accumulate(t), np.arange(total_num_of_ms, dtype=np.int64) * 1000000,
+                                    side="left").astype(np.int64)
+        if total_num_of_ms > 0 and ms_to_idx[-1] >= len(t):
+            raise NutException(color_error_string(f"There are no events after "
+                                                  f"{np.argmax(ms_to_idx >= len(t))} ms!"))
+
+        print("ms_to_idx: ")
+        print(ms_to_idx[:30])
+        print(ms_to_idx[-30:])
+
+        return ms_to_idx
+
+    def check_data(self):
+        print(f"[{self.friendly_name}] Checking Data...")
+        self.data_to_save = {
+            array_name: [] for array_name in self.data
+        }
+        # We check that all the frames were there
+        # Plus and minus  2 because are events we want a little bit of margin
+        for i in range(self.start_frame - 5, self.start_frame + self.frames_to_take + 5):
+            for array_name in self.data_to_save :
+                try:
+                    self.data_to_save[array_name].append(self.data[array_name][i])
+                except KeyError:
+                    error_str = f"[{self.friendly_name}] Frame {i} is missing\n"
+                    raise NutException(color_error_string(error_str))
+        # We concatenate all the data
+        for array_name in self.data_to_save:
+            self.data_to_save[array_name] = np.concatenate(self.data_to_save[array_name])
+
+        print(f"[{self.friendly_name}] I have got {self.data_to_save['t'].size} events in {self.frames_to_take} frames."
+              f" [{self.data_to_save['t'].size/self.frames_to_take:.1f} events per frame]")
+        return self.data_to_save["t"][0]
+
+    def finalize(self, starting_time):
+        # There we normalized the timestamps subtracting the starting time
+        self.data_to_save["t"] -= starting_time
+        # We calculate the total number of ms
+        total_num_of_ms = int(self.frames_to_take / (1/self.context.carla_tick) * 1000)
+        # We compute the ms_to_index vector
+        ms_to_idx = self.create_ms_to_index(self.data_to_save["t"], total_num_of_ms+70)
+
+        # Finally we save the h5 file
+        start = time.time()
+        encode_start = time.perf_counter()
+        with h5py.File(self.h5_file_path, "w") as f:
+            for array_name in self.data_to_save:
+                create_gzip_dataset(f, array_name, self.data_to_save[array_name])
+            f.create_dataset("ms_to_idx",
+                             data=ms_to_idx,
+                             )
+        self.metrics.add_encode(encode_start, os.path.getsize(self.h5_file_path))
+        time_needed = time.time() - start
+        print(f"[{self.friendly_name}]  Saved h5 file in {time_needed:.2f} s!")
+
+        if self.online_representation is not None:
+            start = time.time()
+            self.online_representation.finalize(starting_time)
+            print(f"[{self.friendly_name}]  Saved online representation in {time.time() - start:.2f} s!")
+
+    def get_frame_counts(self):
+        return {f"{self.friendly_name}_events": int(self.data_to_save["t"].size)}
+
+
+register_blue_print("sensor.camera.depth", "PngSensor", "depth_callback")
+register_blue_print("sensor.camera.rgb", "PngSensor", "rgb_callback")
+register_blue_print("sensor.camera.semantic_segmentation", "PngSensor", "semantic_callback")
+register_blue_print("sensor.camera.optical_flow", "NpySensor", "optical_flow_callback")
+register_blue_print("sensor.lidar.ray_cast", "LidarSensor", "lidar_points_callback")
+register_blue_print("sensor.camera.dvs", "EventSensor", "event_callback")
@@ -0,0 +1,101 @@
+class SequenceStatistics:
+    """
+    Cheap statistics of the capture (hero speed from its transform in the world snapshots, DVS events per frame),
+    updated at every tick, to reject early the sequences that are not worth their checks and writes.
+    """
+
+    def __init__(self, hero, event_sensors, carla_tick: float):
+        self.hero_id = hero.id
+        self.event_sensors = list(event_sensors)
+        self.carla_tick = carla_tick
+        self.frames = 0
+        self.hero_distance = 0.
+        self.last_location = None
+        self.first_number_of_events = {}
+
+    def start(self):
+        """
+        Called when the capture starts, so the warm up frames are not counted.
+        """
+        self.frames = 0
+        self.hero_distance = 0.
+        self.last_location = None
+        self.first_number_of_events = {a_sensor.friendly_name: a_sensor.number_of_events
+                                       for a_sensor in self.event_sensors}
+
+    def update(self, world_snapshot):
+        """
+        :param world_snapshot: what world.wait_for_tick() returns (reading it does not need a call to the server)
+        """
+        self.frames += 1
+        hero_snapshot = world_snapshot.find(self.hero_id)
+        if hero_snapshot is None:
+            return
+        location = hero_snapshot.get_transform().location
+        if self.last_location is not None:
+            self.hero_distance += location.distance(self.last_location)
+        self.last_location = location
+
+    def get_hero_mean_speed(self):
+        """
+        :return: m/s
+        """
+        if self.frames < 2:
+            return None
+        return self.hero_distance / ((self.frames - 1) * self.carla_tick)
+
+    def get_events_per_frame(self):
+        """
+        :return: the events per frame of each DVS camera (since start)
+        """
+        if self.frames == 0:
+            return {}
+        return {a_sensor.friendly_name: (a_sensor.number_of_events -
+                                         self.first_number_of_events.get(a_sensor.friendly_name, 0)) / self.frames
+                for a_sensor in self.event_sensors}
+
+    def get_rejection_reason(self, minimum_hero_mean_speed=None, minimum_events_per_frame=None):
+        """
+        :param minimum_hero_mean_speed: m/s, None to not check it
+        :param minimum_events_per_frame: of the busiest DVS camera, None to not check it
+        :return: None if the sequence is worth it, otherwise why it is rejected
+        """
+        hero_mean_speed = self.get_hero_mean_speed()
+        if minimum_hero_mean_speed is not None and hero_mean_speed is not None \
+                and hero_mean_speed < minimum_hero_mean_speed:
+            return f"hero mean speed {hero_mean_speed:.2f} m/s < {minimum_hero_mean_speed} m/s"
+        events_per_frame = self.get_events_per_frame()
+        if minimum_events_per_frame is not None and len(events_per_frame) > 0 \
+                and max(events_per_frame.values()) < minimum_events_per_frame:
+            return f"{max(events_per_frame.values()):.0f} DVS events per frame < {minimum_events_per_frame}"
+        return None
+
+    def get_early_rejection_reason(self, maximum_hero_distance=None, maximum_events_per_frame=None):
+        """
+        Stricter than get_rejection_reason, to stop a capture before its end: all the given thresholds must be met.
+        :param maximum_hero_distance: m, None to not check it
+        :param maximum_events_per_frame: of the busiest DVS camera, None to not check it
+        :return: None if the capture has to go on, otherwise why it is rejected
+        """
+        reasons = []
+        if maximum_hero_distance is not None:
+            if self.frames < 2 or self.hero_distance > maximum_hero_distance:
+                return None
+            reasons.append(f"hero moved {self.hero_distance:.2f} m <= {maximum_hero_distance} m")
+        if maximum_events_per_frame is not None:
+            events_per_frame = self.get_events_per_frame()
+            if len(events_per_frame) == 0 or max(events_per_frame.values()) > maximum_events_per_frame:
+                return None
+            reasons.append(f"{max(events_per_frame.values()):.0f} DVS events per frame <= {maximum_events_per_frame}")
+        if len(reasons) == 0:
+            return None
+        return f"after {self.frames} frames " + " and ".join(reasons)
+
+    def to_dict(self):
+        hero_mean_speed = self.get_hero_mean_speed()
+        return {
+            "frames": self.frames,
+            "hero_distance_m": round(self.hero_distance, 3),
+            "hero_mean_speed_m_per_s": None if hero_mean_speed is None else round(hero_mean_speed, 3),
+            "events_per_frame": {name: round(value, 1) for name, value in self.get_events_per_frame().items()},
+        }
@@ -2,26 +2,25 @@ import sys
 import os
 import signal
 import time
-from abc import ABC, abstractmethod
 import json
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-import h5py
-import numpy
-import numpy as np
-from numpy import dtype
 from tabulate import tabulate
 from tqdm import tqdm
 
-from ..utils import  color_info_string
-from .weather import get_a_random_weather
-from .call_back import Callbacks
-from .events import Events
-from ..utils import NutException, color_error_string
+from .. import config
+from ..utils import  color_info_string, color_error_string
+from .weather import get_a_random_weather, get_weather
+from .sensors import CaptureContext, create_sensor
+from .sensor_metrics import write_sensors_metrics, get_sensors_metrics_table
+from .sequence_statistics import SequenceStatistics
+from ..manifest import SEQUENCE_METADATA_FILE_NAME, SEQUENCE_METRICS_FILE_NAME
+from ..metrics_exporter import MetricsTextFile
 
 def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking_data_event,
               where_to_save, sensors_json, tm_ready_to_warm_up, tm_ready_to_take_data, dt_ready_to_warm_up,
-              dt_ready_to_take_data, dt_want_to_stop_taking_data, warm_up_frames, frames_to_take):
+              dt_ready_to_take_data, dt_want_to_stop_taking_data, warm_up_frames, frames_to_take,
+              metrics_file_path=None, metrics_labels=None, weather_dict=None, reject_low_value_sequences=False):
     sys.path.append(carla_egg_path)
     try:
         import carla
@@ -59,10 +58,12 @@ def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking
     # To have an optimal physical simulation,
     # the substep delta time should at least be below 0.01666 and ideally below 0.01.
     world.apply_settings(settings)
-    bp_lib = world.get_blueprint_library()
 
-    # (3) Let's set random weather
-    a_random_weather, weather_dict = get_a_random_weather()
+    # (3) Let's set the weather of the scenario (or a random one)
+    if weather_dict is None:
+        a_random_weather, weather_dict = get_a_random_weather()
+    else:
+        a_random_weather = get_weather(weather_dict)
     print("WEATHER:")
     a_table_head = ["Weather Parameter", "Value"]
     a_table = []
@@ -74,220 +75,56 @@ def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking
     # (4) Let's add all the sensor in the sensor.json file!
     print(f"Simulation at {1/carla_tick:.1f} frames per second")
 
-    # (5) Let's define some sensor Class
-    class MyCarlaSensors(ABC):
-        def __init__(self, sensor_cfg):
-            self.friendly_name = sensor_cfg["friendly_name"]
-            self.callback_function_name = sensor_cfg["callback"]
-
-            self.amount_of_frame_after_we_save = int(sensor_cfg["attributes"]["sensor_tick"] / carla_tick)
-            print(f"{self.friendly_name} we save after {self.amount_of_frame_after_we_save:.2f} frames!"
-                  f" [{1 / sensor_cfg['attributes']['sensor_tick']:.2f} fps]")
-
-            blue_print = bp_lib.find(sensor_cfg["blue_print_name"])
-            attributes = sensor_cfg["attributes"]
-            for attribute_name in attributes:
-                blue_print.set_attribute(attribute_name, str(attributes[attribute_name]))
-            location = sensor_cfg["location"]
-            transformation = carla.Transform(
-                carla.Location(x=location["x"], y=location["y"], z=location["z"]),
-                carla.Rotation(pitch=location["pitch"], roll=location["roll"], yaw=location["yaw"]))
-
-            self.actor = world.spawn_actor(blue_print, transformation, attach_to=hero)
-            self.actor.listen(lambda data: self.callback(data))
-            self.start_frame = None
-            self.last_frame = None
-            self.consecutive_frames = None
-            self.frames_to_take = int(frames_to_take /
-                                      (sensor_cfg["attributes"]["sensor_tick"] / sensors_json["carla_tick"]))
-            self.check_result = sensor_cfg["check_result"]
-
-        @abstractmethod
-        def callback(self, data):
-            if self.last_frame is None:
-                self.last_frame = data.frame
-                self.consecutive_frames = 1
-            elif data.frame - self.last_frame == self.amount_of_frame_after_we_save:
-                self.last_frame = data.frame
-                self.consecutive_frames += 1
-            else:
-                self.last_frame = data.frame
-                self.consecutive_frames = 1
-
-        def shutdown(self):
-            self.actor.stop()
-            self.actor.destroy()
-
-    class PngSensor(MyCarlaSensors):
-        def __init__(self, sensor_cfg):
-            super().__init__(sensor_cfg)
-            self.timestamp_dict = {}
-
-            if self.check_result:
-                self.data_folder_path = os.path.join(where_to_save, sensor_cfg["data_folder_name"])
-                os.mkdir(self.data_folder_path)
-            self.raw_data_folder_path = os.path.join(where_to_save, "raw_" + sensor_cfg["data_folder_name"])
-            os.mkdir(self.raw_data_folder_path)
-            self.timestamps_path = os.path.join(where_to_save, f"{self.friendly_name}_timestamps.json")
-
-            self.timestamps_to_save = []
-            self.save_timestamps = sensor_cfg["save_timestamps"]
-
-
-        def callback(self, data):
-            getattr(Callbacks, self.callback_function_name)(
-                data,
-                self.raw_data_folder_path
-            )
-            # Let's save the timestamp in nanoseconds
-            self.timestamp_dict[int(data.frame)] = int(data.timestamp * 10 ** 9)
-            super().callback(data)
-
-        def check_data(self):
-            if self.check_result:
-                print(f"[{self.friendly_name}] Checking that I have enough consecutive frames!")
-                if self.consecutive_frames < self.frames_to_take:
-                    raise NutException(f"The sensor {self.friendly_name} has received {self.consecutive_frames} consecutive"
-                                       f" frames but we were asking {self.frames_to_take}!")
-                # Let's wait 5 seconds that all the files get correctly saved!
-                for _ in tqdm(range(5), desc=color_info_string(f"[{self.friendly_name}] "
-                                                               f"Wait 5 s that all the file get saved...")):
-                    time.sleep(1)
-                # Let's get all the files names in the directory
-                all_frames_file_name = {int(file_name[:-4]): file_name
-                                        for file_name in os.listdir(str(self.raw_data_folder_path))
-                                        if file_name[-4:] == ".png"}
-                for i in range(self.start_frame, self.start_frame+frames_to_take, self.amount_of_frame_after_we_save):
-                    # Let's check that the file is really there
-                    try:
-                        file_name = all_frames_file_name[i]
-                    except KeyError:
-                        error_str = f"Frame {i} is missing in {self.raw_data_folder_path}\n"
-                        for ii in range(max(i-10*self.amount_of_frame_after_we_save, self.start_frame),
-                                        min(i+10*self.amount_of_frame_after_we_save, self.start_frame+frames_to_take),
-                                        self.amount_of_frame_after_we_save):
-                            if ii in all_frames_file_name.keys():
-                                error_str += f"{ii} : {all_frames_file_name[ii]}\n"
-                            else:
-                                error_str += f"{ii} : MISSING\n"
-                        raise NutException(color_error_string(error_str))
-                    # Now we are sure that the file is there so we can move in the final official folder with a proper
-                    # normalized name
-                    os.rename(os.path.join(str(self.raw_data_folder_path), file_name),
-                              os.path.join(str(self.data_folder_path), f"{i - self.start_frame:04d}.png"))
-                    # We save also the timestamp of the frame
-                    self.timestamps_to_save.append(self.timestamp_dict[i])
-                # Now we can remove the raw_ folder
-                shutil.rmtree(self.raw_data_folder_path)
-                return self.timestamps_to_save[0]
-            else:
-                return None
-
-        def finalize(self, starting_time):
-            if self.save_timestamps:
-                # There we normalized the timestamps subtracting the starting time
-                print(f"[{self.friendly_name}]  Saving Data Timestamps...")
-                for i in range(len(self.timestamps_to_save)):
-                    self.timestamps_to_save[i] -= int(starting_time)
-                # Finally we save the timestamps file
-                with open(os.path.join(where_to_save, "timestamps.json"), "w", encoding="utf-8") as json_timestamps_file:
-                    json.dump(self.timestamps_to_save, json_timestamps_file, indent=4)
-
-    class EventSensor(MyCarlaSensors):
-        def __init__(self, sensor_cfg, left_right: str):
-            super().__init__(sensor_cfg)
-            self.events = Events()
-            assert left_right in ["left", "right"]
-            self.h5_file_path = os.path.join(where_to_save, f"{left_right}.h5")
-            self.data = {
-                "x": {}, "y": {}, "t": {}, "p": {}
-            }
-            self.starting_times = []
-            # A test to see if create_ms_to_index is correct!
-            # example_t = np.array([0, 500, 2100, 5000, 5000, 5200, 7100, 7200, 7200, 8100, 8500, 9300])
-            # self.create_ms_to_index(example_t, 10)
-            self.data_to_save = None
-
-        def callback(self, data):
-            getattr(Callbacks, self.callback_function_name)(    data,
-                                                                self.data,
-                                                                self.starting_times
-                                                            )
-            super().callback(data)
-
-        @staticmethod
-        def create_ms_to_index(t, total_num_of_ms):
-            ms_to_idx = np.zeros(total_num_of_ms, dtype=np.int64)
-            last_idx = 0
-            for i in range(total_num_of_ms):
-                ms = i * 1000000
-                while True:
-                    if t[last_idx] >= ms:
-                        ms_to_idx[i] = last_idx
-                        break
-                    else:
-                        last_idx += 1
-
-            print("ms_to_idx: ")
-            print(ms_to_idx[:30])
-            print(ms_to_idx[-30:])
-
-            return ms_to_idx
-
-        def check_data(self):
-            print(f"[{self.friendly_name}] Checking Data...")
-            self.data_to_save = {
-                array_name: [] for array_name in self.data
-            }
-            # We check that all the frames were there
-            # Plus and minus  2 because are events we want a little bit of margin
-            for i in range(self.start_frame - 5, self.start_frame + self.frames_to_take + 5):
-                for array_name in self.data_to_save :
-                    try:
-                        self.data_to_save[array_name].append(self.data[array_name][i])
-                    except KeyError:
-                        error_str = f"[{self.friendly_name}] Frame {i} is missing\n"
-                        raise NutException(color_error_string(error_str))
-            # We concatenate all the data
-            for array_name in self.data_to_save:
-                self.data_to_save[array_name] = np.concatenate(self.data_to_save[array_name])
-
-            print(f"[{self.friendly_name}] I have got {self.data_to_save['t'].size} events in {self.frames_to_take} frames."
-                  f" [{self.data_to_save['t'].size/self.frames_to_take:.1f} events per frame]")
-            return self.data_to_save["t"][0]
-
-        def finalize(self, starting_time):
-            # There we normalized the timestamps subtracting the starting time
-            self.data_to_save["t"] -= starting_time
-            # We calculate the total number of ms
-            total_num_of_ms = int(self.frames_to_take / (1/carla_tick) * 1000)
-            # We compute the ms_to_index vector
-            ms_to_idx = self.create_ms_to_index(self.data_to_save["t"], total_num_of_ms+70)
-
-            # Finally we save the h5 file
-            start = time.time()
-            with h5py.File(self.h5_file_path, "w") as f:
-                for array_name in self.data_to_save:
-                    f.create_dataset(array_name,
-                                     data=self.data_to_save[array_name],
-                                     compression="gzip",
-                                     )
-                f.create_dataset("ms_to_idx",
-                                 data=ms_to_idx,
-                                 )
-            time_needed = time.time() - start
-            print(f"[{self.friendly_name}]  Saved h5 file in {time_needed:.2f} s!")
-
+    # The frames that become disparity frames (the online representations are aligned to them)
+    timestamps_sensors = [sensor_cfg for sensor_cfg in sensors_json["sensors"] if sensor_cfg.get("save_timestamps")]
+    disparity_frames_step = int(timestamps_sensors[0]["attributes"]["sensor_tick"] / carla_tick) \
+        if len(timestamps_sensors) > 0 else 1
 
+    # (5) Let's create the sensors (see SENSOR_REGISTRY for the supported blue prints)
+    context = CaptureContext(carla, world, hero, sensors_json, where_to_save, frames_to_take, disparity_frames_step)
     sensors = []
     for sensor in sensors_json["sensors"]:
-        if sensor["blue_print_name"] in ["sensor.camera.depth", "sensor.camera.rgb"]:
-            sensors.append(PngSensor(sensor))
-        elif sensor["blue_print_name"] == "sensor.camera.dvs":
-            if "Left" in sensor["friendly_name"]:
-                sensors.append(EventSensor(sensor, left_right="left"))
-            else:
-                sensors.append(EventSensor(sensor, left_right="right"))
+        a_sensor = create_sensor(sensor, context)
+        if a_sensor is not None:
+            sensors.append(a_sensor)
+
+    # The statistics of the capture to reject the sequences that are not worth it (see config.REJECTION_*)
+    statistics = SequenceStatistics(hero, [a_sensor for a_sensor in sensors if hasattr(a_sensor, "number_of_events")],
+                                    carla_tick)
+
+    def get_rejection_reason(early: bool = False):
+        if not reject_low_value_sequences:
+            return None
+        if early:
+            return statistics.get_early_rejection_reason(config.REJECTION_EARLY_MAXIMUM_HERO_DISTANCE,
+                                                         config.REJECTION_EARLY_MAXIMUM_EVENTS_PER_FRAME)
+        return statistics.get_rejection_reason(config.REJECTION_MINIMUM_HERO_MEAN_SPEED,
+                                               config.REJECTION_MINIMUM_EVENTS_PER_FRAME)
+
+    def save_metadata(**kwargs):
+        with open(os.path.join(where_to_save, SEQUENCE_METADATA_FILE_NAME), "w", encoding="utf-8") as metadata_file:
+            json.dump({"weather": weather_dict, "statistics": statistics.to_dict(), **kwargs}, metadata_file,
+                      indent=4)
+
+    # The live metrics of the capture (see generate_data.py --metrics_path)
+    metrics = MetricsTextFile(metrics_file_path, labels=metrics_labels)
+
+    def collect_sensors_metrics():
+        for a_sensor in sensors:
+            labels = {"sensor": a_sensor.friendly_name}
+            yield "carla_generator_sensor_frames_total", labels, a_sensor.metrics.frames
+            yield "carla_generator_sensor_gaps_total", labels, a_sensor.metrics.gaps
+            yield "carla_generator_bytes_written_total", labels, a_sensor.metrics.bytes_written
+            yield "carla_generator_sensor_queue_full_total", labels, a_sensor.metrics.queue_full
+            if hasattr(a_sensor, "writer"):
+                yield "carla_generator_writer_queue_depth", labels, a_sensor.writer.queue_depth
+            if hasattr(a_sensor, "number_of_events"):
+                yield "carla_generator_dvs_events_total", labels, a_sensor.number_of_events
+        if statistics.get_hero_mean_speed() is not None:
+            yield "carla_generator_hero_mean_speed_m_per_s", {}, statistics.get_hero_mean_speed()
+    metrics.add_collector(collect_sensors_metrics)
+    metrics.set_phase("waiting_traffic_manager")
+    metrics.start()
 
     def ctrl_c(_, __):
         for a_sensor in sensors:
@@ -302,11 +139,13 @@ def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking
         if tm_ready_to_warm_up.is_set():
             break
     dt_ready_to_warm_up.set()
+    metrics.set_phase("warming_up")
     # We wait that carla warms up
     with tqdm(range(warm_up_frames), desc=color_info_string("Warming Up...")) as pbar:
         while True:
             try:
                 world.wait_for_tick(seconds=1).frame
+                metrics.inc("carla_generator_ticks_total")
             except RuntimeError:
                 if tm_ready_to_take_data.is_set():
                     break
@@ -314,14 +153,46 @@ def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking
 
     # We say that we are ready to take data
     dt_ready_to_take_data.set()
-    for _ in tqdm(range(frames_to_take+50), desc=color_info_string("Take Data...")):
-        world.wait_for_tick()
-
-    finish_frame = world.wait_for_tick().frame
-    official_start_frame = finish_frame - 25 - frames_to_take
+    metrics.set_phase("taking_data")
+    statistics.start()
+    rejection_reason = None
+    official_start_frame = None
+    for i in tqdm(range(frames_to_take+50), desc=color_info_string("Take Data...")):
+        world_snapshot = world.wait_for_tick()
+        statistics.update(world_snapshot)
+        metrics.inc("carla_generator_ticks_total")
+        if official_start_frame is None:
+            # Known from the first frame, so the online representations write only the windows that are kept
+            official_start_frame = world_snapshot.frame + 25
+            context.start_frame = official_start_frame
+        if i + 1 == config.REJECTION_EARLY_CHECK_FRAMES:
+            rejection_reason = get_rejection_reason(early=True)
+            if rejection_reason is not None:
+                break
+    if rejection_reason is None:
+        rejection_reason = get_rejection_reason()
+
+    if rejection_reason is not None:
+        # Nothing to check, finalize and write: generate_data.py records it in the manifest and goes on
+        dt_want_to_stop_taking_data.set()
+        print(color_error_string(f"Sequence rejected after {statistics.frames} frames: {rejection_reason}"))
+        metrics.set_phase("rejected")
+        write_sensors_metrics([sensor.metrics for sensor in sensors], os.path.join(where_to_save,
+                                                                                  SEQUENCE_METRICS_FILE_NAME))
+        save_metadata(rejection_reason=rejection_reason)
+        metrics.stop()
+        finished_taking_data_event.set()
+        return
+
+    # 25 frames of margin after the sequence (also when some ticks were not seen by this client)
+    while world.wait_for_tick().frame < official_start_frame + frames_to_take + 25:
+        pass
     dt_want_to_stop_taking_data.set()
+    post_capture_seconds = {}
+    post_capture_start = time.perf_counter()
 
     # Let's wait that all callbacks has been executed
+    metrics.set_phase("waiting_callbacks")
     print(color_info_string("Waiting that all callbacks complete..."))
     for sensor in sensors:
         if sensor.check_result:
@@ -331,21 +202,58 @@ def take_data(carla_egg_path, rpc_port, ego_vehicle_found_event, finished_taking
                     pbar.n = sensor.consecutive_frames
                     if sensor.consecutive_frames > int(sensor.frames_to_take + 0.1*sensor.frames_to_take):
                         break
+    post_capture_seconds["waiting_callbacks"] = time.perf_counter() - post_capture_start
 
-    # We communicate the starting frame to all the sensors
-    for sensor in sensors:
-        sensor.start_frame = official_start_frame
+    def check_a_sensor(a_sensor):
+        start = time.perf_counter()
+        a_starting_time = a_sensor.check_data()
+        a_sensor.metrics.check_seconds = time.perf_counter() - start
+        return a_starting_time
 
-    # Now we check the data, and we get from sensor their first real data time
-    starting_times = []
-    for sensor in sensors:
-        starting_time = sensor.check_data()
-        if starting_time is not None:
-            starting_times.append(starting_time)
+    def finalize_a_sensor(a_sensor, a_starting_time):
+        start = time.perf_counter()
+        a_sensor.finalize(a_starting_time)
+        a_sensor.metrics.finalize_seconds = time.perf_counter() - start
 
-    # We get the minimum starting time, and we put that as the official starting time
-    official_starting_time = min(starting_times)
+    try:
+        # We communicate the starting frame to all the sensors
+        for sensor in sensors:
+            sensor.start_frame = official_start_frame
+
+        # The sensors are independent, so they are checked and finalized at the same time (one thread each), the
+        # only thing they share is the official starting time
+        with ThreadPoolExecutor(max_workers=max(len(sensors), 1), thread_name_prefix="post_capture") as executor:
+            # Now we check the data, and we get from sensor their first real data time
+            metrics.set_phase("checking_data")
+            start = time.perf_counter()
+            starting_times = [starting_time for starting_time in executor.map(check_a_sensor, sensors)
+                              if starting_time is not None]
+            post_capture_seconds["checking_data"] = time.perf_counter() - start
+
+            # We get the minimum starting time, and we put that as the official starting time
+            official_starting_time = min(starting_times)
+            metrics.set_phase("finalizing")
+            start = time.perf_counter()
+            list(executor.map(finalize_a_sensor, sensors, [official_starting_time] * len(sensors)))
+            post_capture_seconds["finalizing"] = time.perf_counter() - start
+    finally:
+        # Also (above all) when a sensor fails its checks, to know if it was the callbacks, the disk or the simulator
+        write_sensors_metrics([sensor.metrics for sensor in sensors], os.path.join(where_to_save,
+                                                                                  SEQUENCE_METRICS_FILE_NAME))
+        print(get_sensors_metrics_table([sensor.metrics for sensor in sensors]))
+        metrics.write()
+
+    # Finally we save what the manifest needs to know about this sequence
+    frame_counts = {}
     for sensor in sensors:
-        sensor.finalize(official_starting_time)
+        frame_counts.update(sensor.get_frame_counts())
+    post_capture_seconds["total"] = time.perf_counter() - post_capture_start
+    for step in post_capture_seconds:
+        metrics.set("carla_generator_post_capture_seconds", post_capture_seconds[step], step=step)
+    print(color_info_string("Post capture: " + ", ".join(f"{step} {post_capture_seconds[step]:.2f} s"
+                                                         for step in post_capture_seconds)))
+    save_metadata(frame_counts=frame_counts, post_capture_seconds=post_capture_seconds)
+    metrics.set_phase("done")
+    metrics.stop()
     finished_taking_data_event.set()
 
@@ -2,52 +2,53 @@
 import random
 
 
-def get_a_random_weather():
-    import carla
-    cloudiness = random.betavariate(alpha=1, beta=4) * 30 # 100
-    precipitation = random.betavariate(alpha=1.5, beta=5) * 20 # 100
-    wind_intensity = random.betavariate(alpha=2, beta=2) * 100
-    sun_altitude_angle = random.uniform(-90, 90)
-    fog_density = random.betavariate(alpha=1, beta=4) * 100
-
-    a_weather = carla.WeatherParameters(
-        cloudiness=cloudiness,                  # 0 is a clear sky, 100 complete overcast (default: 0.0)
-        precipitation=precipitation,            # 0 is no rain at all, 100 a heavy rain (default: 0.0)
-        precipitation_deposits=precipitation,   # 0 means no puddles on the road, 100 means roads completely capped by
-                                                # rain (default: 0.0)
-        wind_intensity=wind_intensity,          # 0 is calm, 100 a strong wind (default: 0.0)
-        sun_azimuth_angle=0.0,                  # 0 is an arbitrary North, 180 its corresponding South (default: 0.0)
-        sun_altitude_angle=sun_altitude_angle,  # 90 is midday, -90 is midnight (default: 0.0)
-        fog_density=fog_density,                # Concentration or thickness of the fog, from 0 to 100 (default: 0.0)
-        fog_distance=0.0, # 15.0                # Distance where the fog starts in meters (default: 0.0)
-        wetness=0.0,                            # Humidity percentages of the road, from 0 to 100 (default: 0.0)
-        fog_falloff=0.0,                        # Density (specific mass) of the fog, from 0 to infinity (default: 0.0)
-        scattering_intensity=0.0,               # Controls how much the light will contribute to volumetric fog.
-                                                # When set to 0, there is no contribution (default: 0.0)
-        mie_scattering_scale=0.0,               # Controls interaction of light with large particles like pollen or air
-                                                # pollution resulting in a hazy sky with halos around the light sources.
-                                                # When set to 0, there is no contribution (default: 0.0)
-        rayleigh_scattering_scale=0.0331        # Controls interaction of light with small particles like air molecules.
-                                                # Dependent on light wavelength, resulting in a blue sky in the day or
-                                                # red sky in the evening (default: 0.0331)
-    )
+def get_a_random_weather_dict(rng=random):
+    """
+    :param rng: random.Random (or the random module) that draws the weather, a seeded one gives always the same weather
+    :return: the keyword arguments of carla.WeatherParameters
+    """
+    cloudiness = rng.betavariate(alpha=1, beta=4) * 30 # 100
+    precipitation = rng.betavariate(alpha=1.5, beta=5) * 20 # 100
+    wind_intensity = rng.betavariate(alpha=2, beta=2) * 100
+    sun_altitude_angle = rng.uniform(-90, 90)
+    fog_density = rng.betavariate(alpha=1, beta=4) * 100
+
     weather_dict = {
-        "cloudiness": cloudiness,
-        "precipitation": precipitation,
-        "precipitation_deposits": precipitation,
-        "wind_intensity": wind_intensity,
-        "sun_azimuth_angle": 0.0,
-        "sun_altitude_angle": sun_altitude_angle,
-        "fog_density": fog_density,
-        "fog_distance": 0.0, # 15.0,
-        "wetness": 0.0,
-        "fog_falloff": 0.0,
-        "scattering_intensity": 0.0,
-        "mie_scattering_scale": 0.0,
-        "rayleigh_scattering_scale": 0.0331,
+        "cloudiness": cloudiness,                   # 0 is a clear sky, 100 complete overcast (default: 0.0)
+        "precipitation": precipitation,             # 0 is no rain at all, 100 a heavy rain (default: 0.0)
+        "precipitation_deposits": precipitation,    # 0 means no puddles on the road, 100 means roads completely capped
+                                                    # by rain (default: 0.0)
+        "wind_intensity": wind_intensity,           # 0 is calm, 100 a strong wind (default: 0.0)
+        "sun_azimuth_angle": 0.0,                   # 0 is an arbitrary North, 180 its corresponding South
+                                                    # (default: 0.0)
+        "sun_altitude_angle": sun_altitude_angle,   # 90 is midday, -90 is midnight (default: 0.0)
+        "fog_density": fog_density,                 # Concentration or thickness of the fog, from 0 to 100
+                                                    # (default: 0.0)
+        "fog_distance": 0.0, # 15.0                 # Distance where the fog starts in meters (default: 0.0)
+        "wetness": 0.0,                             # Humidity percentages of the road, from 0 to 100 (default: 0.0)
+        "fog_falloff": 0.0,                         # Density (specific mass) of the fog, from 0 to infinity
+                                                    # (default: 0.0)
+        "scattering_intensity": 0.0,                # Controls how much the light will contribute to volumetric fog.
+                                                    # When set to 0, there is no contribution (default: 0.0)
+        "mie_scattering_scale": 0.0,                # Controls interaction of light with large particles like pollen
+                                                    # or air pollution resulting in a hazy sky with halos around the
+                                                    # light sources. When set to 0, there is no contribution
+                                                    # (default: 0.0)
+        "rayleigh_scattering_scale": 0.0331,        # Controls interaction of light with small particles like air
+                                                    # molecules. Dependent on light wavelength, resulting in a blue
+                                                    # sky in the day or red sky in the evening (default: 0.0331)
     }
+    return weather_dict
 
-    return a_weather, weather_dict
+
+def get_weather(weather_dict):
+    import carla
+    return carla.WeatherParameters(**weather_dict)
+
+
+def get_a_random_weather():
+    weather_dict = get_a_random_weather_dict()
+    return get_weather(weather_dict), weather_dict
 
 
 def put_elements_in_bins(elements, num_of_bin, min_value, max_value):
@@ -0,0 +1,120 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from ..data_creation.events_representations import get_representation
+from .sequence_readers import get_sequence_locations, open_sequence
+
+
+class CarlaStereoEventsDataset:
+    """
+    Map style dataset (it can be given to a torch.utils.data.DataLoader) with a sample for each disparity frame of each
+    complete sequence of a dataset folder (sequence folders or shards made by pack_dataset.py).
+    The sequences are indexed once in numpy arrays, the events are read lazily (only the window of the sample) with
+    an EventSlicer and each worker process keeps its own LRU caches of open sequences and of decoded disparity frames.
+    """
+
+    def __init__(self, dataset_path: str, delta_t_ms: int = 50, representation_configuration: dict = None,
+                 disparity_cache_size: int = 256, max_open_sequences: int = 16):
+        """
+        :param representation_configuration: configuration of get_representation, if None the samples contain the raw
+                                             events of the window
+        :param disparity_cache_size: how many decoded disparity frames each worker keeps in memory
+        :param max_open_sequences: how many sequences (their h5 files) each worker keeps open
+        """
+        self.dataset_path = dataset_path
+        self.delta_t_ms = delta_t_ms
+        self.representation = None if representation_configuration is None \
+            else get_representation(representation_configuration)
+        self.disparity_cache_size = disparity_cache_size
+        self.max_open_sequences = max_open_sequences
+
+        # (1) Index: one row for each sample
+        self.locations = get_sequence_locations(dataset_path)
+        self.sequences = [location.name for location in self.locations]
+        sequence_indices = []
+        timestamps = []
+        for sequence_index, location in enumerate(self.locations):
+            a_sequence = open_sequence(location)
+            sequence_indices.append(np.full(len(a_sequence), sequence_index, dtype=np.int32))
+            timestamps.append(a_sequence.timestamps)
+            a_sequence.close()
+        self.sample_sequence = np.concatenate(sequence_indices) if len(sequence_indices) > 0 \
+            else np.zeros(0, dtype=np.int32)
+        self.sample_timestamp = np.concatenate(timestamps) if len(timestamps) > 0 else np.zeros(0, dtype=np.int64)
+        # Position of the sample in its sequence (that is also the disparity frame number)
+        first_sample_of_sequence = np.concatenate([[0], np.cumsum([len(t) for t in timestamps])[:-1]]).astype(np.int64) \
+            if len(timestamps) > 0 else np.zeros(0, dtype=np.int64)
+        self.sample_frame = (np.arange(self.sample_sequence.shape[0], dtype=np.int64) -
+                             first_sample_of_sequence[self.sample_sequence]).astype(np.int32)
+
+        self._reset_caches()
+
+    def _reset_caches(self):
+        self._pid = os.getpid()
+        self._open_sequences = OrderedDict()
+        self._disparity_cache = OrderedDict()
+
+    def __getstate__(self):
+        # The open files and the caches are never sent to the workers, each one makes its own
+        state = self.__dict__.copy()
+        state["_open_sequences"] = OrderedDict()
+        state["_disparity_cache"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_caches()
+
+    def __len__(self):
+        return self.sample_sequence.shape[0]
+
+    def _get_sequence(self, sequence_index: int):
+        """
+        :return: (sequence reader, its stereo slicer)
+        """
+        if self._pid != os.getpid():
+            # We are in a forked worker, the h5 handles of the parent cannot be used
+            self._reset_caches()
+        if sequence_index in self._open_sequences:
+            self._open_sequences.move_to_end(sequence_index)
+            return self._open_sequences[sequence_index]
+        a_sequence = open_sequence(self.locations[sequence_index])
+        self._open_sequences[sequence_index] = (a_sequence, a_sequence.get_stereo_slicer(self.delta_t_ms))
+        if len(self._open_sequences) > self.max_open_sequences:
+            old_sequence, old_slicer = self._open_sequences.popitem(last=False)[1]
+            old_slicer.close()
+            old_sequence.close()
+        return self._open_sequences[sequence_index]
+
+    def _get_disparity(self, sequence_index: int, frame: int):
+        key = (sequence_index, frame)
+        if key in self._disparity_cache:
+            self._disparity_cache.move_to_end(key)
+            return self._disparity_cache[key]
+        disparity = self._get_sequence(sequence_index)[0].get_disparity(frame)
+        if self.disparity_cache_size > 0:
+            self._disparity_cache[key] = disparity
+            if len(self._disparity_cache) > self.disparity_cache_size:
+                self._disparity_cache.popitem(last=False)
+        return disparity
+
+    def _to_sample_events(self, events):
+        if self.representation is None:
+            return events
+        return self.representation.convert_batch(events["x"], events["y"], events["p"], events["t"],
+                                                 [0], [events["t"].shape[0]], backend="numpy")[0]
+
+    def __getitem__(self, index: int):
+        sequence_index = int(self.sample_sequence[index])
+        frame = int(self.sample_frame[index])
+        left, right = self._get_sequence(sequence_index)[1][frame]
+        return {
+            "disparity": self._get_disparity(sequence_index, frame),
+            "left": self._to_sample_events(left),
+            "right": self._to_sample_events(right),
+            "timestamp": int(self.sample_timestamp[index]),
+            "sequence": sequence_index,
+            "frame": frame,
+        }
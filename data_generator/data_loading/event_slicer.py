@@ -0,0 +1,120 @@
+import os
+import json
+
+import h5py
+import numpy as np
+
+EVENTS_ARRAYS_NAMES = ["x", "y", "t", "p"]
+NS_IN_A_MS = 1000000
+
+
+class EventSlicer:
+    """
+    Random access to the events of a time window of a left.h5/right.h5 file (t in ns).
+    The file is opened once and ms_to_idx (kept in memory) is used to read only the chunks of x/y/t/p that contain
+    the asked window.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: path of a left.h5/right.h5 file, an open h5py File/Group or a dict of arrays (e.g. memmaps)
+                       with the x, y, t, p and ms_to_idx keys.
+        """
+        self._h5_file = None
+        if isinstance(source, (str, os.PathLike)):
+            self._h5_file = h5py.File(source, "r")
+            source = self._h5_file
+        self.events = {array_name: source[array_name] for array_name in EVENTS_ARRAYS_NAMES}
+        self.ms_to_idx = np.asarray(source["ms_to_idx"][:], dtype=np.int64)
+        self.number_of_events = self.events["t"].shape[0]
+
+    def _ms_to_idx(self, ms: int):
+        if ms < 0:
+            return 0
+        if ms >= self.ms_to_idx.shape[0]:
+            return self.number_of_events
+        return int(self.ms_to_idx[ms])
+
+    def get_indices(self, t_start: int, t_end: int):
+        """
+        :return: (first index, last index + 1) of the events with t in [t_start, t_end)
+        """
+        start, end, _ = self._get_indices_and_times(t_start, t_end)
+        return start, end
+
+    def _get_indices_and_times(self, t_start: int, t_end: int):
+        # ms_to_idx[i] is the first event with t >= i ms, so these two indices contain the window
+        coarse_start = self._ms_to_idx(t_start // NS_IN_A_MS)
+        coarse_end = self._ms_to_idx(-(-t_end // NS_IN_A_MS))
+        t = self.events["t"][coarse_start:coarse_end]
+        start = coarse_start + int(np.searchsorted(t, t_start, side="left"))
+        end = coarse_start + int(np.searchsorted(t, t_end, side="left"))
+        return start, end, t[start - coarse_start:end - coarse_start]
+
+    def get_events(self, t_start: int, t_end: int):
+        """
+        :return: dict with the read only x, y, t, p arrays of the events with t in [t_start, t_end)
+        """
+        start, end, t = self._get_indices_and_times(t_start, t_end)
+        events = {"t": t}
+        for array_name in ["x", "y", "p"]:
+            events[array_name] = self.events[array_name][start:end]
+        for array_name in events:
+            events[array_name] = np.asarray(events[array_name])
+            events[array_name].flags.writeable = False
+        return events
+
+    def close(self):
+        if self._h5_file is not None:
+            self._h5_file.close()
+            self._h5_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StereoEventSlicer:
+    """
+    Left and right events of the delta_t_ms window that ends at each disparity timestamp.
+    """
+
+    def __init__(self, left_source, right_source, timestamps, delta_t_ms: int):
+        self.left = EventSlicer(left_source)
+        self.right = EventSlicer(right_source)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.delta_t = delta_t_ms * NS_IN_A_MS
+
+    @classmethod
+    def from_sequence_folder(cls, sequence_folder_path: str, delta_t_ms: int):
+        with open(os.path.join(sequence_folder_path, "timestamps.json"), "r") as timestamps_file:
+            timestamps = json.load(timestamps_file)
+        return cls(os.path.join(sequence_folder_path, "left.h5"),
+                   os.path.join(sequence_folder_path, "right.h5"),
+                   timestamps, delta_t_ms)
+
+    def __len__(self):
+        return self.timestamps.shape[0]
+
+    def get_window(self, index: int):
+        t_end = int(self.timestamps[index])
+        return t_end - self.delta_t, t_end
+
+    def __getitem__(self, index: int):
+        """
+        :return: (left events, right events) of the window that ends at the index-th disparity frame
+        """
+        t_start, t_end = self.get_window(index)
+        return self.left.get_events(t_start, t_end), self.right.get_events(t_start, t_end)
+
+    def close(self):
+        self.left.close()
+        self.right.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,217 @@
+import os
+import json
+from collections import namedtuple
+
+import cv2
+import h5py
+import numpy as np
+
+from ..manifest import get_complete_sequences
+from .event_slicer import StereoEventSlicer, EVENTS_ARRAYS_NAMES
+
+SHARDS_INDEX_FILE_NAME = "shards_index.json"
+MEMMAP_INDEX_FILE_NAME = "memmap_index.json"
+MEMMAP_HEADER_FILE_NAME = "header.json"
+MEMMAP_DATA_FILE_NAME = "data.bin"
+# Every array of data.bin starts at a multiple of this
+MEMMAP_ALIGNMENT = 64
+
+# Where a sequence is: kind is "folder" (path is the sequence folder), "shard" (path is the shard file) or "memmap"
+# (path is the folder with header.json and data.bin)
+SequenceLocation = namedtuple("SequenceLocation", ["name", "kind", "path"])
+
+
+def get_sequence_locations(dataset_path: str):
+    """
+    :return: the SequenceLocation of every readable sequence of a dataset, that can be a folder of sequence folders,
+             a folder of shards made by pack_dataset.py or a memmap export made by export_memmap.py
+    """
+    memmap_index_path = os.path.join(dataset_path, MEMMAP_INDEX_FILE_NAME)
+    if os.path.isfile(memmap_index_path):
+        with open(memmap_index_path, "r") as memmap_index_file:
+            memmap_index = json.load(memmap_index_file)
+        return [SequenceLocation(name, "memmap", os.path.join(dataset_path, name))
+                for name in sorted(memmap_index["sequences"])]
+    shards_index_path = os.path.join(dataset_path, SHARDS_INDEX_FILE_NAME)
+    if os.path.isfile(shards_index_path):
+        with open(shards_index_path, "r") as shards_index_file:
+            shards_index = json.load(shards_index_file)
+        return [SequenceLocation(name, "shard", os.path.join(dataset_path, shards_index["sequences"][name]["shard"]))
+                for name in sorted(shards_index["sequences"])]
+    return [SequenceLocation(name, "folder", os.path.join(dataset_path, name))
+            for name in get_complete_sequences(dataset_path)]
+
+
+def open_sequence(location: SequenceLocation):
+    if location.kind == "folder":
+        return FolderSequence(location.path)
+    elif location.kind == "shard":
+        return ShardSequence(location.path, location.name)
+    elif location.kind == "memmap":
+        return MemmapSequence(location.path)
+    raise ValueError(f"Unknown sequence location kind [{location.kind}]!")
+
+
+class FolderSequence:
+    """
+    A sequence as written by take_data: disparity/NNNN.png, left.h5, right.h5 and timestamps.json.
+    """
+
+    def __init__(self, sequence_folder_path: str):
+        if not (os.path.isdir(os.path.join(sequence_folder_path, "disparity")) and
+                os.path.isfile(os.path.join(sequence_folder_path, "left.h5")) and
+                os.path.isfile(os.path.join(sequence_folder_path, "right.h5")) and
+                os.path.isfile(os.path.join(sequence_folder_path, "timestamps.json"))):
+            raise Exception(f"The dataset folder path [{sequence_folder_path}] does not contain one of the following"
+                            f" folder/files: disparity, left.h5, right.h5, timestamps.json!")
+        self.path = sequence_folder_path
+        self.name = os.path.basename(os.path.normpath(sequence_folder_path))
+        with open(os.path.join(sequence_folder_path, "timestamps.json"), "r") as timestamps_file:
+            self.timestamps = np.asarray(json.load(timestamps_file), dtype=np.int64)
+
+    def __len__(self):
+        return self.timestamps.shape[0]
+
+    def get_disparity(self, frame: int):
+        disparity = cv2.imread(os.path.join(self.path, "disparity", f"{frame:04d}.png"), cv2.IMREAD_UNCHANGED)
+        if disparity is None:
+            raise FileNotFoundError(f"Disparity frame {frame} of sequence {self.name} is missing!")
+        return disparity
+
+    def get_stereo_slicer(self, delta_t_ms: int):
+        return StereoEventSlicer(os.path.join(self.path, "left.h5"), os.path.join(self.path, "right.h5"),
+                                 self.timestamps, delta_t_ms)
+
+    def close(self):
+        pass
+
+
+class ShardSequence:
+    """
+    A sequence packed by pack_dataset.py in a group of a shard file: the disparity PNGs are concatenated in a single
+    byte array with their offsets, the events are the datasets of the left and right groups.
+    """
+
+    def __init__(self, shard_path: str, name: str):
+        self.path = shard_path
+        self.name = name
+        self._shard_file = h5py.File(shard_path, "r")
+        self._group = self._shard_file[name]
+        self.timestamps = self._group["timestamps"][:]
+        self._disparity_offsets = self._group["disparity_offsets"][:]
+
+    def __len__(self):
+        return self.timestamps.shape[0]
+
+    def get_disparity(self, frame: int):
+        png_bytes = self._group["disparity_png"][self._disparity_offsets[frame]:self._disparity_offsets[frame + 1]]
+        return cv2.imdecode(png_bytes, cv2.IMREAD_UNCHANGED)
+
+    def get_stereo_slicer(self, delta_t_ms: int):
+        return StereoEventSlicer(self._group["left"], self._group["right"], self.timestamps, delta_t_ms)
+
+    def close(self):
+        self._shard_file.close()
+
+
+class MemmapSequence:
+    """
+    A sequence exported by export_memmap.py: all its arrays (uncompressed) are in data.bin, header.json has their
+    dtype, shape and offset. Every array is a read only np.memmap, so the events windows and the disparity frames are
+    views of the page cache (shared by all the processes that read the same sequence).
+    """
+
+    def __init__(self, sequence_folder_path: str):
+        self.path = sequence_folder_path
+        self.name = os.path.basename(os.path.normpath(sequence_folder_path))
+        with open(os.path.join(sequence_folder_path, MEMMAP_HEADER_FILE_NAME), "r") as header_file:
+            self.header = json.load(header_file)
+        data_file_path = os.path.join(sequence_folder_path, MEMMAP_DATA_FILE_NAME)
+        self.arrays = {}
+        for array_name, array_info in self.header["arrays"].items():
+            if int(np.prod(array_info["shape"])) == 0:
+                # np.memmap cannot map 0 bytes
+                self.arrays[array_name] = np.zeros(array_info["shape"], dtype=array_info["dtype"])
+                continue
+            self.arrays[array_name] = np.memmap(data_file_path, dtype=array_info["dtype"], mode="r",
+                                                offset=array_info["offset"], shape=tuple(array_info["shape"]))
+        self.timestamps = np.asarray(self.arrays["timestamps"])
+
+    def __len__(self):
+        return self.timestamps.shape[0]
+
+    def get_disparity(self, frame: int):
+        return self.arrays["disparity"][frame]
+
+    def get_stereo_slicer(self, delta_t_ms: int):
+        return StereoEventSlicer(*[{array_name: self.arrays[f"{side}/{array_name}"]
+                                    for array_name in EVENTS_ARRAYS_NAMES + ["ms_to_idx"]}
+                                   for side in ["left", "right"]], self.timestamps, delta_t_ms)
+
+    def close(self):
+        # The maps are closed when the arrays (and all their views) are garbage collected
+        self.arrays = {}
+
+
+def export_sequence_to_memmap(a_sequence, output_folder_path: str, chunk_size: int = 1 << 22):
+    """
+    Writes all the arrays of an open sequence (of any kind) in output_folder_path/data.bin and their header.
+    The h5 datasets are copied chunk_size elements at a time.
+    """
+    with a_sequence.get_stereo_slicer(delta_t_ms=1) as slicer:
+        arrays = {"timestamps": a_sequence.timestamps}
+        for side, events_slicer in [("left", slicer.left), ("right", slicer.right)]:
+            for array_name in EVENTS_ARRAYS_NAMES:
+                arrays[f"{side}/{array_name}"] = events_slicer.events[array_name]
+            arrays[f"{side}/ms_to_idx"] = events_slicer.ms_to_idx
+        disparities = [a_sequence.get_disparity(frame) for frame in range(len(a_sequence))]
+        arrays["disparity"] = np.stack(disparities) if len(disparities) > 0 else np.zeros((0, 0, 0), dtype=np.uint8)
+
+        header = {"arrays": {}}
+        offset = 0
+        for array_name, array in arrays.items():
+            header["arrays"][array_name] = {"dtype": np.dtype(array.dtype).str, "shape": list(array.shape),
+                                            "offset": offset}
+            size = int(np.prod(array.shape)) * np.dtype(array.dtype).itemsize
+            offset += -(-size // MEMMAP_ALIGNMENT) * MEMMAP_ALIGNMENT
+
+        os.makedirs(output_folder_path, exist_ok=True)
+        with open(os.path.join(output_folder_path, MEMMAP_DATA_FILE_NAME), "wb") as data_file:
+            data_file.truncate(offset)
+            for array_name, array in arrays.items():
+                data_file.seek(header["arrays"][array_name]["offset"])
+                for first in range(0, array.shape[0], chunk_size):
+                    data_file.write(np.ascontiguousarray(array[first:first + chunk_size]).tobytes())
+    # The header is written last, a sequence without it is not readable
+    with open(os.path.join(output_folder_path, MEMMAP_HEADER_FILE_NAME), "w") as header_file:
+        json.dump(header, header_file, indent=4)
+    return len(a_sequence)
+
+
+def pack_sequence(sequence_folder_path: str, shard_file: h5py.File, name: str):
+    """
+    Copies a sequence folder in the name group of an open shard file (the h5 datasets are copied chunk by chunk,
+    without decompressing them).
+    """
+    sequence = FolderSequence(sequence_folder_path)
+    group = shard_file.create_group(name)
+    group.create_dataset("timestamps", data=sequence.timestamps)
+    png_files_bytes = []
+    for frame in range(len(sequence)):
+        with open(os.path.join(sequence_folder_path, "disparity", f"{frame:04d}.png"), "rb") as png_file:
+            png_files_bytes.append(np.frombuffer(png_file.read(), dtype=np.uint8))
+    offsets = np.zeros(len(png_files_bytes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(png_file_bytes) for png_file_bytes in png_files_bytes])
+    group.create_dataset("disparity_png",
+                         data=np.concatenate(png_files_bytes) if len(png_files_bytes) > 0 else np.zeros(0, np.uint8))
+    group.create_dataset("disparity_offsets", data=offsets)
+    for side in ["left", "right"]:
+        with h5py.File(os.path.join(sequence_folder_path, f"{side}.h5"), "r") as events_file:
+            side_group = group.create_group(side)
+            for array_name in events_file:
+                events_file.copy(events_file[array_name], side_group, name=array_name)
+    metadata_path = os.path.join(sequence_folder_path, "metadata.json")
+    if os.path.isfile(metadata_path):
+        with open(metadata_path, "r") as metadata_file:
+            group.attrs["metadata"] = metadata_file.read()
+    return len(sequence)
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+
+from . import config
+from .utils import NutException, color_error_string, color_info_string
+
+
+def get_carla_launch_command(carla_ue4_path: str, rpc_port: int, streaming_port: int, launch_profile: dict,
+                             show_carla_window: bool = False):
+    command_as_list = ["/usr/bin/stdbuf",
+                       "-o0",
+                       carla_ue4_path,
+                       "-nosound",
+                       f"-carla-rpc-port={rpc_port}",
+                       f"-carla-streaming-port={streaming_port}"]
+    if launch_profile.get("quality_level") is not None:
+        command_as_list.append(f"-quality-level={launch_profile['quality_level']}")
+    if launch_profile.get("off_screen", True) and not show_carla_window:
+        command_as_list.append("-RenderOffScreen")
+    command_as_list += launch_profile.get("extra_arguments", [])
+    return command_as_list
+
+
+def read_dataset_metadata(dataset_path: str):
+    dataset_metadata_path = os.path.join(dataset_path, config.DATASET_METADATA_FILE_NAME)
+    if not os.path.isfile(dataset_metadata_path):
+        return {}
+    with open(dataset_metadata_path, "r", encoding="utf-8") as dataset_metadata_file:
+        return json.load(dataset_metadata_file)
+
+
+def update_dataset_metadata(dataset_path: str, new_values: dict):
+    dataset_metadata = read_dataset_metadata(dataset_path)
+    dataset_metadata.update(new_values)
+    dataset_metadata_path = os.path.join(dataset_path, config.DATASET_METADATA_FILE_NAME)
+    with open(dataset_metadata_path + ".tmp", "w", encoding="utf-8") as dataset_metadata_file:
+        json.dump(dataset_metadata, dataset_metadata_file, indent=4)
+    os.replace(dataset_metadata_path + ".tmp", dataset_metadata_path)
+
+
+def get_launch_profile_name(requested_name: str, dataset_path: str):
+    """
+    "auto" means the profile chosen by calibrate_launch_profiles.py for this dataset (or the default one if the
+    dataset was never calibrated).
+    """
+    if requested_name == "auto":
+        requested_name = read_dataset_metadata(dataset_path).get("launch_profile", config.DEFAULT_CARLA_LAUNCH_PROFILE)
+    if requested_name not in config.CARLA_LAUNCH_PROFILES:
+        raise NutException(color_error_string(f"Unknown launch profile [{requested_name}]! Possible profiles: "
+                                              f"{list(config.CARLA_LAUNCH_PROFILES.keys())}"))
+    return requested_name
+
+
+def choose_launch_profile(ticks_per_second: dict, minimum_fidelity: int):
+    """
+    :param ticks_per_second: dict profile name -> measured ticks per second
+    :return: the name of the fastest profile with a fidelity >= minimum_fidelity (None if there isn't any)
+    """
+    good_enough = [name for name in ticks_per_second
+                   if config.CARLA_LAUNCH_PROFILES[name]["fidelity"] >= minimum_fidelity]
+    if len(good_enough) == 0:
+        return None
+    return max(good_enough, key=lambda name: ticks_per_second[name])
+
+
+def measure_ticks_per_second(carla_egg_path, rpc_port, sensors_json, number_of_warm_up_ticks, number_of_ticks,
+                             result):
+    """
+    Spawns the sensors of sensors_json on a vehicle and measures how many synchronous ticks per second the server
+    can do while delivering all the sensors data. Nothing is saved.
+    """
+    sys.path.append(carla_egg_path)
+    try:
+        import carla
+    except:
+        raise Exception(color_error_string(f"Not able to import Carla!"))
+    carla_tick = sensors_json["carla_tick"]
+    client = carla.Client('localhost', rpc_port)
+    client.set_timeout(60.0)
+    world = client.get_world()
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = carla_tick
+    world.apply_settings(settings)
+    bp_lib = world.get_blueprint_library()
+
+    hero = world.spawn_actor(bp_lib.find('vehicle.ford.mustang'), world.get_map().get_spawn_points()[0])
+    last_frames = {}
+    actors = []
+    frames_to_wait = {}
+    for sensor_cfg in sensors_json["sensors"]:
+        blue_print = bp_lib.find(sensor_cfg["blue_print_name"])
+        for attribute_name in sensor_cfg["attributes"]:
+            blue_print.set_attribute(attribute_name, str(sensor_cfg["attributes"][attribute_name]))
+        location = sensor_cfg["location"]
+        transformation = carla.Transform(
+            carla.Location(x=location["x"], y=location["y"], z=location["z"]),
+            carla.Rotation(pitch=location["pitch"], roll=location["roll"], yaw=location["yaw"]))
+        actor = world.spawn_actor(blue_print, transformation, attach_to=hero)
+        friendly_name = sensor_cfg["friendly_name"]
+        last_frames[friendly_name] = 0
+        actor.listen(lambda data, name=friendly_name: last_frames.__setitem__(name, data.frame))
+        actors.append(actor)
+        frames_to_wait[friendly_name] = max(1, int(sensor_cfg["attributes"]["sensor_tick"] / carla_tick))
+
+    try:
+        for _ in range(number_of_warm_up_ticks):
+            world.tick()
+        start = time.time()
+        for _ in range(number_of_ticks):
+            frame = world.tick()
+            # A tick counts only when every sensor has delivered its data of the current sensor_tick period
+            for friendly_name in last_frames:
+                while last_frames[friendly_name] <= frame - frames_to_wait[friendly_name] \
+                        and time.time() - start < 600:
+                    time.sleep(0.0005)
+        result.value = number_of_ticks / (time.time() - start)
+    finally:
+        for actor in actors:
+            actor.stop()
+            actor.destroy()
+        hero.destroy()
+        settings.synchronous_mode = False
+        settings.fixed_delta_seconds = None
+        world.apply_settings(settings)
+    print(color_info_string(f"{result.value:.2f} ticks/s"))
@@ -0,0 +1,192 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+from datetime import datetime
+
+from .utils import color_info_string
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+SEQUENCE_METADATA_FILE_NAME = "metadata.json"
+# Per sensor capture metrics (callback latency, gaps, ...) written by take_data, also when the capture fails
+SEQUENCE_METRICS_FILE_NAME = "metrics.json"
+# The disparity frames are checksummed (all together) when the rig has them, all the top level files always
+DISPARITY_FOLDER_NAME = "disparity"
+
+
+def get_sequence_folder_name(sequence_id: int):
+    return f"{sequence_id:04}"
+
+
+def get_temporary_sequence_folder_name(sequence_id: int):
+    # The dot at the beginning hides the folder to all the readers that list the dataset
+    return f".{sequence_id:04}.tmp"
+
+
+def get_config_hash(sensors_json: dict, town: str, number_of_vehicles: int, number_of_walkers: int):
+    """
+    Hash of everything that changes the content of a sequence (sensor rig + world set up)
+    """
+    configuration = {
+        "sensors_json": sensors_json,
+        "town": town,
+        "number_of_vehicles": number_of_vehicles,
+        "number_of_walkers": number_of_walkers,
+    }
+    return hashlib.sha1(json.dumps(configuration, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_file_checksum(file_path: str, hasher=None, chunk_size: int = 1 << 20):
+    if hasher is None:
+        hasher = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_folder_checksum(folder_path: str):
+    """
+    A single checksum for all the files in a folder (file names are part of the hash)
+    """
+    hasher = hashlib.sha1()
+    file_names = sorted(os.listdir(folder_path))
+    for file_name in file_names:
+        hasher.update(file_name.encode("utf-8"))
+        get_file_checksum(os.path.join(folder_path, file_name), hasher)
+    return hasher.hexdigest(), len(file_names)
+
+
+def get_complete_sequences(dataset_path: str):
+    """
+    :return: sorted names of the sequence folders of a dataset that can be read (when there is a manifest only the
+             sequences recorded as complete are trusted)
+    """
+    records = DatasetManifest(dataset_path).get_records()
+    sequences = []
+    for a_dir in sorted(os.listdir(dataset_path)):
+        if not a_dir.isdigit():
+            continue
+        if len(records) > 0 and records.get(int(a_dir), {}).get("status") != "complete":
+            continue
+        if not os.path.isfile(os.path.join(dataset_path, a_dir, "timestamps.json")):
+            continue
+        sequences.append(a_dir)
+    return sequences
+
+
+class DatasetManifest:
+    """
+    Append only JSONL file that records the status of every sequence of a dataset.
+    The last record of a sequence is the valid one.
+    """
+
+    def __init__(self, dataset_path: str):
+        self.dataset_path = dataset_path
+        self.manifest_path = os.path.join(dataset_path, MANIFEST_FILE_NAME)
+
+    def append(self, record: dict):
+        record = dict(record)
+        record["time"] = datetime.now().isoformat(timespec="seconds")
+        line = json.dumps(record, sort_keys=True) + "\n"
+        # More than one generation process can write in the same manifest, so we lock it while appending
+        with open(self.manifest_path, "a", encoding="utf-8") as manifest_file:
+            fcntl.flock(manifest_file, fcntl.LOCK_EX)
+            try:
+                manifest_file.write(line)
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+            finally:
+                fcntl.flock(manifest_file, fcntl.LOCK_UN)
+
+    def get_records(self):
+        """
+        :return: dict sequence_id -> last record of that sequence
+        """
+        records = {}
+        if not os.path.isfile(self.manifest_path):
+            return records
+        with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+            for line in manifest_file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A truncated last line (crash while writing), we just ignore it
+                    continue
+                records[int(record["sequence_id"])] = record
+        return records
+
+    def check_sequence(self, sequence_id: int, config_hash: str, record: dict = None):
+        """
+        Cheap check (only os.stat of the top level files, no image is read) of a completed sequence.
+        :return: None if the sequence is complete and valid, otherwise the reason why it has to be requeued
+        """
+        if record is None:
+            record = self.get_records().get(sequence_id)
+        if record is None:
+            return "missing from manifest"
+        if record["status"] not in ["complete", "rejected"]:
+            return f"status is {record['status']}"
+        if record["config_hash"] != config_hash:
+            return "generated with a different configuration"
+        if record["status"] == "rejected":
+            # It was rejected on purpose (see config.REJECTION_*), doing it again will not help
+            return None
+        sequence_path = os.path.join(self.dataset_path, get_sequence_folder_name(sequence_id))
+        if not os.path.isdir(sequence_path):
+            return "sequence folder is missing"
+        if "disparity_sha1" in record and not os.path.isdir(os.path.join(sequence_path, DISPARITY_FOLDER_NAME)):
+            return "disparity folder is missing"
+        for file_name, file_info in record["files"].items():
+            file_path = os.path.join(sequence_path, file_name)
+            if not os.path.isfile(file_path):
+                return f"{file_name} is missing"
+            if os.path.getsize(file_path) != file_info["size"]:
+                return f"{file_name} has a different size"
+        return None
+
+    def commit_sequence(self, sequence_id: int, temporary_path: str, record: dict):
+        """
+        Checksums the data in temporary_path, moves it atomically in the final sequence folder and records it as
+        complete in the manifest.
+        """
+        # The files depend on the sensors of the rig, so all the ones that are there are recorded
+        files = {}
+        for file_name in sorted(os.listdir(temporary_path)):
+            file_path = os.path.join(temporary_path, file_name)
+            if os.path.isfile(file_path):
+                files[file_name] = {"size": os.path.getsize(file_path), "sha1": get_file_checksum(file_path)}
+        disparity_checksum, disparity_frames = None, None
+        if os.path.isdir(os.path.join(temporary_path, DISPARITY_FOLDER_NAME)):
+            disparity_checksum, disparity_frames = get_folder_checksum(os.path.join(temporary_path,
+                                                                                    DISPARITY_FOLDER_NAME))
+
+        final_path = os.path.join(self.dataset_path, get_sequence_folder_name(sequence_id))
+        old_path = None
+        if os.path.exists(final_path):
+            # A previous corrupted version of this sequence, we move it away before replacing it
+            old_path = final_path + ".old"
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.rename(final_path, old_path)
+        os.rename(temporary_path, final_path)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+        record = dict(record)
+        record.update({
+            "sequence_id": sequence_id,
+            "status": "complete",
+            "files": files,
+        })
+        if disparity_checksum is not None:
+            record["disparity_sha1"] = disparity_checksum
+            record.setdefault("frame_counts", {})["disparity_files"] = disparity_frames
+        self.append(record)
+        print(color_info_string(f"Sequence {sequence_id} committed in [{final_path}]!"))
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+from . import config
+
+
+def get_metrics_file_path(metrics_path: str, role: str):
+    """
+    :return: the metrics file of a process of this generate_data.py ("generate_data", "take_data", ...)
+    """
+    return os.path.join(metrics_path, f"carla_data_generator_{os.getpid()}_{role}.prom")
+
+
+def _format_labels(labels):
+    if len(labels) == 0:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append(f"{key}=\"{value}\"")
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsTextFile:
+    """
+    Metrics in the Prometheus text format, rewritten (atomically) every update_period seconds by a daemon thread, so
+    that the node_exporter textfile collector can scrape them.
+    The names ending with "_total" are counters and, for each of them, also the rate since the previous update is
+    written as "..._per_second". With file_path None nothing is written (and set/inc cost almost nothing).
+    """
+
+    def __init__(self, file_path, labels=None, update_period: float = config.METRICS_UPDATE_PERIOD):
+        self.file_path = file_path
+        self.labels = labels if labels is not None else {}
+        self.update_period = update_period
+        # (name, sorted labels) -> value
+        self.values = {}
+        self.collectors = []
+        self.phase = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.last_totals = {}
+        self.last_update_time = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def set(self, name: str, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name: str, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_phase(self, phase: str):
+        """
+        carla_generator_phase{phase="..."} is 1 for the current phase and 0 for the previous ones.
+        """
+        with self.lock:
+            if self.phase is not None:
+                self.values[("carla_generator_phase", (("phase", self.phase),))] = 0
+            self.values[("carla_generator_phase", (("phase", phase),))] = 1
+            self.values[("carla_generator_phase_start_time_seconds", ())] = time.time()
+            self.phase = phase
+
+    def add_collector(self, collector):
+        """
+        :param collector: function without arguments that returns the (name, labels dict, value) to write, it is
+        called by the writer thread (so the metrics that already exist somewhere are read only at each update)
+        """
+        self.collectors.append(collector)
+
+    def start(self):
+        if self.file_path is None:
+            return self
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="metrics_exporter", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.update_period):
+            self.write()
+
+    def stop(self, remove_file: bool = False):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if remove_file:
+            try:
+                os.remove(self.file_path)
+            except FileNotFoundError:
+                pass
+        else:
+            self.write()
+
+    def write(self):
+        if self.file_path is None:
+            return
+        with self.write_lock:
+            self._write()
+
+    def _write(self):
+        with self.lock:
+            samples = list(self.values.items())
+        for collector in self.collectors:
+            try:
+                samples += [((name, tuple(sorted(labels.items()))), value) for name, labels, value in collector()]
+            except Exception:
+                # The collectors read objects that other threads are changing, it will go better at the next update
+                continue
+
+        now = time.monotonic()
+        rates = []
+        for key, value in samples:
+            name, labels = key
+            if not name.endswith("_total"):
+                continue
+            if self.last_update_time is not None and key in self.last_totals:
+                rate = (value - self.last_totals[key]) / max(now - self.last_update_time, 1e-9)
+                rates.append(((name[:-len("_total")] + "_per_second", labels), rate))
+            self.last_totals[key] = value
+        self.last_update_time = now
+
+        by_name = {}
+        for (name, labels), value in samples + rates:
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        common_labels = tuple(sorted(self.labels.items()))
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            for labels, value in by_name[name]:
+                value = str(int(value)) if float(value).is_integer() else repr(float(value))
+                lines.append(f"{name}{_format_labels(common_labels + labels)} {value}")
+
+        tmp_file_path = self.file_path + ".tmp"
+        with open(tmp_file_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(tmp_file_path, self.file_path)
@@ -0,0 +1,89 @@
+import os
+import errno
+import fcntl
+import socket
+
+from .utils import NutException, color_error_string, color_info_string
+from . import config
+
+# rpc, streaming, secondary (the multi GPU port that the Carla servers >= 0.9.12 open on rpc + 2 by default) and tm
+PORTS_PER_LEASE = 4
+
+
+def is_port_free(port: int, host: str = "127.0.0.1"):
+    a_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        a_socket.bind((host, port))
+        return True
+    except OSError:
+        return False
+    finally:
+        a_socket.close()
+
+
+class PortLease:
+    """
+    A block of PORTS_PER_LEASE ports (rpc, streaming, secondary, tm) reserved for a single Carla's chain.
+    The reservation is an exclusive lock on a file in config.PORT_LEASE_DIR, so it is released by the OS also if the
+    process that holds it dies.
+    """
+
+    def __init__(self, rpc_port: int, lock_file):
+        self.rpc_port = rpc_port
+        self.streaming_port = rpc_port + 1
+        self.secondary_port = rpc_port + 2
+        self.tm_port = rpc_port + 3
+        self._lock_file = lock_file
+
+    @property
+    def ports(self):
+        """
+        :return: the ports that generate_data.py uses (the secondary one is only kept free for the Carla server)
+        """
+        return self.rpc_port, self.streaming_port, self.tm_port
+
+    @classmethod
+    def acquire(cls, first_rpc_port_to_try: int = None):
+        """
+        Probes the blocks in [config.PORT_RANGE_START, config.PORT_RANGE_END) starting from first_rpc_port_to_try
+        and reserves the first one that is both free and not leased by another process.
+        """
+        os.makedirs(config.PORT_LEASE_DIR, exist_ok=True)
+        range_start = config.PORT_RANGE_START
+        number_of_blocks = (config.PORT_RANGE_END - range_start) // PORTS_PER_LEASE
+        if number_of_blocks <= 0:
+            raise NutException(color_error_string(f"Invalid port range [{range_start}; {config.PORT_RANGE_END})!"))
+        first_block = 0
+        if first_rpc_port_to_try is not None and first_rpc_port_to_try >= range_start:
+            first_block = ((first_rpc_port_to_try - range_start) // PORTS_PER_LEASE) % number_of_blocks
+        for i in range(number_of_blocks):
+            rpc_port = range_start + PORTS_PER_LEASE * ((first_block + i) % number_of_blocks)
+            # Not "w": the file (with the PID of the holder) is emptied only once the lock is ours
+            lock_file = open(os.path.join(config.PORT_LEASE_DIR, f"{rpc_port}.lock"), "a+")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                lock_file.close()
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    # Leased by another process
+                    continue
+                raise
+            if all(is_port_free(port) for port in range(rpc_port, rpc_port + PORTS_PER_LEASE)):
+                lock_file.truncate(0)
+                lock_file.write(f"{os.getpid()}\n")
+                lock_file.flush()
+                print(color_info_string(f"Leased ports rpc={rpc_port} streaming={rpc_port + 1} "
+                                        f"secondary={rpc_port + 2} tm={rpc_port + 3}"))
+                return cls(rpc_port, lock_file)
+            # Someone that doesn't use the leases (or a lingering socket) is there
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        raise NutException(color_error_string(f"No free ports block in [{range_start}; {config.PORT_RANGE_END})!"),
+                           reason="no_free_ports")
+
+    def release(self):
+        if self._lock_file is None:
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
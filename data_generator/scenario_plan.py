@@ -0,0 +1,74 @@
+import os
+import json
+import random
+
+from . import config
+from .utils import NutException, color_error_string
+from .data_creation.weather import get_a_random_weather_dict
+
+SCENARIO_PLAN_FILE_NAME = "scenario_plan.json"
+# The traffic seeds and the hero spawn indices are drawn in [0; MAXIMUM_SEED) (the spawn index is taken modulo the
+# number of spawn points of the town, that is not known without Carla)
+MAXIMUM_SEED = 2 ** 31
+
+
+def make_scenario(plan_seed: int, sequence_id: int, towns, vehicles_range, walkers_range, node: int = 0):
+    """
+    The scenario of a sequence depends only on the plan seed and on the sequence id, so it is the same on every node
+    and at every attempt.
+    :param towns: config.TOWN_DICT keys to choose from
+    :param vehicles_range: (minimum, maximum) number of vehicles (both included), as walkers_range
+    """
+    rng = random.Random(f"{plan_seed}/{sequence_id}")
+    town = rng.choice(list(towns))
+    return {
+        "sequence_id": sequence_id,
+        "node": node,
+        "plan_seed": plan_seed,
+        "town": town,
+        "town_name": config.TOWN_DICT[town],
+        "num_of_vehicle": rng.randint(*vehicles_range),
+        "num_of_walkers": rng.randint(*walkers_range),
+        "traffic_seed": rng.randrange(MAXIMUM_SEED),
+        "hero_spawn_index": rng.randrange(MAXIMUM_SEED),
+        "weather": get_a_random_weather_dict(rng),
+    }
+
+
+def make_scenario_plan(plan_seed: int, sequence_ids, towns, vehicles_range, walkers_range, number_of_nodes: int = 1):
+    """
+    :return: the scenario of each sequence id, the sequences are given to the nodes in round robin
+    """
+    for town in towns:
+        if town not in config.TOWN_DICT:
+            raise NutException(color_error_string(f"Invalid Town Index! [{town}]"))
+    scenarios = {}
+    for i, sequence_id in enumerate(sequence_ids):
+        scenarios[str(sequence_id)] = make_scenario(plan_seed, sequence_id, towns, vehicles_range, walkers_range,
+                                                    node=i % number_of_nodes)
+    return {"plan_seed": plan_seed, "number_of_nodes": number_of_nodes, "towns": list(towns),
+            "vehicles_range": list(vehicles_range), "walkers_range": list(walkers_range), "scenarios": scenarios}
+
+
+def write_scenario_plan(plan: dict, plan_path: str):
+    with open(plan_path + ".tmp", "w", encoding="utf-8") as plan_file:
+        json.dump(plan, plan_file, indent=4)
+    os.replace(plan_path + ".tmp", plan_path)
+
+
+def read_scenario_plan(dataset_path: str):
+    """
+    :return: the scenario plan of a dataset, None if it has no plan
+    """
+    plan_path = os.path.join(dataset_path, SCENARIO_PLAN_FILE_NAME)
+    if not os.path.isfile(plan_path):
+        return None
+    with open(plan_path, "r", encoding="utf-8") as plan_file:
+        return json.load(plan_file)
+
+
+def get_scenario(plan: dict, sequence_id: int):
+    """
+    :return: the scenario of a sequence, None if it is not in the plan
+    """
+    return plan["scenarios"].get(str(sequence_id))
@@ -27,38 +27,64 @@ class NutException(Exception):
     Exception Raised during Carla's StartUp!
     """
 
-    def __init__(self, message):
+    def __init__(self, message, reason="other"):
         self.message = message
+        # Short name of what went wrong, used to count the failures by reason
+        self.reason = reason
         super().__init__(self.message)
 
 
+# LiDAR BEV grid geometry (computed once): the grid is a BEV_SQUARE_SIDE_IN_M square centered on the LiDAR
+MAX_HIST_POINTS = 5
+BEV_HALF_SIDE_IN_M = config.BEV_SQUARE_SIDE_IN_M / 2
+BEV_CELL_SIDE_IN_M_X = config.BEV_SQUARE_SIDE_IN_M / config.BEV_IMAGE_W
+BEV_CELL_SIDE_IN_M_Y = config.BEV_SQUARE_SIDE_IN_M / config.BEV_IMAGE_H
+# Points above the vehicle or on the ground are removed
+LIDAR_MINIMUM_Z = -2.5 + config.MINIMUM_LIDAR_HEIGHT
+LIDAR_MAXIMUM_Z = -2.5 + config.MAXIMUM_LIDAR_HEIGHT
+# Number of points in a cell -> uint8 value of the cell
+BEV_COUNT_TO_UINT8 = (np.arange(MAX_HIST_POINTS + 1) / MAX_HIST_POINTS * 255).astype(np.uint8)
+
+
+def get_bev_cells(lidar):
+    """
+    :param lidar: (N, >=3) numpy, LiDAR point cloud
+    :return: (flat cell index (y * BEV_IMAGE_W + x) of the valid points, mask of the valid points)
+    """
+    lidar = np.asarray(lidar)
+    x = lidar[:, 0].astype(np.float64) + BEV_HALF_SIDE_IN_M
+    y = lidar[:, 1].astype(np.float64) + BEV_HALF_SIDE_IN_M
+    z = lidar[:, 2]
+    valid = (z > LIDAR_MINIMUM_Z) & (z < LIDAR_MAXIMUM_Z) & (x >= 0) & (x <= config.BEV_SQUARE_SIDE_IN_M) & \
+        (y >= 0) & (y <= config.BEV_SQUARE_SIDE_IN_M)
+    # The points on the far border belong to the last cell (as in np.histogramdd)
+    x_cells = np.minimum((x[valid] / BEV_CELL_SIDE_IN_M_X).astype(np.int64), config.BEV_IMAGE_W - 1)
+    y_cells = np.minimum((y[valid] / BEV_CELL_SIDE_IN_M_Y).astype(np.int64), config.BEV_IMAGE_H - 1)
+    # Carla is x front, y right, whereas the image is y front, x right (x height channel, y width channel)
+    return y_cells * config.BEV_IMAGE_W + x_cells, valid
+
+
 def lidar_to_histogram_features(lidar):
     """
-    Convert LiDAR point cloud into 2-bin histogram over a fixed size grid
+    Convert LiDAR point cloud into a 1-bin histogram over a fixed size grid
     :param lidar: (N,3) numpy, LiDAR point cloud
-    :return: (2, H, W) numpy, LiDAR as sparse image
+    :return: (1, H, W) uint8 numpy, LiDAR as sparse image
     """
-    MAX_HIST_POINTS = 5
-
-    def splat_points(point_cloud):
-        # 256 x 256 grid
-        xbins = np.linspace(-config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_IMAGE_W + 1)
-        ybins = np.linspace(-config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_SQUARE_SIDE_IN_M / 2, config.BEV_IMAGE_H + 1)
-        hist = np.histogramdd(point_cloud[:, :2], bins=(xbins, ybins))[0]
-        hist[hist > MAX_HIST_POINTS] = MAX_HIST_POINTS
-        overhead_splat = hist / MAX_HIST_POINTS
-        # The transpose here is an efficient axis swap.
-        # Comes from the fact that carla is x front, y right, whereas the image is y front, x right
-        # (x height channel, y width channel)
-        return overhead_splat.T
-
-    # Remove points above the vehicle
-    lidar = lidar[lidar[..., 2] < -2.5 + config.MAXIMUM_LIDAR_HEIGHT]
-    lidar = lidar[lidar[..., 2] > -2.5 + config.MINIMUM_LIDAR_HEIGHT]
-    features = splat_points(lidar)
-    features = np.stack([features], axis=-1)
-    features = np.transpose(features, (2, 0, 1))
-    features *= 255
-    features = features.astype(np.uint8)
-    return features
+    cells, _ = get_bev_cells(lidar)
+    counts = np.bincount(cells, minlength=config.BEV_IMAGE_H * config.BEV_IMAGE_W)
+    np.minimum(counts, MAX_HIST_POINTS, out=counts)
+    return BEV_COUNT_TO_UINT8[counts].reshape(1, config.BEV_IMAGE_H, config.BEV_IMAGE_W)
+
 
+def lidar_batch_to_histogram_features(lidars):
+    """
+    :param lidars: list of B (N_i,3) numpy, LiDAR point clouds
+    :return: (B, 1, H, W) uint8 numpy, all the sweeps splatted with a single bincount
+    """
+    cells_per_sweep = [get_bev_cells(lidar)[0] for lidar in lidars]
+    sweep_size = config.BEV_IMAGE_H * config.BEV_IMAGE_W
+    cells = np.concatenate([cells + sweep * sweep_size for sweep, cells in enumerate(cells_per_sweep)]) \
+        if len(lidars) > 0 else np.zeros(0, dtype=np.int64)
+    counts = np.bincount(cells, minlength=len(lidars) * sweep_size)
+    np.minimum(counts, MAX_HIST_POINTS, out=counts)
+    return BEV_COUNT_TO_UINT8[counts].reshape(len(lidars), 1, config.BEV_IMAGE_H, config.BEV_IMAGE_W)
@@ -0,0 +1,124 @@
+import os
+import json
+import hashlib
+
+import cv2
+import h5py
+import numpy as np
+
+from .data_loading.event_slicer import EVENTS_ARRAYS_NAMES, NS_IN_A_MS
+
+# Changing the checks changes all the digests, so every sequence is verified again
+VERIFIER_VERSION = 1
+VERIFICATION_CACHE_FILE_NAME = "verification_cache.json"
+VERIFICATION_REPORT_FILE_NAME = "verification_report.json"
+
+
+def get_sequence_digest(sequence_folder_path: str):
+    """
+    Cheap digest (name, size and modification time of every file, nothing is read) that changes when any file of
+    the sequence folder changes.
+    """
+    hasher = hashlib.sha1(f"{VERIFIER_VERSION}".encode("utf-8"))
+    for root, dir_names, file_names in os.walk(sequence_folder_path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_stat = os.stat(os.path.join(root, file_name))
+            hasher.update(f"{os.path.relpath(os.path.join(root, file_name), sequence_folder_path)}:"
+                          f"{file_stat.st_size}:{file_stat.st_mtime_ns};".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def check_events(events_file_path: str, chunk_size: int = 1 << 22):
+    """
+    Checks a left.h5/right.h5 file reading t one chunk at a time.
+    :return: list of the problems found
+    """
+    try:
+        events_file = h5py.File(events_file_path, "r")
+    except OSError as e:
+        return [f"cannot be opened ({e})"]
+    with events_file:
+        missing = [array_name for array_name in EVENTS_ARRAYS_NAMES + ["ms_to_idx"] if array_name not in events_file]
+        if len(missing) > 0:
+            return [f"missing datasets {missing}"]
+        lengths = {array_name: events_file[array_name].shape[0] for array_name in EVENTS_ARRAYS_NAMES}
+        if len(set(lengths.values())) != 1:
+            return [f"events arrays with different lengths {lengths}"]
+        number_of_events = lengths["t"]
+        try:
+            ms_to_idx = events_file["ms_to_idx"][:].astype(np.int64)
+        except OSError as e:
+            return [f"ms_to_idx cannot be read ({e})"]
+        if np.any(np.diff(ms_to_idx) < 0) or (ms_to_idx.shape[0] > 0 and
+                                               (ms_to_idx[0] < 0 or ms_to_idx[-1] > number_of_events)):
+            return ["ms_to_idx is not a non decreasing list of event indices"]
+        ms_start_times = np.arange(ms_to_idx.shape[0], dtype=np.int64) * NS_IN_A_MS
+
+        problems = []
+        previous_t = None
+        t_dataset = events_file["t"]
+        for first in range(0, number_of_events, chunk_size):
+            try:
+                t = t_dataset[first:first + chunk_size].astype(np.int64)
+            except OSError as e:
+                # A truncated file can be opened but its last chunks cannot be read
+                return problems + [f"t cannot be read from the event {first} ({e})"]
+            if np.any(np.diff(t) < 0) or (previous_t is not None and t[0] < previous_t):
+                problems.append("t is not monotonic")
+                break
+            # ms_to_idx[i] must be the first event with t >= i ms: t[ms_to_idx[i]] >= i ms > t[ms_to_idx[i] - 1]
+            in_chunk = (ms_to_idx >= first) & (ms_to_idx < first + t.shape[0])
+            if np.any(t[ms_to_idx[in_chunk] - first] < ms_start_times[in_chunk]):
+                problems.append("ms_to_idx does not match t")
+                break
+            # (the events before the first of a chunk are checked with the previous chunk)
+            before = (ms_to_idx > first) & (ms_to_idx <= first + t.shape[0])
+            if np.any(t[ms_to_idx[before] - 1 - first] >= ms_start_times[before]):
+                problems.append("ms_to_idx does not match t")
+                break
+            previous_t = t[-1]
+        return problems
+
+
+def verify_sequence(sequence_folder_path: str, decode_disparity: bool = False):
+    """
+    :return: list of the problems of a sequence folder (empty if it is good)
+    """
+    problems = []
+    timestamps_path = os.path.join(sequence_folder_path, "timestamps.json")
+    timestamps = None
+    if not os.path.isfile(timestamps_path):
+        problems.append("timestamps.json is missing")
+    else:
+        try:
+            with open(timestamps_path, "r") as timestamps_file:
+                timestamps = np.asarray(json.load(timestamps_file), dtype=np.int64)
+            if np.any(np.diff(timestamps) <= 0):
+                problems.append("timestamps are not increasing")
+        except (ValueError, TypeError) as e:
+            problems.append(f"timestamps.json cannot be read ({e})")
+
+    disparity_path = os.path.join(sequence_folder_path, "disparity")
+    if not os.path.isdir(disparity_path):
+        problems.append("disparity folder is missing")
+    elif timestamps is not None:
+        disparity_files = set(os.listdir(disparity_path))
+        expected_files = {f"{frame:04d}.png" for frame in range(timestamps.shape[0])}
+        if len(expected_files - disparity_files) > 0:
+            problems.append(f"{len(expected_files - disparity_files)} disparity frames are missing")
+        if len(disparity_files - expected_files) > 0:
+            problems.append(f"{len(disparity_files - expected_files)} disparity frames without timestamp")
+        if decode_disparity:
+            broken_frames = [file_name for file_name in sorted(expected_files & disparity_files)
+                             if cv2.imread(os.path.join(disparity_path, file_name), cv2.IMREAD_UNCHANGED) is None]
+            if len(broken_frames) > 0:
+                problems.append(f"{len(broken_frames)} disparity frames cannot be decoded (first: {broken_frames[0]})")
+
+    for side in ["left", "right"]:
+        events_file_path = os.path.join(sequence_folder_path, f"{side}.h5")
+        if not os.path.isfile(events_file_path):
+            problems.append(f"{side}.h5 is missing")
+            continue
+        problems += [f"{side}.h5: {problem}" for problem in check_events(events_file_path)]
+    return problems
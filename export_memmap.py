@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+from time import time
+
+from tqdm import tqdm
+
+from data_generator.utils import color_info_string, color_info_success, color_error_string
+from data_generator.data_loading.sequence_readers import get_sequence_locations, open_sequence, \
+    export_sequence_to_memmap, MEMMAP_INDEX_FILE_NAME, MEMMAP_HEADER_FILE_NAME
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description="Exports the sequences of a dataset (folders or shards) in "
+                                                     "uncompressed binary arrays that are read with np.memmap. "
+                                                     "Re-running it exports only the new sequences.")
+    arg_parser.add_argument(
+        '--dataset_path',
+        required=True,
+        type=str,
+        help='Path of the dataset folder (or of the shards folder)!'
+    )
+    arg_parser.add_argument(
+        '--output_path',
+        required=True,
+        type=str,
+        help='Folder where the exported sequences and their index are written!'
+    )
+    return arg_parser.parse_args()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    if not os.path.isdir(my_args.dataset_path):
+        raise Exception(color_error_string(f"The dataset folder path [{my_args.dataset_path}] does not exist!"))
+    os.makedirs(my_args.output_path, exist_ok=True)
+    my_locations = [location for location in get_sequence_locations(my_args.dataset_path)
+                    if not os.path.isfile(os.path.join(my_args.output_path, location.name, MEMMAP_HEADER_FILE_NAME))]
+    print(color_info_string(f"Exporting {len(my_locations)} sequences in [{my_args.output_path}]"))
+
+    my_start = time()
+    for a_location in tqdm(my_locations, desc=color_info_string("Exporting...")):
+        a_sequence = open_sequence(a_location)
+        try:
+            export_sequence_to_memmap(a_sequence, os.path.join(my_args.output_path, a_location.name))
+        finally:
+            a_sequence.close()
+
+    # The index lists all the exported sequences (also the ones of the previous runs)
+    my_index = {"sequences": sorted(a_dir for a_dir in os.listdir(my_args.output_path)
+                                    if os.path.isfile(os.path.join(my_args.output_path, a_dir,
+                                                                   MEMMAP_HEADER_FILE_NAME)))}
+    my_temporary_index_path = os.path.join(my_args.output_path, f".{MEMMAP_INDEX_FILE_NAME}.tmp")
+    with open(my_temporary_index_path, "w") as index_file:
+        json.dump(my_index, index_file, indent=4)
+    os.replace(my_temporary_index_path, os.path.join(my_args.output_path, MEMMAP_INDEX_FILE_NAME))
+    print(color_info_success(f"Exported {len(my_locations)} sequences in {time() - my_start:.1f} s"))
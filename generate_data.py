@@ -13,6 +13,14 @@ import shutil
 from data_generator.data_creation import take_data
 from data_generator import utils
 from data_generator import config
+from data_generator.ports import PortLease, PORTS_PER_LEASE
+from data_generator.launch_profiles import get_launch_profile_name
+from data_generator.metrics_exporter import MetricsTextFile, get_metrics_file_path
+from data_generator.capacity import plan_capacity
+from data_generator.scenario_plan import make_scenario, read_scenario_plan, get_scenario, MAXIMUM_SEED, \
+    SCENARIO_PLAN_FILE_NAME
+from data_generator.manifest import DatasetManifest, get_config_hash, get_temporary_sequence_folder_name, \
+    SEQUENCE_METADATA_FILE_NAME, SEQUENCE_METRICS_FILE_NAME
 from data_generator.carla_interface import add_carla_to_python_path, \
     launch_carla_server_and_wait_till_its_up, \
     set_up_world_and_wait_till_its_set_up, \
@@ -28,14 +36,9 @@ def get_arguments():
     )
     arg_parser.add_argument(
         '--rpc_port',
-        default=2000,
-        help='Carla RPC port (default: 2000)',
-        type=int
-    )
-    arg_parser.add_argument(
-        '--tm_port',
-        default=8000,
-        help='Traffic Manager port (default: 8000)',
+        default=config.PORT_RANGE_START,
+        help=f'First Carla RPC port to try, the ports are leased from the free ones in '
+             f'[{config.PORT_RANGE_START}; {config.PORT_RANGE_END}) (default: {config.PORT_RANGE_START})',
         type=int
     )
     arg_parser.add_argument(
@@ -89,6 +92,50 @@ def get_arguments():
         default=0,
         type=int
     )
+    arg_parser.add_argument(
+        '--launch_profile',
+        help=f'Carla launch profile, one of {list(config.CARLA_LAUNCH_PROFILES.keys())} or "auto" to use the one '
+             f'chosen by calibrate_launch_profiles.py for the dataset (default: auto)',
+        default="auto",
+        type=str
+    )
+    arg_parser.add_argument(
+        '--resume',
+        help='Skip the sequence if the dataset manifest says that it is already complete!',
+        action='store_true'
+    )
+    arg_parser.add_argument(
+        '--metrics_path',
+        help=f'Folder of the node_exporter textfile collector where the live metrics are written, "none" to not '
+             f'write them (default: {config.METRICS_TEXTFILE_DIR})',
+        default=config.METRICS_TEXTFILE_DIR,
+        type=str
+    )
+    arg_parser.add_argument(
+        '--node_index',
+        help=f'Index of this node in the {SCENARIO_PLAN_FILE_NAME} of the dataset (see plan_scenarios.py), the '
+             f'sequences of the other nodes are skipped (default: all the sequences)',
+        default=None,
+        type=int
+    )
+    arg_parser.add_argument(
+        '--scenario_seed',
+        help=f'Without a {SCENARIO_PLAN_FILE_NAME}, the seed of the weather, traffic and hero spawn point (it is '
+             f'saved in the manifest, give it again to make the same scenario) (default: a random one)',
+        default=None,
+        type=int
+    )
+    arg_parser.add_argument(
+        '--skip_capacity_check',
+        help='Do not check (see plan_capacity.py) that this machine has enough RAM, disk and CPU for the sequence!',
+        action='store_true'
+    )
+    arg_parser.add_argument(
+        '--keep_low_value_sequences',
+        help='Do not reject the sequences where the hero is almost still or the DVS cameras see almost nothing '
+             '(see config.REJECTION_*)',
+        action='store_true'
+    )
     args = arg_parser.parse_args()
     if args.town not in config.TOWN_DICT:
         error = f"Invalid Town Index! [{args.town}]\n" + \
@@ -111,27 +158,54 @@ def kill_all():
     pids_to_be_killed = []
 
 
-def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json):
+def stop_metrics(metrics):
+    # The processes that are not running anymore must not be scraped
+    metrics.stop(remove_file=True)
+    if take_data_metrics_file_path is not None and os.path.isfile(take_data_metrics_file_path):
+        os.remove(take_data_metrics_file_path)
+
+
+def save_failed_attempt_metrics(where_to_save, logs_path, sequence_id, attempt):
+    """
+    The temporary folder of the sequence is cleaned at the next attempt, so the metrics of a failed attempt (the ones
+    that tell if it was the callbacks, the disk or the simulator) are copied in the logs.
+    :return: where they were copied, None if the attempt did not write them
+    """
+    metrics_path = os.path.join(where_to_save, SEQUENCE_METRICS_FILE_NAME)
+    if not os.path.isfile(metrics_path):
+        return None
+    os.makedirs(logs_path, exist_ok=True)
+    failed_metrics_path = os.path.join(logs_path, f"metrics_{sequence_id}_attempt{attempt}.json")
+    shutil.copyfile(metrics_path, failed_metrics_path)
+    return failed_metrics_path
+
+
+def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json, metrics, scenario):
     # (1) LAUNCH CARLA SERVER
+    metrics.set_phase("launching_carla")
     print("Launching Carla Server...")
     carla_server_pid = multiprocessing.Value(c_int)
     carla_was_correctly_started_up = launch_carla_server_and_wait_till_its_up(
         rpc_port=args.rpc_port,
+        streaming_port=args.streaming_port,
         carla_server_pid=carla_server_pid,
         carla_ue4_path=carla_ue4_path,
         logs_path=carla_log_path,
         how_many_seconds_to_wait=100,
         show_carla_window=args.show_carla_window,
+        launch_profile=config.CARLA_LAUNCH_PROFILES[args.launch_profile],
     )
 
     pids_to_be_killed.append(carla_server_pid.value)
 
     if not carla_was_correctly_started_up:
-        raise utils.NutException(utils.color_error_string(f"Carla crashed while starting!"))
+        raise utils.NutException(utils.color_error_string(f"Carla crashed while starting!"),
+                                 reason="carla_start_failed")
 
     print(utils.color_info_string("(1/3)\tCarla Server is UP!"))
 
     # (3) SET UP THE WORLD
+    metrics.set_phase("setting_up_world")
     world_was_correctly_set_up = set_up_world_and_wait_till_its_set_up(
         carla_ip=args.carla_ip,
         rpc_port=args.rpc_port,
@@ -140,11 +214,12 @@ def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json):
     )
 
     if not world_was_correctly_set_up:
-        raise utils.NutException(utils.color_error_string(f"Failed to set up world!"))
+        raise utils.NutException(utils.color_error_string(f"Failed to set up world!"), reason="world_set_up_failed")
 
     print(utils.color_info_string("(2/3)\tWorld was correctly set up!"))
 
     # (4) SET UP TRAFFIC MANAGER
+    metrics.set_phase("setting_up_traffic_manager")
     tm_ready_to_warm_up = multiprocessing.Event()
     tm_ready_to_take_data = multiprocessing.Event()
     dt_ready_to_warm_up = multiprocessing.Event()
@@ -171,19 +246,24 @@ def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json):
         dt_ready_to_take_data=dt_ready_to_take_data,
         dt_want_to_stop_taking_data=dt_want_to_stop_taking_data,
         wait_a_little_bit_before_starting=sensors_json["wait_a_little_bit_before_start_ticking"],
-        warm_up_frames=sensors_json["number_of_warm_up_frames"]
+        warm_up_frames=sensors_json["number_of_warm_up_frames"],
+        traffic_seed=scenario["traffic_seed"],
+        hero_spawn_index=scenario["hero_spawn_index"]
     )
 
     pids_to_be_killed.append(traffic_manager_pid.value)
 
     if not carla_is_ok:
-        raise utils.NutException(utils.color_error_string(f"Carla crashed while setting up Traffic Manager!"))
+        raise utils.NutException(utils.color_error_string(f"Carla crashed while setting up Traffic Manager!"),
+                                 reason="carla_crashed")
     if not traffic_manager_is_ok:
-        raise utils.NutException(utils.color_error_string(f"Traffic Manager Crashed!"))
+        raise utils.NutException(utils.color_error_string(f"Traffic Manager Crashed!"),
+                                 reason="traffic_manager_crashed")
 
     print(utils.color_info_string("(3/3)\tTraffic Manager Set Up properly!"))
 
     # (5) LAUNCH DATA CREATION PROCESS
+    metrics.set_phase("taking_data")
     data_creation_pid = multiprocessing.Value(c_int)
     ego_vehicle_found_event = multiprocessing.Event()
     finished_taking_data_event = multiprocessing.Event()
@@ -194,7 +274,9 @@ def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json):
                                                           dt_ready_to_warm_up, dt_ready_to_take_data,
                                                           dt_want_to_stop_taking_data,
                                                           sensors_json["number_of_warm_up_frames"],
-                                                          sensors_json["number_of_frames_to_take"]
+                                                          sensors_json["number_of_frames_to_take"],
+                                                          take_data_metrics_file_path, metrics.labels,
+                                                          scenario["weather"], not args.keep_low_value_sequences
                                                           ))
     data_creation_process.start()
     data_creation_pid.value = data_creation_process.pid
@@ -205,14 +287,17 @@ def run_all(args, where_to_save, carla_ue4_path, carla_log_path, sensors_json):
     start_time = time.time()
     while True:
         if not psutil.pid_exists(carla_server_pid.value):
-            raise utils.NutException(utils.color_error_string(f"Carla crashed!"))
+            raise utils.NutException(utils.color_error_string(f"Carla crashed!"), reason="carla_crashed")
         if not set_up_traffic_manager_process.is_alive():
-            raise utils.NutException(utils.color_error_string(f"Traffic Manager crashed!"))
+            raise utils.NutException(utils.color_error_string(f"Traffic Manager crashed!"),
+                                     reason="traffic_manager_crashed")
         if not data_creation_process.is_alive():
-            raise utils.NutException(utils.color_error_string(f"Data Creation crashed!"))
+            raise utils.NutException(utils.color_error_string(f"Data Creation crashed!"),
+                                     reason="data_creation_crashed")
         if not ego_vehicle_found_event.is_set() and time.time() - start_time > 10:
             raise utils.NutException(
-                utils.color_error_string(f"Data Creation is not able to find out the Ego Vehicle!"))
+                utils.color_error_string(f"Data Creation is not able to find out the Ego Vehicle!"),
+                reason="ego_vehicle_not_found")
         if finished_taking_data_event.is_set():
             break
 
@@ -237,9 +322,9 @@ if __name__ == "__main__":
 
     # (0) SET UP LOGS AND DATASET FOLDER
     repo_path = pathlib.Path(__file__).parent.resolve()
-    # TODO: Put this log in the data folder!
-    my_carla_log_path = os.path.join(repo_path, "logs", f"carla_server_logs.log")
-    traffic_manager_log_path = os.path.join(repo_path, "logs", f"traffic_manager_logs.log")
+    # The logs paths depend on the leased ports, so they are set at each attempt
+    my_carla_log_path = None
+    traffic_manager_log_path = None
     datasets_folder_path = my_args.dataset_path
 
     if not os.path.isdir(datasets_folder_path):
@@ -248,6 +333,30 @@ if __name__ == "__main__":
         except:
             Exception(utils.color_error_string(f"Unable to create [{datasets_folder_path}] dir!"))
 
+    my_args.launch_profile = get_launch_profile_name(my_args.launch_profile, datasets_folder_path)
+
+    # (0.1) THE SCENARIO (TOWN, TRAFFIC, WEATHER, ...) OF THIS SEQUENCE: FROM THE PLAN OF THE DATASET IF THERE IS ONE
+    my_scenario_plan = read_scenario_plan(datasets_folder_path)
+    if my_scenario_plan is not None:
+        my_scenario = get_scenario(my_scenario_plan, my_args.sequence_id)
+        if my_scenario is None:
+            print(utils.color_error_string(f"Sequence {my_args.sequence_id} is not in the {SCENARIO_PLAN_FILE_NAME} "
+                                           f"of the dataset, skipping it!"))
+            exit(0)
+        if my_args.node_index is not None and my_scenario["node"] != my_args.node_index:
+            print(utils.color_info_string(f"Sequence {my_args.sequence_id} is of the node {my_scenario['node']}, "
+                                          f"skipping it!"))
+            exit(0)
+    else:
+        my_scenario_seed = int(time.time() * 1000) % MAXIMUM_SEED if my_args.scenario_seed is None \
+            else my_args.scenario_seed
+        my_scenario = make_scenario(my_scenario_seed, my_args.sequence_id, [my_args.town],
+                                    (my_args.num_of_vehicle, my_args.num_of_vehicle),
+                                    (my_args.num_of_walkers, my_args.num_of_walkers))
+    my_args.town = my_scenario["town"]
+    my_args.num_of_vehicle = my_scenario["num_of_vehicle"]
+    my_args.num_of_walkers = my_scenario["num_of_walkers"]
+
     # (1) LET'S MAKE A TABLE TO SUMMARIZE ALL THE ARGS VALUES
     a_table_head = ["Argument", "Value"]
     a_table = []
@@ -256,28 +365,124 @@ if __name__ == "__main__":
     print(tabulate(a_table, headers=a_table_head, tablefmt="grid"))
 
     # (2) LET'S TRY TO GET DATA
-    my_where_to_save = None
     with open(os.path.join(repo_path, "sensors.json"), "r") as file:
         sensors_json = json.load(file)
+    manifest = DatasetManifest(datasets_folder_path)
+    config_hash = get_config_hash(sensors_json, config.TOWN_DICT[my_args.town],
+                                  my_args.num_of_vehicle, my_args.num_of_walkers)
+    if my_args.resume:
+        requeue_reason = manifest.check_sequence(my_args.sequence_id, config_hash)
+        if requeue_reason is None:
+            print(utils.color_info_success(f"Sequence {my_args.sequence_id} is already done, skipping it!"))
+            exit(0)
+        print(utils.color_info_string(f"Sequence {my_args.sequence_id} will be generated: {requeue_reason}"))
+    # CHECK THAT THIS MACHINE CAN TAKE THE SEQUENCE BEFORE LAUNCHING CARLA
+    if not my_args.skip_capacity_check:
+        my_estimate, my_problems, _ = plan_capacity(sensors_json, datasets_folder_path)
+        for my_level, my_message in my_problems:
+            print(utils.color_error_string(f"[CAPACITY {my_level.upper()}] {my_message}"))
+        if any(my_level == "error" for my_level, _ in my_problems):
+            # All the next sequences would fail in the same way, so we stop get_data.bash too
+            print(utils.get_a_title("Not enough resources for this sensors.json (see plan_capacity.py)!",
+                                    color="red"))
+            exit(99)
+    # (2.0) LIVE METRICS: THIS PROCESS (PHASE, ATTEMPTS, FAILURES) AND THE DATA CREATION ONE (TICKS, SENSORS, ...)
+    take_data_metrics_file_path = None
+    my_metrics_file_path = None
+    if my_args.metrics_path.lower() != "none":
+        take_data_metrics_file_path = get_metrics_file_path(my_args.metrics_path, "take_data")
+        my_metrics_file_path = get_metrics_file_path(my_args.metrics_path, "generate_data")
+    my_metrics = MetricsTextFile(my_metrics_file_path, labels={"sequence_id": my_args.sequence_id,
+                                                               "dataset": os.path.basename(
+                                                                   os.path.normpath(datasets_folder_path))})
+    my_metrics.set_phase("starting")
+    my_metrics.start()
+    # All the attempts write in a temporary folder that is moved in the final one only when everything went well
+    my_where_to_save = os.path.join(datasets_folder_path, get_temporary_sequence_folder_name(my_args.sequence_id))
+    sequence_is_done = False
+    failed_attempts_metrics = []
     for i in range(config.MAX_NUM_OF_ATTEMPTS):
-        # (2.1) FOR EACH ATTEMPT, CREATE A FOLDER IN THE DATASETS ONE
-        # now = datetime.now()
-        # current_time = now.strftime("%Y_%m_%d__%H_%M_%S")
-        my_where_to_save = os.path.join(datasets_folder_path, f"{my_args.sequence_id:04}")
-        if i > 0:
-            # It's not the first attempt to we need to remove the previous failed data
-            shutil.rmtree(my_where_to_save, ignore_errors=True)
+        # (2.1) FOR EACH ATTEMPT, CREATE A CLEAN TEMPORARY FOLDER IN THE DATASETS ONE
+        shutil.rmtree(my_where_to_save, ignore_errors=True)
         os.mkdir(my_where_to_save)
+        port_lease = None
+        my_metrics.inc("carla_generator_attempts_total")
         try:
             print(utils.get_a_title(f"ATTEMPT [{i + 1}/{config.MAX_NUM_OF_ATTEMPTS}]", color="blue"))
-            # (2.2) LET'S RUN ALL FOR EACH ATTEMPT
-            if run_all(my_args, my_where_to_save, my_carla_ue4_path, my_carla_log_path, sensors_json):
+            # (2.2) LET'S LEASE FREE PORTS, SO THAT RETRIES AND PARALLEL WORKERS NEVER COLLIDE
+            port_lease = PortLease.acquire(my_args.rpc_port)
+            my_args.rpc_port, my_args.streaming_port, my_args.tm_port = port_lease.ports
+            my_carla_log_path = os.path.join(repo_path, "logs", f"carla_server_logs_{my_args.rpc_port}.log")
+            traffic_manager_log_path = os.path.join(repo_path, "logs", f"traffic_manager_logs_{my_args.rpc_port}.log")
+            # (2.3) LET'S RUN ALL FOR EACH ATTEMPT
+            if run_all(my_args, my_where_to_save, my_carla_ue4_path, my_carla_log_path, sensors_json, my_metrics,
+                       my_scenario):
+                # (2.4) LET'S COMMIT THE SEQUENCE IN THE DATASET
+                my_metrics.set_phase("committing")
+                with open(os.path.join(my_where_to_save, SEQUENCE_METADATA_FILE_NAME), "r") as file:
+                    sequence_metadata = json.load(file)
+                if "rejection_reason" in sequence_metadata:
+                    # Another attempt would be as useless, so it is recorded and we go to the next sequence
+                    shutil.rmtree(my_where_to_save, ignore_errors=True)
+                    manifest.append({
+                        "sequence_id": my_args.sequence_id,
+                        "status": "rejected",
+                        "rejection_reason": sequence_metadata["rejection_reason"],
+                        "statistics": sequence_metadata["statistics"],
+                        "config_hash": config_hash,
+                        "town": config.TOWN_DICT[my_args.town],
+                        "weather": sequence_metadata["weather"],
+                        "scenario": my_scenario,
+                        "attempts": i + 1,
+                    })
+                    print(utils.color_error_string(f"Sequence {my_args.sequence_id} rejected: "
+                                                   f"{sequence_metadata['rejection_reason']}"))
+                    sequence_is_done = True
+                    my_metrics.inc("carla_generator_sequences_rejected_total")
+                    break
+                manifest.commit_sequence(my_args.sequence_id, my_where_to_save, {
+                    "config_hash": config_hash,
+                    "town": config.TOWN_DICT[my_args.town],
+                    "weather": sequence_metadata["weather"],
+                    "frame_counts": sequence_metadata["frame_counts"],
+                    "statistics": sequence_metadata["statistics"],
+                    "post_capture_seconds": sequence_metadata["post_capture_seconds"],
+                    "launch_profile": my_args.launch_profile,
+                    "scenario": my_scenario,
+                    "attempts": i + 1,
+                })
+                sequence_is_done = True
+                my_metrics.inc("carla_generator_sequences_committed_total")
                 break
         except utils.NutException as e:
             print(e.message)
-            my_args.rpc_port += 1
+            my_metrics.inc("carla_generator_failures_total", reason=e.reason)
+            if port_lease is not None:
+                # Something could still be listening on these ports, the next attempt starts from the next block
+                my_args.rpc_port = port_lease.rpc_port + PORTS_PER_LEASE
             kill_all()
+            my_failed_metrics_path = save_failed_attempt_metrics(my_where_to_save, os.path.join(repo_path, "logs"),
+                                                                 my_args.sequence_id, i + 1)
+            if my_failed_metrics_path is not None:
+                print(utils.color_info_string(f"The metrics of the failed attempt are in {my_failed_metrics_path}"))
+                failed_attempts_metrics.append(my_failed_metrics_path)
         except KeyboardInterrupt:
             kill_all()
+            stop_metrics(my_metrics)
             print(utils.get_a_title("Bye Bye!", color="yellow"))
             exit(99)
+        finally:
+            if port_lease is not None:
+                port_lease.release()
+    if not sequence_is_done:
+        shutil.rmtree(my_where_to_save, ignore_errors=True)
+        manifest.append({
+            "sequence_id": my_args.sequence_id,
+            "status": "failed",
+            "config_hash": config_hash,
+            "town": config.TOWN_DICT[my_args.town],
+            "scenario": my_scenario,
+            "attempts": config.MAX_NUM_OF_ATTEMPTS,
+            "attempts_metrics": failed_attempts_metrics,
+        })
+    stop_metrics(my_metrics)
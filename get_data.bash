@@ -1,4 +1,7 @@
-current_data=$(date "+%Y_%m_%d__%H_%M_%S")
+# Pass the name of an existing dataset folder to resume it (only missing or corrupted sequences are generated again)
+# and, when the dataset has a scenario_plan.json (see plan_scenarios.py), the index of this node
+current_data=${1:-$(date "+%Y_%m_%d__%H_%M_%S")}
+node_index=${2:-}
 for i in {1..300}
 do
   echo "Sequence: $i [$current_data]"
@@ -8,7 +11,9 @@ do
   --num_of_vehicle 0 \
   --num_of_walkers 0 \
   --dataset_path /media/enrico/Enrico_Datasets/carla_events/"$current_data" \
-  --sequence_id "$i"
+  --sequence_id "$i" \
+  ${node_index:+--node_index "$node_index"} \
+  --resume
   exit_code=$?
   if [ $exit_code -eq 99 ]; then
     exit 0
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+from time import time
+
+import h5py
+from tqdm import tqdm
+
+from data_generator.utils import color_info_string, color_info_success, color_error_string
+from data_generator.manifest import get_complete_sequences
+from data_generator.data_loading.sequence_readers import pack_sequence, SHARDS_INDEX_FILE_NAME
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description="Packs the complete sequence folders of a dataset in a few big "
+                                                     "h5 shards (one group for each sequence) that can be read in "
+                                                     "place of the folders.")
+    arg_parser.add_argument(
+        '--dataset_path',
+        required=True,
+        type=str,
+        help='Path of the dataset folder!'
+    )
+    arg_parser.add_argument(
+        '--output_path',
+        required=True,
+        type=str,
+        help='Folder where the shards and their index are written!'
+    )
+    arg_parser.add_argument(
+        '--shard_size_mb',
+        default=1024,
+        type=int,
+        help='A new shard is started when the current one is bigger than this (default: 1024)'
+    )
+    return arg_parser.parse_args()
+
+
+def get_folder_size(folder_path: str):
+    return sum(os.path.getsize(os.path.join(root, file_name))
+               for root, _, file_names in os.walk(folder_path) for file_name in file_names)
+
+
+def get_shard_file_name(shard_id: int):
+    return f"shard_{shard_id:05}.h5"
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    if not os.path.isdir(my_args.dataset_path):
+        raise Exception(color_error_string(f"The dataset folder path [{my_args.dataset_path}] does not exist!"))
+    if os.path.exists(os.path.join(my_args.output_path, SHARDS_INDEX_FILE_NAME)):
+        raise Exception(color_error_string(f"The output folder [{my_args.output_path}] already contains shards!"))
+    os.makedirs(my_args.output_path, exist_ok=True)
+    my_sequences = get_complete_sequences(my_args.dataset_path)
+    print(color_info_string(f"Packing {len(my_sequences)} sequences in [{my_args.output_path}]"))
+
+    my_start = time()
+    my_index = {"sequences": {}, "shards": []}
+    my_shard_file = None
+    my_shard_size = 0
+
+    def close_shard():
+        my_shard_file.close()
+        # A shard appears with its final name only when it is complete
+        os.replace(os.path.join(my_args.output_path, f".{my_index['shards'][-1]}.tmp"),
+                   os.path.join(my_args.output_path, my_index["shards"][-1]))
+
+    for a_sequence in tqdm(my_sequences, desc=color_info_string("Packing...")):
+        if my_shard_file is None:
+            my_index["shards"].append(get_shard_file_name(len(my_index["shards"])))
+            my_shard_file = h5py.File(os.path.join(my_args.output_path, f".{my_index['shards'][-1]}.tmp"), "w")
+            my_shard_size = 0
+        a_sequence_path = os.path.join(my_args.dataset_path, a_sequence)
+        my_index["sequences"][a_sequence] = {
+            "shard": my_index["shards"][-1],
+            "number_of_frames": pack_sequence(a_sequence_path, my_shard_file, a_sequence),
+        }
+        my_shard_size += get_folder_size(a_sequence_path)
+        if my_shard_size >= my_args.shard_size_mb * 1024 * 1024:
+            close_shard()
+            my_shard_file = None
+    if my_shard_file is not None:
+        close_shard()
+
+    # The index is written last: without it the output folder is not a readable dataset
+    my_temporary_index_path = os.path.join(my_args.output_path, f".{SHARDS_INDEX_FILE_NAME}.tmp")
+    with open(my_temporary_index_path, "w") as index_file:
+        json.dump(my_index, index_file, indent=4)
+    os.replace(my_temporary_index_path, os.path.join(my_args.output_path, SHARDS_INDEX_FILE_NAME))
+    print(color_info_success(f"Packed {len(my_sequences)} sequences in {len(my_index['shards'])} shards"
+                             f" in {time() - my_start:.1f} s"))
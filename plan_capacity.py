@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import pathlib
+
+from data_generator.utils import color_info_string, color_info_success, color_error_string
+from data_generator.capacity import plan_capacity, get_capacity_table
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description="Estimates, for a sequence of a sensors.json rig, the RAM peak, "
+                                                     "the disk footprint, the write bandwidth and the CPU needed by "
+                                                     "the callbacks, from the encoders costs measured by "
+                                                     "benchmarks/bench_encoders.py.")
+    arg_parser.add_argument(
+        '--sensors_json',
+        default=os.path.join(pathlib.Path(__file__).parent.resolve(), "sensors.json"),
+        type=str,
+        help='The sensors.json to plan (default: the one of the repo)'
+    )
+    arg_parser.add_argument(
+        '--dataset_path',
+        default=None,
+        type=str,
+        help='Dataset where the sequences will be saved (for the free disk space and the measured DVS events rate)'
+    )
+    arg_parser.add_argument(
+        '--encoder_costs_path',
+        default=None,
+        type=str,
+        help='Output of python -m benchmarks.bench_encoders (default: benchmarks/encoder_costs.json)'
+    )
+    arg_parser.add_argument(
+        '--ticks_per_second',
+        default=None,
+        type=float,
+        help='Wall clock Carla\'s ticks per second while capturing (default: config.CAPACITY_TICKS_PER_SECOND)'
+    )
+    return arg_parser.parse_args()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    with open(my_args.sensors_json, "r") as file:
+        my_sensors_json = json.load(file)
+    my_estimate, my_problems, my_encoder_costs_source = plan_capacity(my_sensors_json, my_args.dataset_path,
+                                                                      my_args.encoder_costs_path,
+                                                                      my_args.ticks_per_second)
+    print(color_info_string(f"Encoders costs: {my_encoder_costs_source}, "
+                            f"{my_estimate['events_per_pixel_per_frame']:.3f} DVS events per pixel per frame, "
+                            f"{my_estimate['ticks_per_second']:.0f} ticks/s"))
+    print(get_capacity_table(my_estimate))
+    print(f"Capture: {my_estimate['capture_s']:.0f} s, write bandwidth {my_estimate['write_bandwidth'] / 1e6:.1f} MB/s,"
+          f" {my_estimate['post_capture_s']:.1f} s of encoding after the capture")
+    for my_level, my_message in my_problems:
+        print(color_error_string(f"[{my_level.upper()}] {my_message}"))
+    if len(my_problems) == 0:
+        print(color_info_success("This machine can take the sequences of this rig!"))
+    exit(1 if any(my_level == "error" for my_level, _ in my_problems) else 0)
@@ -0,0 +1,99 @@
+import argparse
+import os
+from collections import Counter
+
+from tabulate import tabulate
+
+from data_generator import config
+from data_generator.utils import color_info_success, color_error_string
+from data_generator.scenario_plan import make_scenario_plan, write_scenario_plan, SCENARIO_PLAN_FILE_NAME
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description=f"Precomputes the scenario (town, weather, traffic seed, number "
+                                                     f"of vehicles and walkers, hero spawn point) of every sequence "
+                                                     f"of a dataset in its {SCENARIO_PLAN_FILE_NAME}, and splits the "
+                                                     f"sequences among the nodes. generate_data.py --node_index uses "
+                                                     f"it, so the nodes run without talking to each other and a "
+                                                     f"sequence made again has the same scenario.")
+    arg_parser.add_argument(
+        '--dataset_path',
+        required=True,
+        type=str,
+        help='Dataset folder (shared by all the nodes)'
+    )
+    arg_parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='Seed of the plan (default: 0)'
+    )
+    arg_parser.add_argument(
+        '--first_sequence_id',
+        default=1,
+        type=int,
+        help='First sequence id (default: 1, as get_data.bash)'
+    )
+    arg_parser.add_argument(
+        '--number_of_sequences',
+        default=300,
+        type=int,
+        help='Number of sequences (default: 300, as get_data.bash)'
+    )
+    arg_parser.add_argument(
+        '--number_of_nodes',
+        default=1,
+        type=int,
+        help='Number of nodes that make the dataset (default: 1)'
+    )
+    arg_parser.add_argument(
+        '--towns',
+        default=[10],
+        nargs='+',
+        type=int,
+        help=f'Towns to choose from, keys of {config.TOWN_DICT} (default: 10)'
+    )
+    arg_parser.add_argument(
+        '--num_of_vehicle',
+        default=[0, 30],
+        nargs=2,
+        type=int,
+        help='Minimum and maximum number of vehicles (default: 0 30)'
+    )
+    arg_parser.add_argument(
+        '--num_of_walkers',
+        default=[0, 30],
+        nargs=2,
+        type=int,
+        help='Minimum and maximum number of walkers (default: 0 30)'
+    )
+    arg_parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='Overwrite the plan of the dataset (the sequences already made will not match it anymore)!'
+    )
+    return arg_parser.parse_args()
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    my_plan_path = os.path.join(my_args.dataset_path, SCENARIO_PLAN_FILE_NAME)
+    if os.path.isfile(my_plan_path) and not my_args.overwrite:
+        print(color_error_string(f"{my_plan_path} already exists, use --overwrite to change it!"))
+        exit(1)
+    os.makedirs(my_args.dataset_path, exist_ok=True)
+    my_sequence_ids = range(my_args.first_sequence_id, my_args.first_sequence_id + my_args.number_of_sequences)
+    my_plan = make_scenario_plan(my_args.seed, my_sequence_ids, my_args.towns, my_args.num_of_vehicle,
+                                 my_args.num_of_walkers, my_args.number_of_nodes)
+    write_scenario_plan(my_plan, my_plan_path)
+
+    my_scenarios = list(my_plan["scenarios"].values())
+    my_nodes = Counter(my_scenario["node"] for my_scenario in my_scenarios)
+    my_towns = Counter(my_scenario["town_name"] for my_scenario in my_scenarios)
+    a_table_head = ["Node", "Sequences"]
+    a_table = [[my_node, my_nodes[my_node]] for my_node in sorted(my_nodes)]
+    print(tabulate(a_table, headers=a_table_head, tablefmt="grid"))
+    a_table_head = ["Town", "Sequences"]
+    a_table = [[my_town, my_towns[my_town]] for my_town in sorted(my_towns)]
+    print(tabulate(a_table, headers=a_table_head, tablefmt="grid"))
+    print(color_info_success(f"Saved the plan of {len(my_scenarios)} sequences in {my_plan_path}"))
@@ -0,0 +1,158 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+from time import time
+
+import h5py
+import numpy as np
+from tqdm import tqdm
+
+from data_generator.utils import color_info_string, color_info_success, color_error_string
+from data_generator.data_creation.events_representations import get_representation, REPRESENTATIONS
+from data_generator.data_loading.sequence_readers import get_sequence_locations, open_sequence
+
+
+def get_arguments():
+    repo_path = pathlib.Path(__file__).parent.resolve()
+    with open(os.path.join(repo_path, "sensors.json"), "r") as file:
+        sensors_json = json.load(file)
+    # By default the representations have the resolution of the event cameras of sensors.json
+    event_camera = [sensor for sensor in sensors_json["sensors"] if sensor["blue_print_name"] == "sensor.camera.dvs"][0]
+
+    arg_parser = argparse.ArgumentParser(description="Computes the left/right events representation of every "
+                                                     "disparity frame of every sequence of a dataset. Only the "
+                                                     "sequences without an output file are processed.")
+    arg_parser.add_argument(
+        '--dataset_path',
+        required=True,
+        type=str,
+        help='Path of the dataset folder!'
+    )
+    arg_parser.add_argument(
+        '--representation_type',
+        default="histogram",
+        choices=list(REPRESENTATIONS.keys()),
+        help='Representation to compute (default: histogram)'
+    )
+    arg_parser.add_argument(
+        '--delta_t_ms',
+        default=50,
+        type=int,
+        help='Length of the events window that ends at each disparity frame (default: 50)'
+    )
+    arg_parser.add_argument(
+        '--channels',
+        default=5,
+        type=int,
+        help='Number of time bins of the voxel grid (default: 5)'
+    )
+    arg_parser.add_argument(
+        '--normalize',
+        action='store_true',
+        help='Normalize each representation!'
+    )
+    arg_parser.add_argument(
+        '--train_validation',
+        default="train",
+        choices=["train", "validation"],
+        help='Witch dataset name to use (default: train)'
+    )
+    arg_parser.add_argument(
+        '--height',
+        default=int(event_camera["attributes"]["image_size_y"]),
+        type=int,
+        help=f'Events height (default: {event_camera["attributes"]["image_size_y"]} from sensors.json)'
+    )
+    arg_parser.add_argument(
+        '--width',
+        default=int(event_camera["attributes"]["image_size_x"]),
+        type=int,
+        help=f'Events width (default: {event_camera["attributes"]["image_size_x"]} from sensors.json)'
+    )
+    arg_parser.add_argument(
+        '--num_workers',
+        default=os.cpu_count(),
+        type=int,
+        help=f'Number of processes (default: {os.cpu_count()})'
+    )
+    arg_parser.add_argument(
+        '--batch_size',
+        default=16,
+        type=int,
+        help='Number of windows converted with a single scatter (default: 16)'
+    )
+    return arg_parser.parse_args()
+
+
+def get_sequences_to_process(dataset_path: str, output_folder_path: str):
+    """
+    :return: locations of the complete sequences (folders or shards) that don't have an output file yet
+    """
+    return [location for location in get_sequence_locations(dataset_path)
+            if not os.path.isfile(os.path.join(output_folder_path, f"{location.name}.h5"))]
+
+
+def process_a_sequence(job):
+    sequence_location, output_file_path, configuration, delta_t_ms, batch_size = job
+    start = time()
+    representation = get_representation(configuration)
+    shape = (representation.channels, configuration["height"], configuration["width"])
+    temporary_output_file_path = os.path.join(os.path.dirname(output_file_path),
+                                              f".{os.path.basename(output_file_path)}.tmp")
+    a_sequence = open_sequence(sequence_location)
+    with a_sequence.get_stereo_slicer(delta_t_ms) as slicer, h5py.File(temporary_output_file_path, "w") as output_file:
+        number_of_windows = len(slicer)
+        output_file.create_dataset("timestamps", data=slicer.timestamps)
+        for side, events_slicer in [("left", slicer.left), ("right", slicer.right)]:
+            if number_of_windows == 0:
+                # A sequence shorter than a window, there are no events to read
+                output_file.create_dataset(side, shape=(0, ) + shape, dtype=np.float32)
+                continue
+            dataset = output_file.create_dataset(side, shape=(number_of_windows, ) + shape, dtype=np.float32,
+                                                 chunks=(1, ) + shape, compression="gzip", compression_opts=4)
+            # All the events of the sequence that are needed are read once
+            events = events_slicer.get_events(slicer.get_window(0)[0], slicer.get_window(number_of_windows - 1)[1])
+            window_ends = np.searchsorted(events["t"], slicer.timestamps, side="left")
+            window_starts = np.searchsorted(events["t"], slicer.timestamps - slicer.delta_t, side="left")
+            for first in range(0, number_of_windows, batch_size):
+                last = min(first + batch_size, number_of_windows)
+                dataset[first:last] = representation.convert_batch(events["x"], events["y"], events["p"],
+                                                                   events["t"], window_starts[first:last],
+                                                                   window_ends[first:last], backend="numpy")
+    a_sequence.close()
+    # The output file appears only when it is complete, so an interrupted run is simply done again
+    os.replace(temporary_output_file_path, output_file_path)
+    return sequence_location.name, number_of_windows, time() - start
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    if not os.path.isdir(my_args.dataset_path):
+        raise Exception(color_error_string(f"The dataset folder path [{my_args.dataset_path}] does not exist!"))
+    my_configuration = {
+        "representation_type": my_args.representation_type,
+        "height": my_args.height,
+        "width": my_args.width,
+        "channels": my_args.channels,
+        "normalize": my_args.normalize,
+    }
+    my_dataset_name = get_representation(my_configuration).get_dataset_file_name(my_args.delta_t_ms,
+                                                                                my_args.train_validation)
+    my_output_folder_path = os.path.join(my_args.dataset_path, my_dataset_name)
+    os.makedirs(my_output_folder_path, exist_ok=True)
+    my_sequences = get_sequences_to_process(my_args.dataset_path, my_output_folder_path)
+    print(color_info_string(f"{len(my_sequences)} sequences to process in [{my_output_folder_path}]"))
+
+    my_jobs = [(a_location, os.path.join(my_output_folder_path, f"{a_location.name}.h5"),
+                my_configuration, my_args.delta_t_ms, my_args.batch_size) for a_location in my_sequences]
+    my_start = time()
+    my_number_of_windows = 0
+    with multiprocessing.Pool(max(1, my_args.num_workers)) as pool:
+        for my_sequence, my_windows, _ in tqdm(pool.imap_unordered(process_a_sequence, my_jobs),
+                                               total=len(my_jobs), desc=color_info_string("Precomputing...")):
+            my_number_of_windows += my_windows
+    my_total_time = time() - my_start
+    print(color_info_success(f"Done {my_number_of_windows} windows in {my_total_time:.1f} s"
+                             f" [{my_number_of_windows / max(my_total_time, 1e-9):.1f} windows/s]"))
@@ -1,84 +1,256 @@
 import argparse
-import os.path
+import json
+import multiprocessing
+import os
+import pathlib
+import queue
+import threading
 from time import time
 
 import numpy as np
-import torch
 import cv2
-import h5py
 from tqdm import tqdm
 from data_generator.data_creation.events_representations import Histogram
+from data_generator.data_creation.events_visualizations import histogram_stereo_to_rgb
+from data_generator.data_creation.disparity_visualization import disp_to_rgb
+from data_generator.data_loading.sequence_readers import get_sequence_locations, open_sequence
 
 
 def get_arguments():
-    arg_parser = argparse.ArgumentParser(description=__doc__)
+    repo_path = pathlib.Path(__file__).parent.resolve()
+    with open(os.path.join(repo_path, "sensors.json"), "r") as file:
+        sensors_json = json.load(file)
+    event_camera = [sensor for sensor in sensors_json["sensors"] if sensor["blue_print_name"] == "sensor.camera.dvs"][0]
+
+    arg_parser = argparse.ArgumentParser(description="Shows (or exports in videos) the disparity and the left/right "
+                                                     "events histograms of the sequences of a dataset.")
     arg_parser.add_argument(
         '--path',
         required=True,
         type=str,
         help='Path of the dataset folder to show!'
     )
+    arg_parser.add_argument(
+        '--delta_t_ms',
+        default=50,
+        type=int,
+        help='Length of the events window that ends at each disparity frame (default: 50)'
+    )
+    arg_parser.add_argument(
+        '--height',
+        default=int(event_camera["attributes"]["image_size_y"]),
+        type=int,
+        help=f'Events height (default: {event_camera["attributes"]["image_size_y"]} from sensors.json)'
+    )
+    arg_parser.add_argument(
+        '--width',
+        default=int(event_camera["attributes"]["image_size_x"]),
+        type=int,
+        help=f'Events width (default: {event_camera["attributes"]["image_size_x"]} from sensors.json)'
+    )
+    arg_parser.add_argument(
+        '--fps',
+        default=10.,
+        type=float,
+        help='Frames per second of the viewer and of the videos (default: 10)'
+    )
+    arg_parser.add_argument(
+        '--prefetch',
+        default=32,
+        type=int,
+        help='How many frames the viewer prepares in advance (default: 32)'
+    )
+    arg_parser.add_argument(
+        '--export',
+        default=None,
+        type=str,
+        help='If given, no window is shown and every sequence is rendered in a video in this folder!'
+    )
+    arg_parser.add_argument(
+        '--sequences',
+        nargs="+",
+        default=None,
+        type=int,
+        help='Sequences to export (default: all)'
+    )
+    arg_parser.add_argument(
+        '--num_workers',
+        default=os.cpu_count(),
+        type=int,
+        help=f'Number of processes of the export (default: {os.cpu_count()})'
+    )
+    arg_parser.add_argument(
+        '--batch_size',
+        default=16,
+        type=int,
+        help='Number of frames whose events are read and converted together (default: 16)'
+    )
     return arg_parser.parse_args()
 
-def read_a_sequence(sequence_folder_path: str):
-    if not (os.path.isdir(os.path.join(sequence_folder_path, "disparity")) and
-            os.path.isfile(os.path.join(sequence_folder_path, "left.h5")) and
-            os.path.isfile(os.path.join(sequence_folder_path, "right.h5")) and
-            os.path.isfile(os.path.join(sequence_folder_path, "timestamps.json"))):
-        raise Exception(f"The dataset folder path [{sequence_folder_path}] does not contain one of the following"
-                        f" folder/files: disparity, left.h5, right.h5, timestamps.json!")
-    start = time()
-    with h5py.File(os.path.join(sequence_folder_path, "left.h5"), "r") as h5file:
-        left = h5file["pol"][:]
-        print(left[:200])
 
+def render_a_sequence(sequence_location, delta_t_ms: int, height: int, width: int, batch_size: int,
+                      frames_in_use: int = 1):
+    """
+    Generator of the BGR uint8 frames (disparity | left events | right events) of a sequence, the events of a batch
+    are read and converted at once.
+    The frames are colorized in place in a ring of preallocated frames, so a frame is overwritten batch_size +
+    frames_in_use frames later: frames_in_use is how many frames the caller keeps at the same time.
+    """
+    histogram = Histogram(height=height, width=width, normalize=False)
+    a_sequence = open_sequence(sequence_location)
+    frames = None
+    next_frame = 0
+    try:
+        with a_sequence.get_stereo_slicer(delta_t_ms) as slicer:
+            for first in range(0, len(slicer), batch_size):
+                last = min(first + batch_size, len(slicer))
+                histograms = []
+                for events_slicer in [slicer.left, slicer.right]:
+                    # The events of the whole batch are read once
+                    events = events_slicer.get_events(slicer.get_window(first)[0], slicer.get_window(last - 1)[1])
+                    window_ends = np.searchsorted(events["t"], slicer.timestamps[first:last], side="left")
+                    window_starts = np.searchsorted(events["t"], slicer.timestamps[first:last] - slicer.delta_t,
+                                                    side="left")
+                    histograms.append(histogram.convert_batch(events["x"], events["y"], events["p"], events["t"],
+                                                              window_starts, window_ends))
+                for i, frame_index in enumerate(range(first, last)):
+                    disparity = a_sequence.get_disparity(frame_index)
+                    if frames is None:
+                        # Where nothing is drawn (e.g. below a disparity lower than the events) stays black
+                        frames = np.zeros((batch_size + frames_in_use, max(disparity.shape[0], height),
+                                           disparity.shape[1] + 2 * width, 3), dtype=np.uint8)
+                    frame = frames[next_frame % len(frames)]
+                    next_frame += 1
+                    disp_to_rgb(disparity, frame[:disparity.shape[0], :disparity.shape[1]])
+                    histogram_stereo_to_rgb(histograms[0][i], histograms[1][i],
+                                            frame[:height, disparity.shape[1]:])
+                    yield frame
+    finally:
+        a_sequence.close()
+
+
+def prefetch(frames_generator, maximum_size: int):
+    """
+    Runs frames_generator in a background thread and yields its frames through a bounded queue.
+    """
+    frames_queue = queue.Queue(maxsize=maximum_size)
+    stop = threading.Event()
+    end = object()
+
+    def producer():
+        try:
+            for frame in frames_generator:
+                if stop.is_set():
+                    return
+                frames_queue.put(frame)
+        except Exception as e:
+            frames_queue.put(e)
+        frames_queue.put(end)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = frames_queue.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Frees a producer that is blocked on a full queue
+        while thread.is_alive():
+            try:
+                frames_queue.get_nowait()
+            except queue.Empty:
+                thread.join(0.01)
 
 
+def show_sequences(sequence_locations, args):
     """
-    with h5py.File(os.path.join(sequence_folder_path, "disparity.h5"), "r") as h5file:
-        disparity_dataset = h5file["dataset"][:]
-    with h5py.File(os.path.join(sequence_folder_path, "event_left.h5"), "r") as h5file:
-        left_dataset = h5file["dataset"][:]
-    with h5py.File(os.path.join(sequence_folder_path, "event_right.h5"), "r") as h5file:
-        right_dataset = h5file["dataset"][:]
-    reading_time = time() - start
-    print(f"Reading Time : {reading_time}")
-    print(f"Disparity {disparity_dataset.shape}")
-    print(f"Left {left_dataset.shape}")
-    print(f"Right {right_dataset.shape}")
-    print("Showing images...")
-    histo = Histogram(height=left_dataset.shape[1], width=left_dataset.shape[2], normalize=False)
-    for i in tqdm(range(disparity_dataset.shape[0])):
-        a = disparity_dataset[i, :]/disparity_dataset[i, :].max()
-        a = np.stack((a, a, a), axis=-1)
-        b = histo.to_rgb_mono(torch.from_numpy(left_dataset[i]))
-        c = histo.to_rgb_mono(torch.from_numpy(right_dataset[i]))
-        all = np.concatenate((a, b, c), axis=1)
-        cv2.imshow("Disparity", all)
-        cv2.waitKey(1)
-    cv2.destroyAllWindows()
-    print("Finished to show images!")
+    :return: False if the user asked to stop (q)
     """
+    frame_period = 1. / args.fps
+
+    def all_frames():
+        for a_location in sequence_locations:
+            # The frames in the prefetch queue, the one shown and the one waiting to enter the queue
+            for frame in render_a_sequence(a_location, args.delta_t_ms, args.height, args.width, args.batch_size,
+                                           frames_in_use=args.prefetch + 2):
+                yield a_location.name, frame
+
+    next_frame_time = time()
+    for a_name, a_frame in prefetch(all_frames(), args.prefetch):
+        cv2.imshow("Disparity | Left | Right", a_frame)
+        cv2.setWindowTitle("Disparity | Left | Right", f"Sequence {a_name}")
+        next_frame_time += frame_period
+        if cv2.waitKey(max(1, int((next_frame_time - time()) * 1000))) & 0xFF == ord("q"):
+            return False
+        # When the frames arrive late we don't try to catch up
+        next_frame_time = max(next_frame_time, time())
+    return True
+
+
+def export_a_sequence(job):
+    sequence_location, video_path, args = job
+    start = time()
+    temporary_video_path = os.path.join(os.path.dirname(video_path), f".{os.path.basename(video_path)}.tmp.mp4")
+    video_writer = None
+    number_of_frames = 0
+    for frame in render_a_sequence(sequence_location, args.delta_t_ms, args.height, args.width, args.batch_size):
+        if video_writer is None:
+            video_writer = cv2.VideoWriter(temporary_video_path, cv2.VideoWriter_fourcc(*"mp4v"), args.fps,
+                                           (frame.shape[1], frame.shape[0]))
+        video_writer.write(frame)
+        number_of_frames += 1
+    if video_writer is not None:
+        video_writer.release()
+        os.replace(temporary_video_path, video_path)
+    return sequence_location.name, number_of_frames, time() - start
+
+
+def export_sequences(sequence_locations, args):
+    os.makedirs(args.export, exist_ok=True)
+    jobs = [(a_location, os.path.join(args.export, f"{a_location.name}.mp4"), args)
+            for a_location in sequence_locations]
+    start = time()
+    number_of_frames = 0
+    with multiprocessing.Pool(max(1, min(args.num_workers, len(jobs)))) as pool:
+        for _, frames, _ in tqdm(pool.imap_unordered(export_a_sequence, jobs), total=len(jobs),
+                                 desc="Exporting..."):
+            number_of_frames += frames
+    total_time = time() - start
+    print(f"Exported {number_of_frames} frames of {len(jobs)} sequences in [{args.export}] in {total_time:.1f} s"
+          f" [{number_of_frames / max(total_time, 1e-9):.1f} frames/s]")
+
 
 if __name__ == '__main__':
     def a_test():
         my_args = get_arguments()
         if not (os.path.isdir(my_args.path)):
             raise Exception(f"The dataset folder path [{my_args.path}] does not exist!")
-        sequences = {int(a_dir):a_dir for a_dir in os.listdir(my_args.path)}
+        # Only the committed sequences (from the sequence folders or from the shards index)
+        sequences = {int(location.name): location for location in get_sequence_locations(my_args.path)}
+        if my_args.export is not None:
+            selected = sequences if my_args.sequences is None else \
+                {sequence: sequences[sequence] for sequence in my_args.sequences if sequence in sequences}
+            export_sequences(list(selected.values()), my_args)
+            return
         sequences_min = min(list(sequences.keys()))
         sequences_max = max(list(sequences.keys()))
         while True:
-            selected_sequence = input(f"Please select a sequence in [{sequences_min}; {sequences_max}]: ")
+            selected_sequence = input(f"Please select a sequence in [{sequences_min}; {sequences_max}] or all: ")
             if selected_sequence.lower() == "all":
-                for sequence in sequences:
-                    read_a_sequence(os.path.join(my_args.path, sequences[sequence]))
+                show_sequences(list(sequences.values()), my_args)
+                cv2.destroyAllWindows()
+                continue
             try:
                 selected_sequence = int(selected_sequence)
             except ValueError:
                 continue
             if not selected_sequence in sequences.keys():
                 continue
-            sequence_folder = os.path.join(my_args.path, sequences[selected_sequence])
-            read_a_sequence(sequence_folder)
+            show_sequences([sequences[selected_sequence]], my_args)
+            cv2.destroyAllWindows()
     a_test()
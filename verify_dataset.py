@@ -0,0 +1,126 @@
+import argparse
+import json
+import multiprocessing
+import os
+from datetime import datetime
+from time import time
+
+from tqdm import tqdm
+
+from data_generator.utils import color_info_string, color_info_success, color_error_string
+from data_generator.manifest import DatasetManifest
+from data_generator.verification import verify_sequence, get_sequence_digest, VERIFICATION_CACHE_FILE_NAME, \
+    VERIFICATION_REPORT_FILE_NAME
+
+
+def get_arguments():
+    arg_parser = argparse.ArgumentParser(description="Verifies in parallel every sequence folder of a dataset and "
+                                                     "writes a JSON report of the bad ones. Only the sequences that "
+                                                     "changed since the last run are verified again.")
+    arg_parser.add_argument(
+        '--dataset_path',
+        required=True,
+        type=str,
+        help='Path of the dataset folder!'
+    )
+    arg_parser.add_argument(
+        '--report_path',
+        default=None,
+        type=str,
+        help=f'Where to write the report (default: {VERIFICATION_REPORT_FILE_NAME} in the dataset folder)'
+    )
+    arg_parser.add_argument(
+        '--decode_disparity',
+        action='store_true',
+        help='Also decode every disparity frame (slower)!'
+    )
+    arg_parser.add_argument(
+        '--mark_in_manifest',
+        action='store_true',
+        help='Record the bad sequences as corrupt in the manifest, so generate_data.py --resume makes them again!'
+    )
+    arg_parser.add_argument(
+        '--num_workers',
+        default=os.cpu_count(),
+        type=int,
+        help=f'Number of processes (default: {os.cpu_count()})'
+    )
+    return arg_parser.parse_args()
+
+
+def verify_a_sequence(job):
+    sequence_folder_path, digest, decode_disparity = job
+    return os.path.basename(sequence_folder_path), digest, verify_sequence(sequence_folder_path, decode_disparity)
+
+
+def read_cache(cache_path: str):
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r") as cache_file:
+            return json.load(cache_file)
+    except json.JSONDecodeError:
+        return {}
+
+
+def write_json_atomically(file_path: str, content: dict):
+    temporary_file_path = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.tmp")
+    with open(temporary_file_path, "w") as json_file:
+        json.dump(content, json_file, indent=4)
+    os.replace(temporary_file_path, file_path)
+
+
+if __name__ == "__main__":
+    my_args = get_arguments()
+    if not os.path.isdir(my_args.dataset_path):
+        raise Exception(color_error_string(f"The dataset folder path [{my_args.dataset_path}] does not exist!"))
+    my_report_path = my_args.report_path if my_args.report_path is not None \
+        else os.path.join(my_args.dataset_path, VERIFICATION_REPORT_FILE_NAME)
+    my_cache_path = os.path.join(my_args.dataset_path, VERIFICATION_CACHE_FILE_NAME)
+    my_start = time()
+
+    # (1) Only the sequences with a different digest from the cached one are verified
+    my_cache = read_cache(my_cache_path)
+    my_sequences = sorted(a_dir for a_dir in os.listdir(my_args.dataset_path)
+                          if a_dir.isdigit() and os.path.isdir(os.path.join(my_args.dataset_path, a_dir)))
+    my_jobs = []
+    my_results = {}
+    for a_sequence in my_sequences:
+        a_digest = get_sequence_digest(os.path.join(my_args.dataset_path, a_sequence))
+        a_cached = my_cache.get(a_sequence)
+        # A cached result obtained without decoding the disparity is not enough when decoding is asked
+        if a_cached is not None and a_cached["digest"] == a_digest and \
+                (a_cached["decode_disparity"] or not my_args.decode_disparity):
+            my_results[a_sequence] = a_cached
+        else:
+            my_jobs.append((os.path.join(my_args.dataset_path, a_sequence), a_digest, my_args.decode_disparity))
+    print(color_info_string(f"{len(my_jobs)} sequences to verify ({len(my_results)} unchanged)"))
+
+    # (2) Verification
+    with multiprocessing.Pool(max(1, my_args.num_workers)) as pool:
+        for a_sequence, a_digest, a_problems in tqdm(pool.imap_unordered(verify_a_sequence, my_jobs),
+                                                     total=len(my_jobs), desc=color_info_string("Verifying...")):
+            my_results[a_sequence] = {"digest": a_digest, "decode_disparity": my_args.decode_disparity,
+                                      "problems": a_problems}
+    write_json_atomically(my_cache_path, {a_sequence: my_results[a_sequence] for a_sequence in my_sequences})
+
+    # (3) Report
+    my_bad_sequences = {a_sequence: my_results[a_sequence]["problems"] for a_sequence in my_sequences
+                        if len(my_results[a_sequence]["problems"]) > 0}
+    write_json_atomically(my_report_path, {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "dataset_path": os.path.abspath(my_args.dataset_path),
+        "number_of_sequences": len(my_sequences),
+        "number_of_verified_sequences": len(my_jobs),
+        "bad_sequences": my_bad_sequences,
+    })
+    if my_args.mark_in_manifest:
+        my_manifest = DatasetManifest(my_args.dataset_path)
+        my_records = my_manifest.get_records()
+        for a_sequence, a_problems in my_bad_sequences.items():
+            if my_records.get(int(a_sequence), {}).get("status") != "corrupt":
+                my_manifest.append({"sequence_id": int(a_sequence), "status": "corrupt", "problems": a_problems})
+    for a_sequence, a_problems in my_bad_sequences.items():
+        print(color_error_string(f"{a_sequence}: {'; '.join(a_problems)}"))
+    print(color_info_success(f"{len(my_sequences) - len(my_bad_sequences)}/{len(my_sequences)} good sequences"
+                             f" [{time() - my_start:.1f} s], report in [{my_report_path}]"))